@@ -10,18 +10,39 @@ from the deletion of monomers from a sequence
 defined oligourethane
 '''
 
+import io
+import csv
+import sys
+import json
+import random
+import tempfile
 import itertools
+import asyncio
 import argparse
+import contextlib
 
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from time import time
 from pathlib import Path
 
-from collections import Counter
-from typing import List
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List
 
-from adducts import ADDUCTS
-from monomers import ONE_LETTER_CODE_MASS_PAIRS, THREE_LETTER_CODES
-from utils import SequenceError, print_progress_bar
+import vectorized
+
+from adducts import ADDUCT_TABLE, AdductTable, MzWindow
+from cache import cache_key, open_cache, table_hash
+from outputs import OUTPUT_FORMATS, write_npz, write_sqlite, write_table
+from mzindex import MappedMzIndex, MzIndex, PeakMatch, read_peak_list, write_index
+from fragments import FragmentTable, compile_fragments, fragment_ladders
+from fixedpoint import SCALE, from_micro, micro_range, round_m_over_z, rounding
+from profiling import NULL_PROFILER, StageProfiler, write_report
+from subsequences import SubsequenceAutomaton
+from library import DEFAULT_LIBRARY, Library, load_library
+from monomers import ONE_LETTER_CODE_MASS_PAIRS
+from utils import LRUCache, ProgressReporter, SequenceError
 
 
 __author__ = "James Howard"
@@ -40,6 +61,13 @@ DESCRIPTION = '''
               defined oligourethane
               '''
 
+# Deletions whose masses are kept in memory between the sequences of a
+# batch. Each entry takes about 2 KB with the built-in adducts.
+MASS_CACHE_SIZE = 1 << 16
+
+# Largest number of deletions in a shard written by a worker process
+SHARD_SIZE = 4096
+
 
 def get_args():
     '''
@@ -47,14 +75,45 @@ def get_args():
     '''
     parser = argparse.ArgumentParser(description=DESCRIPTION)
 
-    parser.add_argument('-i',
+    inputs = parser.add_mutually_exclusive_group(required=True)
+
+    inputs.add_argument('-i',
                         '--input',
                         metavar='\b',
                         help='Input sequence of 1-letter codes',
                         action='store',
-                        required=True,
                         dest='input_sequence')
 
+    inputs.add_argument('-b',
+                        '--batch',
+                        metavar='\b',
+                        help='File with one input sequence per line',
+                        action='store',
+                        type=Path,
+                        dest='batch_file')
+
+    inputs.add_argument('--serve',
+                        help='Serve deletion, count and m/z queries as a local HTTP/JSON service',
+                        action='store_true',
+                        dest='serve')
+
+    parser.add_argument('--host',
+                        metavar='\b',
+                        help='Address the service listens on (default 127.0.0.1)',
+                        action='store',
+                        required=False,
+                        default='127.0.0.1',
+                        dest='host')
+
+    parser.add_argument('--port',
+                        metavar='\b',
+                        help='Port the service listens on (default 8000)',
+                        action='store',
+                        required=False,
+                        type=int,
+                        default=8000,
+                        dest='port')
+
     parser.add_argument('-d',
                         '--decimal',
                         metavar='\b',
@@ -65,12 +124,293 @@ def get_args():
                         default=3,
                         dest='decimal_points')
 
+    parser.add_argument('--monomers',
+                        metavar='\b',
+                        help='JSON or CSV monomer library to use instead of monomers.py',
+                        action='store',
+                        required=False,
+                        type=Path,
+                        default=None,
+                        dest='monomer_file')
+
+    parser.add_argument('--adducts',
+                        metavar='\b',
+                        help='JSON or CSV adduct library to use instead of adducts.py',
+                        action='store',
+                        required=False,
+                        type=Path,
+                        default=None,
+                        dest='adduct_file')
+
+    parser.add_argument('--ordered',
+                        help='Also list the distinct ordered deletions of the sequence '
+                             'under each deletion composition',
+                        action='store_true',
+                        required=False,
+                        dest='ordered')
+
+    parser.add_argument('--fragments',
+                        metavar='\b',
+                        help='Write the N- and C-terminal fragment ladders of each ordered '
+                             'deletion for the adducts with these names (+H+ by default). '
+                             'Implies --ordered',
+                        action='store',
+                        required=False,
+                        nargs='*',
+                        default=None,
+                        dest='fragments')
+
+    parser.add_argument('--legacy',
+                        help='Use the original combination and permutation filtering '
+                             'pipeline to enumerate deletions',
+                        action='store_true',
+                        required=False,
+                        dest='legacy')
+
+    parser.add_argument('--backend',
+                        metavar='\b',
+                        help='Mass calculation backend: auto, python or numpy. '
+                             'auto uses NumPy when it is installed',
+                        action='store',
+                        required=False,
+                        choices=['auto', 'python', 'numpy'],
+                        default='auto',
+                        dest='backend')
+
+    parser.add_argument('-q',
+                        '--query',
+                        metavar='\b',
+                        help='Observed m/z values to explain instead of writing '
+                             'the full deletion file',
+                        action='store',
+                        required=False,
+                        nargs='+',
+                        type=float,
+                        default=None,
+                        dest='query')
+
+    parser.add_argument('-p',
+                        '--peaks',
+                        metavar='\b',
+                        help='Peak list of m/z and intensity columns to annotate',
+                        action='store',
+                        required=False,
+                        type=Path,
+                        default=None,
+                        dest='peak_file')
+
+    parser.add_argument('--tolerance',
+                        metavar='\b',
+                        help='Tolerance used to match observed m/z values',
+                        action='store',
+                        required=False,
+                        type=float,
+                        default=10,
+                        dest='tolerance')
+
+    parser.add_argument('--tolerance-unit',
+                        metavar='\b',
+                        help='Unit of the tolerance: ppm or Da',
+                        action='store',
+                        required=False,
+                        choices=['ppm', 'Da'],
+                        default='ppm',
+                        dest='tolerance_unit')
+
+    parser.add_argument('--index-file',
+                        metavar='\b',
+                        help='Memory-mapped m/z index for --query and --peaks, '
+                             'built and saved on first use',
+                        action='store',
+                        required=False,
+                        type=Path,
+                        default=None,
+                        dest='index_file')
+
+    parser.add_argument('-w',
+                        '--workers',
+                        metavar='\b',
+                        help='Number of worker processes used to write deletions',
+                        action='store',
+                        required=False,
+                        type=int,
+                        default=1,
+                        dest='workers')
+
+    parser.add_argument('-f',
+                        '--format',
+                        metavar='\b',
+                        help='Output format: txt, tsv, csv, npz or sqlite',
+                        action='store',
+                        required=False,
+                        choices=OUTPUT_FORMATS,
+                        default='txt',
+                        dest='output_format')
+
+    parser.add_argument('-k',
+                        '--max-deletions',
+                        metavar='\b',
+                        help='Only include deletions missing at most this many monomers',
+                        action='store',
+                        required=False,
+                        type=int,
+                        default=None,
+                        dest='max_deletions')
+
+    parser.add_argument('--min-length',
+                        metavar='\b',
+                        help='Only include deletions with at least this many monomers',
+                        action='store',
+                        required=False,
+                        type=int,
+                        default=0,
+                        dest='min_length')
+
+    parser.add_argument('--state',
+                        metavar='\b',
+                        help='Run state file. When it holds an earlier version of the '
+                             'sequence, only the deletions added and removed since are written',
+                        action='store',
+                        required=False,
+                        type=Path,
+                        default=None,
+                        dest='state_file')
+
+    parser.add_argument('--mz-min',
+                        metavar='\b',
+                        help='Only write adduct lines with at least this m/z',
+                        action='store',
+                        required=False,
+                        type=float,
+                        default=None,
+                        dest='mz_min')
+
+    parser.add_argument('--mz-max',
+                        metavar='\b',
+                        help='Only write adduct lines with at most this m/z',
+                        action='store',
+                        required=False,
+                        type=float,
+                        default=None,
+                        dest='mz_max')
+
+    parser.add_argument('--charges',
+                        metavar='\b',
+                        help='Only write adduct lines with these charges i.e. 1 2 -1',
+                        action='store',
+                        required=False,
+                        nargs='+',
+                        type=int,
+                        default=None,
+                        dest='charges')
+
+    parser.add_argument('--profile',
+                        metavar='\b',
+                        help='Write per-stage timings and memory use as JSON to this file (default profile.json, - for stdout)',
+                        action='store',
+                        required=False,
+                        nargs='?',
+                        const='profile.json',
+                        default=None,
+                        dest='profile')
+
+    parser.add_argument('--estimate',
+                        '--count-only',
+                        help='Report the number of deletions, adduct lines, output size '
+                             'and runtime without writing any deletions',
+                        action='store_true',
+                        required=False,
+                        dest='estimate')
+
+    parser.add_argument('--budget',
+                        metavar='\b',
+                        help='Largest number of unique deletions a sequence may have '
+                             'before it is refused',
+                        action='store',
+                        required=False,
+                        type=int,
+                        default=1_000_000,
+                        dest='budget')
+
+    parser.add_argument('--force',
+                        help='Only warn when a sequence exceeds the budget',
+                        action='store_true',
+                        required=False,
+                        dest='force')
+
+    parser.add_argument('--cache-dir',
+                        metavar='\b',
+                        help='Directory of the persistent cache of deletion files',
+                        action='store',
+                        required=False,
+                        type=Path,
+                        default=None,
+                        dest='cache_dir')
+
+    parser.add_argument('--cache-backend',
+                        metavar='\b',
+                        help='Storage used by the persistent cache: files or sqlite',
+                        action='store',
+                        required=False,
+                        choices=['files', 'sqlite'],
+                        default='files',
+                        dest='cache_backend')
+
+    parser.add_argument('--cache-size',
+                        metavar='\b',
+                        help='Size cap of the persistent cache in megabytes',
+                        action='store',
+                        required=False,
+                        type=float,
+                        default=1024,
+                        dest='cache_size')
+
+    parser.add_argument('--mass-cache-size',
+                        metavar='\b',
+                        help='Number of deletions whose masses and m/z values are kept in memory '
+                             f'between the sequences of a batch (default {MASS_CACHE_SIZE}, '
+                             'about 2 KB each with the built-in adducts)',
+                        action='store',
+                        required=False,
+                        type=int,
+                        default=MASS_CACHE_SIZE,
+                        dest='mass_cache_size')
+
     args = parser.parse_args()
 
+    if args.mass_cache_size < 0:
+        parser.error('--mass-cache-size cannot be negative')
+
+    if args.batch_file is not None and (args.query is not None or args.peak_file is not None):
+        parser.error('--query and --peaks require a single --input sequence')
+
+    if args.index_file is not None and args.query is None and args.peak_file is None:
+        parser.error('--index-file requires --query or --peaks')
+
+    if args.state_file is not None and (args.batch_file is not None or args.legacy
+                                        or args.query is not None or args.peak_file is not None):
+        parser.error('--state requires a single --input sequence and cannot be '
+                     'combined with --legacy, --query or --peaks')
+
+    if args.fragments is not None:
+        args.ordered = True
+        args.fragments = args.fragments or ['+H+']
+
+    if args.ordered and (args.batch_file is not None or args.legacy or args.state_file is not None
+                         or args.query is not None or args.peak_file is not None):
+        parser.error('--ordered requires a single --input sequence and cannot be '
+                     'combined with --legacy, --state, --query or --peaks')
+
+    if args.ordered and args.output_format != 'txt':
+        parser.error('--ordered only supports the txt format')
+
+    if args.estimate and args.ordered:
+        parser.error('--estimate cannot be combined with --ordered or --fragments')
+
     return args
 
 
-def convert_to_one_letter_codes(input_list: list[str]) -> str:
+def convert_to_one_letter_codes(input_list: list[str], library: Library = DEFAULT_LIBRARY) -> str:
     '''
     Converts 3-letter codes to their corresponding 1-letter monomer codes.
 
@@ -80,6 +420,9 @@ def convert_to_one_letter_codes(input_list: list[str]) -> str:
         List of strings representing monomer codes, which may be
         1-letter codes or longer (3-letter) codes.
 
+    library : Library
+        Monomers and their 3-letter codes
+
     Returns
     -------
     str
@@ -98,18 +441,15 @@ def convert_to_one_letter_codes(input_list: list[str]) -> str:
 
             input_string = input_string + monomer
 
-        elif monomer in THREE_LETTER_CODES:
-
-            input_string = input_string + THREE_LETTER_CODES[monomer]
+        elif monomer in library.names:
 
-        # Check if monomer is not in the definitions
-        elif monomer not in THREE_LETTER_CODES:
+            input_string = input_string + library.names[monomer]
 
-            # If all the letters of a monomer are in the unique
-            # letter codes append that to the final string
-            if all([x in ONE_LETTER_CODE_MASS_PAIRS for x in monomer]):
+        # If all the letters of a monomer are in the unique
+        # letter codes append that to the final string
+        elif all([x in library.codes for x in monomer]):
 
-                input_string = input_string + monomer
+            input_string = input_string + monomer
 
         else:
             raise SequenceError('Input sequence not understood')
@@ -117,7 +457,7 @@ def convert_to_one_letter_codes(input_list: list[str]) -> str:
     return input_string
 
 
-def parse_input(input_sequence: str) -> str:
+def parse_input(input_sequence: str, library: Library = DEFAULT_LIBRARY) -> str:
     '''
     Parses user input and converts it into a string of 1-letter monomer codes.
 
@@ -127,6 +467,9 @@ def parse_input(input_sequence: str) -> str:
         String representing the user input, which may be
         1-letter codes or longer (3-letter) codes.
 
+    library : Library
+        Monomers and their 3-letter codes
+
     Returns
     -------
     str
@@ -137,10 +480,10 @@ def parse_input(input_sequence: str) -> str:
     if all([len(monomer) == 1 for monomer in input_list]):
         return ''.join(input_list)
     else:
-        return convert_to_one_letter_codes(input_list)
+        return convert_to_one_letter_codes(input_list, library)
 
 
-def verify_sequence(input_string) -> None:
+def verify_sequence(input_string, library: Library = DEFAULT_LIBRARY) -> None:
     '''
 
     Parameters
@@ -149,13 +492,16 @@ def verify_sequence(input_string) -> None:
         String of urethane monomer 1-letter codes i.e. 'ACCABD'
         where each letter corresponds to a monomer
 
+    library : Library
+        Monomers the sequence may contain
+
     Raises
     ------
     SequenceError
         Invalid sequence
     '''
     for monomer in input_string:
-        if monomer not in ONE_LETTER_CODE_MASS_PAIRS:
+        if monomer not in library.codes:
             raise SequenceError(f'{monomer} monomer not in possible monomers')
     return True
 
@@ -185,204 +531,2292 @@ def generate_deletion_possibilities(sequence: str) -> list[str]:
 
     # Start the progress bar
     total_len = len(sequence)
-    print_progress_bar(0, total=total_len, bar_len=10)
+    progress = ProgressReporter(total_len + 1)
 
     possibilities = []
+    seen = set()
     for monomer in range(total_len + 1):
         for combination in itertools.combinations(sequence, monomer):
-            if combination not in possibilities:
 
-                # Converts the list of tuples to a list of strings
-                possibilities.append(''.join([c for c in combination]))
-        print_progress_bar(monomer, total_len)
+            # Converts the list of tuples to a list of strings
+            subsequence = ''.join(combination)
+            if subsequence not in seen:
+                seen.add(subsequence)
+                possibilities.append(subsequence)
+        progress.update()
+
+    progress.close()
 
     return possibilities
 
 
-def get_mass(sequence) -> float:
+def _monomer_counts(sequence: str) -> tuple[list[str], tuple[int, ...], tuple[int, ...]]:
     '''
-    Calculates the total mass of a sequence of monomer 1-letter codes.
+    Returns the monomers of a sequence in sorted order, their counts and
+    the running totals of the counts used by _bounded_compositions.
+    '''
+    monomer_counts = sorted(Counter(sequence).items())
+    monomers = [monomer for monomer, _ in monomer_counts]
+    counts = tuple(count for _, count in monomer_counts)
+    remaining = tuple(sum(counts[i:]) for i in range(len(counts) + 1))
+    return monomers, counts, remaining
 
-    This function iterates through a sequence and sums the masses of
-    each monomer based on the 1-letter code:mass pairs.
+
+def _bounded_compositions(counts: tuple[int, ...],
+                          size: int,
+                          remaining: tuple[int, ...]) -> Iterator[tuple[int, ...]]:
+    '''
+    Yields every tuple of monomer counts that sums to size where each
+    entry does not exceed the corresponding entry of counts.
 
     Parameters
     ----------
-    sequence : str
-        String of urethane monomer 1-letter codes i.e. 'ACCABD'
-        where each letter corresponds to a monomer
+    counts : tuple[int, ...]
+        Maximum number of each monomer
+
+    size : int
+        Total number of monomers in the composition
+
+    remaining : tuple[int, ...]
+        remaining[i] is the sum of counts[i:], used to skip
+        branches that can no longer reach size
 
     Returns
     -------
-    float
-        The total mass of the sequence.
+    Iterator[tuple[int, ...]]
+        Monomer count tuples in descending lexicographic order
     '''
-    # Starting mass of 0
-    mass = 0
-    for m in sequence:
-        mass += ONE_LETTER_CODE_MASS_PAIRS[m]
-    return float(mass)
+    if not counts:
+        if size == 0:
+            yield ()
+        return
 
+    lower = max(0, size - remaining[1])
+    upper = min(counts[0], size)
 
-def is_permutation(sequence1, sequence2) -> bool:
+    for n in range(upper, lower - 1, -1):
+        for rest in _bounded_compositions(counts[1:], size - n, remaining[1:]):
+            yield (n,) + rest
+
+
+def _compositions_in_range(counts: tuple[int, ...],
+                           masses: list[int],
+                           size: int,
+                           remaining: tuple[int, ...],
+                           mass_range: tuple[float, float],
+                           partial: int = 0) -> Iterator[tuple[int, ...]]:
     '''
-    Determines if a string is a permutation of another string
+    Yields the same tuples as _bounded_compositions, skipping every branch
+    whose completions all have a mass outside mass_range.
+
+    Parameters
+    ----------
+    counts : tuple[int, ...]
+        Maximum number of each monomer
+
+    masses : list[int]
+        Mass of each monomer in micro-daltons
+
+    size : int
+        Total number of monomers in the composition
+
+    remaining : tuple[int, ...]
+        remaining[i] is the sum of counts[i:]
+
+    mass_range : tuple[float, float]
+        Lowest and highest deletion mass to keep in micro-daltons,
+        see fixedpoint.micro_range
+
+    partial : int
+        Mass of the monomers already chosen in micro-daltons
 
     Returns
     -------
-    bool
-        True if the sequences are permutations of eachother
+    Iterator[tuple[int, ...]]
+        Monomer count tuples in descending lexicographic order
     '''
-    if sorted(sequence1) == sorted(sequence2):
-        return True
-    else:
-        return False
+    # Lightest and heaviest monomer among monomers i onwards
+    light = [min(masses[i:], default=0) for i in range(len(masses) + 1)]
+    heavy = [max(masses[i:], default=0) for i in range(len(masses) + 1)]
 
+    # Integer sums are exact, but the adduct masses of the window bounds
+    # are rounded to micro-daltons too, so the bounds are relaxed by one
+    # and the exact m/z values are checked again by apply_window
+    lo, hi = mass_range[0] - 1, mass_range[1] + 1
 
-def find_missing(sequence: str, target: str):
+    def walk(i: int, size: int, partial: int) -> Iterator[tuple[int, ...]]:
+        if partial + size * light[i] > hi or partial + size * heavy[i] < lo:
+            return
+
+        if i == len(counts):
+            if size == 0:
+                yield ()
+            return
+
+        lower = max(0, size - remaining[i + 1])
+        upper = min(counts[i], size)
+
+        for n in range(upper, lower - 1, -1):
+            for rest in walk(i + 1, size - n, partial + n * masses[i]):
+                yield (n,) + rest
+
+    yield from walk(0, size, partial)
+
+
+def generate_compositions(sequence: str,
+                          min_length: int = 0,
+                          mass_range: tuple[float, float] | None = None,
+                          library: Library = DEFAULT_LIBRARY) -> Iterator[str]:
     '''
-    Identifies monomers present in the target sequence that are missing from the provided sequence.
+    Generates each unique deletion of a sequence of 1-letter codes
+    exactly once.
+
+    Rather than walking all 2^n subsequences and removing permutations
+    afterwards, the monomers of the sequence are counted once and each
+    sub-composition is built directly from the Cartesian product of
+    range(count + 1) for every monomer. The product is taken one
+    deletion length at a time so that deletions are yielded from shortest
+    to longest, with their monomers in sorted order. The lengths come in
+    the same order as in the output of filter_identical_sequences, but
+    within a length that output follows the order in which the monomers
+    first appear in the sequence, i.e. '', A, y, B, L for AyyAByL where
+    this yields '', A, B, L, y.
+
+    Example
+    -------
+    For the input sequence 'AyyA', the function will yield:
+    '', 'A', 'y', 'AA', 'Ay', 'yy', 'AAy', 'Ayy', 'AAyy'
 
     Parameters
     ----------
     sequence : str
         String of urethane monomer 1-letter codes i.e. 'ACCABD'
-        where each letter corresponds to a monomer. This sequence
-        is compared against the target sequence.
+        where each letter corresponds to a monomer
 
-    target : str
-        String of urethane monomer 1-letter codes i.e. 'ACCABD'
-        where each letter corresponds to a monomer. This sequence
-        is used as the 'correct' sequence and should contain more
-        monomers than the sequence.
+    min_length : int
+        Shortest deletion to generate. Shorter deletions are never
+        enumerated, so generating only deletions missing at most k
+        monomers costs roughly O(n^k) rather than O(2^n).
+
+    mass_range : tuple[float, float] | None
+        Lowest and highest deletion mass to generate, see
+        MzWindow.mass_range. Branches of the enumeration that can only
+        produce deletions outside the range are pruned.
+
+    library : Library
+        Monomers and their masses, used to prune by mass_range
 
     Returns
     -------
-    dict
-        A dictionary where the keys are 1-letter codes that are
-        missing from the sequence, and the values are the counts
-        of each missing monomer in the target sequence.
+    Iterator[str]
+        Unique deletions of the input sequence
     '''
-    missing = dict(Counter(target) - Counter(sequence))
-    return missing
+    monomers, counts, remaining = _monomer_counts(sequence)
+    masses = [library.micro_masses[index] for index in library.encode(''.join(monomers))]
 
+    for size in range(min_length, len(sequence) + 1):
+        if mass_range is None:
+            compositions = _bounded_compositions(counts, size, remaining)
+        else:
+            compositions = _compositions_in_range(counts, masses, size, remaining, micro_range(mass_range))
 
-def filter_identical_sequences(possibilities, verbose=False) -> List[str]:
+        for composition in compositions:
+            yield ''.join(m * n for m, n in zip(monomers, composition))
+
+
+def composition_shards(sequence: str,
+                       min_length: int = 0,
+                       max_shard_size: int = SHARD_SIZE) -> list[tuple[int, tuple[int, ...]]]:
     '''
+    Splits the deletions of a sequence into independent shards keyed by the
+    deletion length and the counts of the first monomers in sorted order.
+
+    Each length starts as a single shard. A shard holding more than
+    max_shard_size deletions is split by the count of its next monomer,
+    until it is small enough or every monomer count is fixed, so that
+    shards stay small and balanced whatever the counts of the sequence.
+
     Parameters
     ----------
-    possibilities : list
-        list of tuples which represent oligomers in their
-        1-letter code format
+    sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    min_length : int
+        Shortest deletion to include
+
+    max_shard_size : int
+        Largest number of deletions of a shard that is not split further
 
     Returns
     -------
-    possibilities : list
-        list of tuples which represent oligomers in their
-        1-letter code format, removed of permutations
+    list[tuple[int, tuple[int, ...]]]
+        (size, counts of the first monomers) shards in the order that
+        generate_compositions yields their deletions
     '''
-    # Determine max sequence size
-    max_length = len(max(possibilities, key=len)) + 1
+    _, counts, remaining = _monomer_counts(sequence)
 
-    if verbose:
-        print(f"Max sequence length: {max_length}")
+    # sizes[i][s] is the number of compositions of s monomers from monomers i onwards
+    sizes = [_size_counts(counts[i:]) for i in range(len(counts) + 1)]
 
-    print('Assessing deletion similarity\n')
-    print_progress_bar(0, max_length, bar_len=10)
+    def split(size: int, prefix: tuple[int, ...]) -> Iterator[tuple[int, tuple[int, ...]]]:
+        i, rest = len(prefix), size - sum(prefix)
+        if i == len(counts) or sizes[i][rest] <= max_shard_size:
+            yield size, prefix
+            return
 
-    unique = []
+        for n in range(min(counts[i], rest), max(0, rest - remaining[i + 1]) - 1, -1):
+            yield from split(size, prefix + (n,))
+
+    return [shard
+            for size in range(max(0, min_length), len(sequence) + 1)
+            for shard in split(size, ())]
+
+
+def generate_shard(sequence: str,
+                   shard: tuple[int, tuple[int, ...]],
+                   mass_range: tuple[float, float] | None = None,
+                   library: Library = DEFAULT_LIBRARY) -> Iterator[str]:
+    '''
+    Generates the deletions of a single shard from composition_shards.
+
+    Parameters
+    ----------
+    sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
 
-    for size in range(max_length):
+    shard : tuple[int, tuple[int, ...]]
+        (size, counts of the first monomers) of the shard
 
-        # Separate list of possibilities into their respective sizes
-        contending_sequences = [x for x in possibilities if len(x) == size]
+    mass_range : tuple[float, float] | None
+        Lowest and highest deletion mass to generate
 
-        for s in contending_sequences:
-            if sorted(s) not in unique:
-                unique.append(sorted(s))
+    library : Library
+        Monomers and their masses, used to prune by mass_range
 
-        print_progress_bar(size + 1, max_length)
+    Returns
+    -------
+    Iterator[str]
+        Unique deletions of the shard
+    '''
+    size, first_counts = shard
+    monomers, counts, remaining = _monomer_counts(sequence)
+    masses = [library.micro_masses[index] for index in library.encode(''.join(monomers))]
+    fixed = len(first_counts)
+
+    prefix = ''.join(m * n for m, n in zip(monomers, first_counts))
+    if mass_range is None:
+        compositions = _bounded_compositions(counts[fixed:], size - len(prefix), remaining[fixed:])
+    else:
+        compositions = _compositions_in_range(counts[fixed:],
+                                              masses[fixed:],
+                                              size - len(prefix),
+                                              remaining[fixed:],
+                                              micro_range(mass_range),
+                                              partial=sum(n * mass for n, mass in zip(first_counts, masses)))
 
-    return unique
+    for composition in compositions:
+        yield prefix + ''.join(m * n for m, n in zip(monomers[fixed:], composition))
 
 
-def write_adducts(input_sequence: str,
-                  deletions: dict,
-                  decimal_points: int,
-                  outfile: Path) -> None:
+def generate_added_compositions(sequence: str,
+                                previous: str,
+                                min_length: int = 0,
+                                previous_min_length: int = 0) -> Iterator[str]:
     '''
-    Writes the details of the deletions and their adducts to an output file.
+    Generates the deletions of a sequence that are not deletions of a
+    previous version of it, in the order of generate_compositions.
+
+    A deletion of at least previous_min_length monomers is only new if it
+    holds more of some monomer than the previous sequence did, so the
+    enumeration skips every branch whose remaining monomers cannot exceed
+    their previous counts. Extending AyyA to AyyAB only walks the deletions
+    containing B. Swapping the arguments gives the deletions that were
+    removed, such as those containing B when AyyAB is edited back to AyyA.
 
     Parameters
     ----------
-    input_sequence : str
+    sequence : str
         String of urethane monomer 1-letter codes i.e. 'ACCABD'
         where each letter corresponds to a monomer
 
-    deletions : dict
-        A dictionary where keys are deletion sequences (strings) and values are
-        additional information relevant to each deletion.
+    previous : str
+        Earlier version of the sequence
 
-    decimal_points : int
-        The number of decimal points to which the masses will be rounded.
+    min_length : int
+        Shortest deletion of the sequence
 
-    outfile : Path
-        The path to the output file.
-    '''
+    previous_min_length : int
+        Shortest deletion of the previous sequence
 
-    print('Writing to file\n')
+    Returns
+    -------
+    Iterator[str]
+        Deletions of sequence that are not deletions of previous
+    '''
+    monomers, counts, remaining = _monomer_counts(sequence)
+    previous_counts = Counter(previous)
+    limits = [previous_counts[m] for m in monomers]
 
-    # Make progress bar
-    total_len = len(deletions)
-    print_progress_bar(0, total_len, bar_len=10)
+    # exceedable[i] is True if some monomer from i onwards can exceed its previous count
+    exceedable = [any(counts[j] > limits[j] for j in range(i, len(counts)))
+                  for i in range(len(counts) + 1)]
 
-    with open(outfile, 'w', encoding='utf-8') as o:
+    def walk(i: int, size: int, exceeded: bool) -> Iterator[tuple[int, ...]]:
+        if not exceeded and not exceedable[i]:
+            return
 
-        for i, deletion in enumerate(deletions):
-            base_mass = get_mass(deletion)
+        if i == len(counts):
+            if size == 0:
+                yield ()
+            return
 
-            # Write the mass of the parent deletion
-            o.write(f'{"".join([letter + " " for letter in deletion])} :  \
-                      {round(base_mass, decimal_points)}\n')
+        lower = max(0, size - remaining[i + 1])
+        upper = min(counts[i], size)
 
-            # Missing monomer information
-            missing = find_missing(deletion, input_sequence)
-            o.write("Missing ")
-            for missing_monomer, occurences in missing.items():
-                o.write(f'{occurences} {convert_to_multiletter_codes(missing_monomer)} ')
+        for n in range(upper, lower - 1, -1):
+            for rest in walk(i + 1, size - n, exceeded or n > limits[i]):
+                yield (n,) + rest
 
-            o.write("\n")
-            o.write('CHARGE\tTERMINUS\tNAME\t\tM/Z\n')
-            for adduct in ADDUCTS:
-                chrg = int(adduct.charge)
-                terminus = adduct.terminus
-                name = f'{adduct.name:<16}'
-                m_over_z = abs(round((base_mass + adduct.mass) / chrg, decimal_points))
-                o.write(f'{chrg}\t{terminus}\t{name}\t{m_over_z}\n')
+    for size in range(max(0, min_length), len(sequence) + 1):
+        if size < previous_min_length:
+            compositions = _bounded_compositions(counts, size, remaining)
+        else:
+            compositions = walk(0, size, False)
 
-            o.write("\n")
-            print_progress_bar(i + 1, total_len)
+        for composition in compositions:
+            yield ''.join(m * n for m, n in zip(monomers, composition))
 
 
-def convert_to_multiletter_codes(monomer_one_letter):
+def count_added_compositions(sequence: str,
+                             previous: str,
+                             min_length: int = 0,
+                             previous_min_length: int = 0) -> int:
     '''
-    Converts a 1-letter monomer code to its corresponding 3-letter code.
+    Counts the deletions yielded by generate_added_compositions
+    without enumerating them.
+    '''
+    # Deletions of both sequences are the deletions of their common monomers
+    common = ''.join((Counter(sequence) & Counter(previous)).elements())
+    return (count_compositions(sequence, min_length)
+            - count_compositions(common, max(min_length, previous_min_length)))
 
-    This function looks up the provided 1-letter code in a predefined dictionary
-    of three-letter codes and returns the corresponding 3-letter code.
 
-    Parameters
-    ----------
+def get_mass(sequence) -> float:
+    '''
+    Calculates the total mass of a sequence of monomer 1-letter codes.
+
+    This function iterates through a sequence and sums the masses of
+    each monomer based on the 1-letter code:mass pairs.
+
+    Parameters
+    ----------
+    sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    Returns
+    -------
+    float
+        The total mass of the sequence.
+    '''
+    # Starting mass of 0
+    mass = 0
+    for m in sequence:
+        mass += ONE_LETTER_CODE_MASS_PAIRS[m]
+    return float(mass)
+
+
+def is_permutation(sequence1, sequence2) -> bool:
+    '''
+    Determines if a string is a permutation of another string
+
+    Returns
+    -------
+    bool
+        True if the sequences are permutations of eachother
+    '''
+    if sorted(sequence1) == sorted(sequence2):
+        return True
+    else:
+        return False
+
+
+def find_missing(sequence: str, target: str):
+    '''
+    Identifies monomers present in the target sequence that are missing from the provided sequence.
+
+    Parameters
+    ----------
+    sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer. This sequence
+        is compared against the target sequence.
+
+    target : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer. This sequence
+        is used as the 'correct' sequence and should contain more
+        monomers than the sequence.
+
+    Returns
+    -------
+    dict
+        A dictionary where the keys are 1-letter codes that are
+        missing from the sequence, and the values are the counts
+        of each missing monomer in the target sequence.
+    '''
+    missing = dict(Counter(target) - Counter(sequence))
+    return missing
+
+
+def canonical_composition(sequence) -> str:
+    '''
+    Returns the order-independent key of a sequence, which is its
+    1-letter codes in sorted order. Two sequences share a key
+    exactly when they are permutations of eachother.
+
+    Parameters
+    ----------
+    sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    Returns
+    -------
+    str
+        Sorted 1-letter codes of the sequence
+    '''
+    return ''.join(sorted(sequence))
+
+
+def filter_identical_sequences(possibilities, verbose=False) -> List[str]:
+    '''
+    Removes permutations from a list of possible deletions in a single pass,
+    indexing each deletion by its canonical composition.
+
+    Parameters
+    ----------
+    possibilities : list
+        list of tuples which represent oligomers in their
+        1-letter code format
+
+    Returns
+    -------
+    possibilities : list
+        list of tuples which represent oligomers in their
+        1-letter code format, removed of permutations and
+        ordered from shortest to longest
+    '''
+    # Determine max sequence size
+    max_length = len(max(possibilities, key=len)) + 1
+
+    if verbose:
+        print(f"Max sequence length: {max_length}")
+
+    print('Assessing deletion similarity\n')
+    progress = ProgressReporter(max_length)
+
+    seen = set()
+
+    # Unique deletions grouped by their size
+    buckets = [[] for _ in range(max_length)]
+
+    for s in possibilities:
+        key = canonical_composition(s)
+        if key not in seen:
+            seen.add(key)
+            buckets[len(key)].append(list(key))
+
+    unique = []
+    for size, bucket in enumerate(buckets):
+        unique.extend(bucket)
+        progress.update()
+
+    progress.close()
+    return unique
+
+
+def _size_counts(counts: Iterable[int]) -> list[int]:
+    '''
+    Counts the compositions of each length for the given monomer counts,
+    i.e. the coefficients of the product of (1 + x + ... + x^count).
+
+    Returns
+    -------
+    list[int]
+        Entry s is the number of unique deletions of length s
+    '''
+    sizes = [1]
+    for count in counts:
+        sizes = [sum(sizes[max(0, s - count):s + 1]) for s in range(len(sizes) + count)]
+    return sizes
+
+
+def count_compositions(sequence: str, min_length: int = 0) -> int:
+    '''
+    Counts the unique deletions of a sequence without enumerating them.
+
+    Parameters
+    ----------
+    sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    min_length : int
+        Shortest deletion to count
+
+    Returns
+    -------
+    int
+        Product of (count + 1) over the monomer counts of the sequence
+        when min_length is 0, otherwise the number of those deletions
+        at least min_length long
+    '''
+    if min_length <= 0:
+        total = 1
+        for count in Counter(sequence).values():
+            total *= count + 1
+        return total
+
+    return sum(_size_counts(Counter(sequence).values())[min_length:])
+
+
+def minimum_length(sequence: str, max_deletions: int | None = None, min_length: int = 0) -> int:
+    '''
+    Combines --max-deletions and --min-length into the shortest
+    deletion length of a sequence.
+
+    Parameters
+    ----------
+    sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    max_deletions : int | None
+        Largest number of missing monomers, or None for no limit
+
+    min_length : int
+        Shortest deletion length
+
+    Returns
+    -------
+    int
+        Shortest deletion length satisfying both limits
+    '''
+    if max_deletions is None:
+        return max(0, min_length)
+    return max(0, min_length, len(sequence) - max_deletions)
+
+
+def compute_masses(deletions: Iterable[str],
+                   decimal_points: int,
+                   library: Library = DEFAULT_LIBRARY) -> Iterator[tuple[str, int, list[float]]]:
+    '''
+    Pairs each deletion with its mass and the m/z of each of its adducts
+    as the deletions are produced.
+
+    Masses are summed as integer micro-daltons, so they are exact and do
+    not depend on the order of the monomers, and the m/z values are
+    rounded with integer arithmetic before the only conversion to float.
+    Each deletion is translated to its monomer indexes in one call, so the
+    masses are summed from a list rather than looked up by 1-letter code.
+
+    Parameters
+    ----------
+    deletions : Iterable[str]
+        Deletions in their 1-letter code format
+
+    decimal_points : int
+        The number of decimal points to which the m/z values will be rounded.
+
+    library : Library
+        Monomers and the adducts to apply
+
+    Returns
+    -------
+    Iterator[tuple[str, int, list[float]]]
+        (deletion, mass in micro-daltons, m/z of each adduct) tuples
+    '''
+    micro, indexes = library.micro_masses, library.indexes
+    adducts = [(mass, factor, denominator // 2, denominator, power)
+               for mass, charge in zip(library.adduct_table.micro_masses, library.adduct_table.charges)
+               for factor, denominator, power in [rounding(decimal_points, charge)]]
+
+    for deletion in deletions:
+        base_mass = sum(map(micro.__getitem__, deletion.encode('ascii').translate(indexes)))
+        m_over_z = [(abs(base_mass + mass) * factor + half) // denominator / power
+                    for mass, factor, half, denominator, power in adducts]
+        yield deletion, base_mass, m_over_z
+
+
+def compute_masses_cached(deletions: Iterable[str],
+                          decimal_points: int,
+                          cache: dict,
+                          use_numpy: bool = False,
+                          batch_size: int = 4096,
+                          library: Library = DEFAULT_LIBRARY) -> Iterator[tuple[str, int, list[float]]]:
+    '''
+    Memoized equivalent of compute_masses.
+
+    Deletions are handled in batches of batch_size. Only the deletions of a
+    batch that are not already in the cache are sent to the backend, so
+    sequences sharing sub-compositions only compute them once.
+
+    Parameters
+    ----------
+    deletions : Iterable[str]
+        Deletions in their 1-letter code format
+
+    decimal_points : int
+        The number of decimal points to which the m/z values will be rounded.
+
+    cache : dict
+        Maps deletions to their (mass, m/z of each adduct). Updated in
+        place once each batch has been yielded, so an LRUCache smaller
+        than a batch only keeps its most recent entries.
+
+    use_numpy : bool
+        Compute missing entries with the vectorized NumPy backend
+
+    batch_size : int
+        Number of deletions looked up per batch
+
+    library : Library
+        Monomers and the adducts to apply
+
+    Returns
+    -------
+    Iterator[tuple[str, int, list[float]]]
+        (deletion, mass in micro-daltons, m/z of each adduct) tuples
+    '''
+    if use_numpy:
+        backend = partial(vectorized.compute_masses, library=library)
+    else:
+        backend = partial(compute_masses, library=library)
+
+    deletions = iter(deletions)
+
+    while batch := list(itertools.islice(deletions, batch_size)):
+        # Values of the batch are held locally, as storing the misses
+        # may evict the hits of the same batch from an LRUCache
+        values = {deletion: cache[deletion] for deletion in batch if deletion in cache}
+        uncached = [deletion for deletion in batch if deletion not in values]
+        for deletion, base_mass, m_over_z in backend(uncached, decimal_points):
+            values[deletion] = (base_mass, m_over_z)
+
+        for deletion in batch:
+            yield deletion, *values[deletion]
+
+        for deletion in uncached:
+            cache[deletion] = values[deletion]
+
+
+def apply_window(deletion_masses: Iterable[tuple[str, int, list[float]]],
+                 window: MzWindow,
+                 adduct_table: AdductTable = ADDUCT_TABLE) -> Iterator[tuple[str, int, list[float | None]]]:
+    '''
+    Blanks the m/z values outside an m/z window and drops
+    deletions left without any m/z value inside it.
+
+    Parameters
+    ----------
+    deletion_masses : Iterable[tuple[str, int, list[float]]]
+        (deletion, mass, m/z of each adduct) tuples as
+        produced by compute_masses
+
+    window : MzWindow
+        m/z range and adduct charges to keep
+
+    adduct_table : AdductTable
+        Compiled adducts the m/z values belong to
+
+    Returns
+    -------
+    Iterator[tuple[str, int, list[float | None]]]
+        (deletion, mass, m/z of each adduct) tuples where
+        m/z values outside the window are None
+    '''
+    for deletion, base_mass, adduct_mzs in deletion_masses:
+        kept = [m_over_z if window.allows(charge, m_over_z) else None
+                for charge, m_over_z in zip(adduct_table.charges, adduct_mzs)]
+
+        if any(m_over_z is not None for m_over_z in kept):
+            yield deletion, base_mass, kept
+
+
+@dataclass
+class MzRow:
+    '''Dataclass for holding one adduct of one deletion'''
+    deletion: str
+    mass: float
+    missing: dict
+    charge: int
+    terminus: str
+    adduct: str
+    m_over_z: float
+
+
+class DeletionCalculator:
+    '''
+    In-process interface to the deletions of a sequence and their adducts.
+
+    The calculator is built once for a library of monomers and adducts and
+    returns plain Python objects. It never prints or touches files, which is
+    left to the command line interface. Masses, m/z values and m/z indexes
+    are kept in LRU caches between calls, so sequences sharing
+    sub-compositions only compute them once.
+
+    Example
+    -------
+    For the input sequence 'AyyA', DeletionCalculator().count('AyyA')
+    returns 9 and the first row of mz_rows('AyyA', min_length=4) is the
+    +H+ adduct of 'AAyy' with an m/z of 789.364.
+
+    Parameters
+    ----------
+    library : Library
+        Monomers and their masses, and the adducts to apply to each
+        deletion, see library.load_library
+
+    decimal_points : int
+        The number of decimal points to which the masses are rounded.
+
+    use_numpy : bool
+        Compute masses and m/z values with the vectorized NumPy backend
+
+    cache_size : int
+        Number of deletions whose masses are cached. 0 disables the
+        cache, which suits a single pass over a very large sequence.
+
+    index_cache_size : int
+        Number of m/z indexes cached
+    '''
+
+    def __init__(self,
+                 library: Library = DEFAULT_LIBRARY,
+                 decimal_points: int = 3,
+                 use_numpy: bool = False,
+                 cache_size: int = MASS_CACHE_SIZE,
+                 index_cache_size: int = 8):
+        self.library = library
+        self.monomers = library.monomer_masses
+        self.micro_monomers = dict(zip(library.codes, library.micro_masses))
+        self.adducts = library.adducts
+        self.adduct_table = library.adduct_table
+        self.decimal_points = decimal_points
+        self.use_numpy = use_numpy
+
+        self._masses = LRUCache(cache_size)
+        self._indexes = LRUCache(index_cache_size)
+
+    def verify(self, sequence: str) -> None:
+        '''
+        Raises
+        ------
+        SequenceError
+            A monomer of the sequence is not in the monomer table
+        '''
+        for monomer in sequence:
+            if monomer not in self.monomers:
+                raise SequenceError(f'{monomer} monomer not in possible monomers')
+
+    def count(self, sequence: str, min_length: int = 0) -> int:
+        '''
+        Returns the number of unique deletions of at least min_length monomers
+        '''
+        return count_compositions(sequence, min_length)
+
+    def deletions(self,
+                  sequence: str,
+                  min_length: int = 0,
+                  window: MzWindow | None = None) -> Iterator[str]:
+        '''
+        Iterates the unique deletions of a sequence from shortest to longest.
+        With a window, deletions that cannot have an adduct inside it are skipped.
+        '''
+        mass_range = None if window is None else window.mass_range(self.adducts, self.decimal_points)
+        return generate_compositions(sequence, min_length, mass_range, self.library)
+
+    def added(self,
+              sequence: str,
+              previous: str,
+              min_length: int = 0,
+              previous_min_length: int = 0) -> Iterator[str]:
+        '''
+        Iterates the deletions of a sequence that are not deletions of a previous
+        version of it. Swap the sequences to get the deletions that were removed.
+        '''
+        return generate_added_compositions(sequence, previous, min_length, previous_min_length)
+
+    def mass(self, deletion: str) -> float:
+        '''
+        Returns the unrounded mass of a deletion
+        '''
+        return self.micro_mass(deletion) / SCALE
+
+    def micro_mass(self, deletion: str) -> int:
+        '''
+        Returns the exact mass of a deletion in micro-daltons
+        '''
+        return sum(map(self.library.micro_masses.__getitem__, deletion.encode('ascii').translate(self.library.indexes)))
+
+    def masses(self, deletions: Iterable[str]) -> Iterator[tuple[str, int, list[float]]]:
+        '''
+        Iterates (deletion, mass in micro-daltons, rounded m/z of each adduct) tuples
+        '''
+        if self._masses.maxsize == 0:
+            if self.use_numpy:
+                return vectorized.compute_masses(deletions, self.decimal_points, library=self.library)
+            return compute_masses(deletions, self.decimal_points, self.library)
+
+        return compute_masses_cached(deletions,
+                                     self.decimal_points,
+                                     self._masses,
+                                     self.use_numpy,
+                                     library=self.library)
+
+    def deletion_masses(self,
+                        sequence: str,
+                        min_length: int = 0,
+                        window: MzWindow | None = None) -> Iterator[tuple[str, int, list[float | None]]]:
+        '''
+        Iterates (deletion, mass, rounded m/z of each adduct) tuples of the
+        deletions of a sequence. With a window, m/z values outside it are None.
+        '''
+        deletion_masses = self.masses(self.deletions(sequence, min_length, window))
+        if window is not None:
+            deletion_masses = apply_window(deletion_masses, window, self.adduct_table)
+        return deletion_masses
+
+    def missing(self, sequence: str, deletion: str) -> dict:
+        '''
+        Returns the monomers of sequence missing from deletion and their counts
+        '''
+        return dict(Counter(sequence) - Counter(deletion))
+
+    def mz_rows(self,
+                sequence: str,
+                min_length: int = 0,
+                window: MzWindow | None = None) -> Iterator[MzRow]:
+        '''
+        Iterates one MzRow per (deletion, adduct) of a sequence
+        '''
+        for deletion, base_mass, adduct_mzs in self.deletion_masses(sequence, min_length, window):
+            mass = from_micro(base_mass, self.decimal_points)
+            missing = self.missing(sequence, deletion)
+
+            for adduct, m_over_z in zip(self.adducts, adduct_mzs):
+                if m_over_z is not None:
+                    yield MzRow(deletion=deletion,
+                                mass=mass,
+                                missing=missing,
+                                charge=int(adduct.charge),
+                                terminus=adduct.terminus,
+                                adduct=adduct.name,
+                                m_over_z=m_over_z)
+
+    def index(self, sequence: str, min_length: int = 0) -> MzIndex:
+        '''
+        Returns the reverse m/z index of a sequence, built on first use
+        '''
+        key = (sequence, min_length)
+        if key not in self._indexes:
+            deletion_masses = ((d, self.micro_mass(d)) for d in self.deletions(sequence, min_length))
+            self._indexes[key] = MzIndex(sequence, deletion_masses, self.adducts)
+        return self._indexes[key]
+
+    def query(self,
+              sequence: str,
+              peak: float,
+              tolerance: float = 10,
+              unit: str = 'ppm',
+              min_length: int = 0) -> list[PeakMatch]:
+        '''
+        Finds the deletions and adducts of a sequence within tolerance of a peak
+        '''
+        return self.index(sequence, min_length).query(peak, tolerance, unit)
+
+
+def format_deletions(input_sequence: str,
+                     deletion_masses: Iterable[tuple[str, int, list[float]]],
+                     decimal_points: int,
+                     library: Library = DEFAULT_LIBRARY) -> Iterator[str]:
+    '''
+    Formats the text block describing each deletion and its adducts.
+
+    Parameters
+    ----------
+    input_sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    deletion_masses : Iterable[tuple[str, int, list[float]]]
+        (deletion, mass in micro-daltons, m/z of each adduct) tuples as produced by
+        compute_masses. Adducts whose m/z is None are left out.
+
+    decimal_points : int
+        The number of decimal points to which the masses will be rounded.
+
+    library : Library
+        Monomers and the adducts the m/z values belong to
+
+    Returns
+    -------
+    Iterator[str]
+        One block of text per deletion
+    '''
+    for deletion, base_mass, adduct_mzs in deletion_masses:
+
+        # Write the mass of the parent deletion
+        lines = [f'{"".join([letter + " " for letter in deletion])} :  \
+                      {from_micro(base_mass, decimal_points)}\n']
+
+        # Missing monomer information
+        missing = find_missing(deletion, input_sequence)
+        lines.append("Missing ")
+        lines.extend([f'{occurences} {library.multiletter_codes[missing_monomer]} '
+                      for missing_monomer, occurences in missing.items()])
+
+        lines.append("\n")
+        lines.append('CHARGE\tTERMINUS\tNAME\t\tM/Z\n')
+        lines.extend([f'{prefix}{m_over_z}\n'
+                      for prefix, m_over_z in zip(library.adduct_table.prefixes, adduct_mzs)
+                      if m_over_z is not None])
+
+        lines.append("\n")
+        yield ''.join(lines)
+
+
+def write_adducts(input_sequence: str,
+                  deletions: Iterable[str],
+                  decimal_points: int,
+                  outfile: Path,
+                  total: int | None = None,
+                  use_numpy: bool = False,
+                  calculator: DeletionCalculator | None = None,
+                  output_format: str = 'txt',
+                  window: MzWindow | None = None,
+                  profiler: StageProfiler = NULL_PROFILER) -> None:
+    '''
+    Writes the details of the deletions and their adducts to an output file.
+
+    Deletions are consumed lazily, so each block is written as soon as its
+    deletion is produced and the full set of deletions is never held in memory.
+
+    Parameters
+    ----------
+    input_sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    deletions : Iterable[str]
+        Deletions in their 1-letter code format. May be a generator.
+
+    decimal_points : int
+        The number of decimal points to which the masses will be rounded.
+
+    outfile : Path
+        The path to the output file.
+
+    total : int | None
+        Number of deletions, used for the progress bar. Defaults
+        to len(deletions) when deletions is a sequence. 0 when unknown.
+
+    use_numpy : bool
+        Compute masses and m/z values with the vectorized NumPy backend
+
+    calculator : DeletionCalculator | None
+        Computes the masses and m/z values, possibly from its cache of
+        deletions seen in earlier calls. Defaults to an uncached calculator
+        built from decimal_points and use_numpy.
+
+    output_format : str
+        One of OUTPUT_FORMATS. txt is the human readable report, while
+        tsv, csv, npz and sqlite hold one entry per (deletion, adduct).
+
+    window : MzWindow | None
+        Only write adduct lines inside this m/z window
+
+    profiler : StageProfiler
+        Records the mass and write stages and the progress counters
+    '''
+
+    print('Writing to file\n')
+
+    # Make progress bar
+    progress = ProgressReporter(len(deletions) if total is None else total)
+
+    if calculator is None:
+        calculator = DeletionCalculator(decimal_points=decimal_points,
+                                        use_numpy=use_numpy,
+                                        cache_size=0)
+
+    deletion_masses = profiler.wrap('mass', calculator.masses(deletions))
+
+    if window is not None:
+        deletion_masses = apply_window(deletion_masses, window, calculator.adduct_table)
+
+    if output_format != 'txt':
+        writers = {'tsv': partial(write_table, delimiter='\t'),
+                   'csv': partial(write_table, delimiter=','),
+                   'npz': write_npz,
+                   'sqlite': write_sqlite}
+
+        with profiler.stage('write') as stage:
+            stage.items += writers[output_format](input_sequence,
+                                                  _report_progress(deletion_masses, progress),
+                                                  decimal_points,
+                                                  outfile,
+                                                  partial(format_missing, library=calculator.library),
+                                                  adducts=calculator.adducts)
+    else:
+        blocks = format_deletions(input_sequence, deletion_masses, decimal_points, calculator.library)
+
+        with profiler.stage('write') as stage, open(outfile, 'w', encoding='utf-8') as o:
+            for block in blocks:
+                o.write(block)
+                progress.update()
+            stage.items += progress.count
+
+    progress.close()
+    profiler.add_counters('progress', progress.counters())
+
+
+def write_ordered(input_sequence: str,
+                  decimal_points: int,
+                  outfile: Path,
+                  min_length: int = 0,
+                  calculator: DeletionCalculator | None = None,
+                  window: MzWindow | None = None,
+                  fragments: FragmentTable | None = None,
+                  use_numpy: bool = False,
+                  batch_size: int = 4096,
+                  profiler: StageProfiler = NULL_PROFILER) -> None:
+    '''
+    Writes the text report of the deletions of a sequence, listing under
+    each deletion composition the distinct orders in which its monomers
+    occur in the sequence, i.e. AyB and ByA under A B y.
+
+    The ordered deletions are generated per composition by a
+    SubsequenceAutomaton, so each is produced exactly once and the
+    ordered deletions seen so far are never held in memory. The masses
+    and adducts only depend on the composition and are written once for
+    all of its orders.
+
+    Parameters
+    ----------
+    input_sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    decimal_points : int
+        The number of decimal points to which the masses will be rounded.
+
+    outfile : Path
+        The path to the output file.
+
+    min_length : int
+        Shortest deletion to write
+
+    calculator : DeletionCalculator | None
+        Monomer and adduct tables to use
+
+    window : MzWindow | None
+        Only write adduct lines inside this m/z window
+
+    fragments : FragmentTable | None
+        Adducts whose N- and C-terminal fragment ladders are written
+        under each ordered deletion
+
+    use_numpy : bool
+        Compute the fragment ladders with NumPy
+
+    batch_size : int
+        Number of ordered deletions whose ladders are computed at once
+
+    profiler : StageProfiler
+        Records the enumeration, mass, ordered, fragments and write stages
+    '''
+    print('Writing to file\n')
+
+    if calculator is None:
+        calculator = DeletionCalculator(decimal_points=decimal_points, cache_size=0)
+
+    automaton = SubsequenceAutomaton(input_sequence)
+    progress = ProgressReporter(automaton.count(min_length) if window is None else 0)
+
+    deletions = profiler.wrap('enumeration', calculator.deletions(input_sequence, min_length, window))
+    deletion_masses = profiler.wrap('mass', calculator.masses(deletions))
+    if window is not None:
+        deletion_masses = apply_window(deletion_masses, window, calculator.adduct_table)
+
+    with profiler.stage('write') as stage, open(outfile, 'w', encoding='utf-8') as o:
+        for deletion_mass in deletion_masses:
+            block = next(format_deletions(input_sequence, [deletion_mass], decimal_points, calculator.library))
+
+            # The block ends with a blank line, which now follows the orders
+            o.write(block[:-1])
+            o.write('ORDERED\n')
+            if fragments is None:
+                for ordered in profiler.wrap('ordered', automaton.ordered(deletion_mass[0])):
+                    o.write(f'{" ".join(ordered)}\n')
+                    progress.update()
+            else:
+                orders = profiler.wrap('ordered', automaton.ordered_masses(deletion_mass[0], calculator.micro_monomers))
+                while batch := list(itertools.islice(orders, batch_size)):
+                    with profiler.stage('fragments') as fragment_stage:
+                        ladders = fragment_ladders([sums for _, sums in batch], fragments, decimal_points, use_numpy)
+                        fragment_stage.items += len(batch)
+
+                    for (ordered, _), ladder in zip(batch, ladders):
+                        o.write(f'{" ".join(ordered)}\n')
+                        o.writelines(format_ladder(ladder, fragments))
+                        progress.update()
+            o.write('\n')
+        stage.items += progress.count
+
+    progress.close()
+    profiler.add_counters('progress', progress.counters())
+
+
+def format_ladder(ladder: tuple[list[list[float]], list[list[float]]],
+                  fragments: FragmentTable) -> list[str]:
+    '''
+    Formats the fragment ladders of one ordered deletion as lines holding the
+    fragment, N1, N2, ... for the N-terminal and C1, C2, ... for the
+    C-terminal ladder, followed by the fragment ion and the m/z
+    '''
+    n_ladder, c_ladder = ladder
+    if not n_ladder:
+        return []
+
+    lines = ['FRAGMENT\tCHARGE\tTERMINUS\tNAME\t\tM/Z\n']
+    for terminus, rows, prefixes in (('N', n_ladder, fragments.n_prefixes), ('C', c_ladder, fragments.c_prefixes)):
+        lines.extend(f'{terminus}{i}\t{prefix}{m_over_z}\n'
+                     for i, row in enumerate(rows, start=1)
+                     for prefix, m_over_z in zip(prefixes, row))
+    return lines
+
+
+def _report_progress(items: Iterable, progress: ProgressReporter) -> Iterator:
+    '''
+    Passes items through unchanged while updating the progress bar
+    '''
+    for item in items:
+        yield item
+        progress.update()
+
+
+def output_path(input_sequence: str, output_format: str = 'txt') -> Path:
+    '''
+    Returns the path of the output file of a sequence in the working directory
+    '''
+    return Path().cwd() / f'{input_sequence}.{output_format}'
+
+
+def _format_shard(job: tuple[str, tuple[int, tuple[int, ...]], int, bool, MzWindow | None, Library]) -> tuple[str, int]:
+    '''
+    Enumerates and formats one shard in a worker process.
+
+    Parameters
+    ----------
+    job : tuple[str, tuple[int, tuple[int, ...]], int, bool, MzWindow | None, Library]
+        (input sequence, shard, decimal points, use NumPy, m/z window, library)
+
+    Returns
+    -------
+    tuple[str, int]
+        Text of the shard and the number of deletions in it
+    '''
+    input_sequence, shard, decimal_points, use_numpy, window, library = job
+    mass_range = None if window is None else window.mass_range(library.adducts, decimal_points)
+    deletions = generate_shard(input_sequence, shard, mass_range, library)
+
+    if use_numpy:
+        deletion_masses = vectorized.compute_masses(deletions, decimal_points, library=library)
+    else:
+        deletion_masses = compute_masses(deletions, decimal_points, library)
+
+    if window is not None:
+        deletion_masses = apply_window(deletion_masses, window, library.adduct_table)
+
+    blocks = list(format_deletions(input_sequence, deletion_masses, decimal_points, library))
+    return ''.join(blocks), len(blocks)
+
+
+def write_adducts_parallel(input_sequence: str,
+                           decimal_points: int,
+                           outfile: Path,
+                           workers: int,
+                           use_numpy: bool = False,
+                           min_length: int = 0,
+                           window: MzWindow | None = None,
+                           profiler: StageProfiler = NULL_PROFILER,
+                           library: Library = DEFAULT_LIBRARY) -> None:
+    '''
+    Parallel equivalent of write_adducts for the deletions of a sequence.
+
+    The deletions are split with composition_shards and each shard is
+    enumerated, its masses computed and its text formatted in a process
+    pool. Shards are written in order, so the output file is identical
+    to the one written by write_adducts. Shards hold at most SHARD_SIZE
+    deletions and only a few shards per worker are submitted ahead of
+    the one being written, so memory stays bounded however long the
+    sequence is.
+
+    Parameters
+    ----------
+    input_sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    decimal_points : int
+        The number of decimal points to which the masses will be rounded.
+
+    outfile : Path
+        The path to the output file.
+
+    workers : int
+        Number of worker processes
+
+    use_numpy : bool
+        Compute masses and m/z values with the vectorized NumPy backend
+
+    min_length : int
+        Shortest deletion to write
+
+    window : MzWindow | None
+        Only write adduct lines inside this m/z window
+
+    profiler : StageProfiler
+        Records the write stage and the progress counters. Enumeration and
+        masses are computed in the worker processes and are included in
+        the write stage.
+
+    library : Library
+        Monomers and adducts, sent to the workers with every shard
+    '''
+    print('Writing to file\n')
+
+    # The number of deletions inside a window is unknown until they are
+    # enumerated, so the progress bar then only shows the count
+    total_len = count_compositions(input_sequence, min_length) if window is None else 0
+    progress = ProgressReporter(total_len)
+
+    # Several shards per worker keep the workers busy until the last shard
+    shard_size = max(1, min(SHARD_SIZE, count_compositions(input_sequence, min_length) // (4 * workers)))
+    jobs = ((input_sequence, shard, decimal_points, use_numpy, window, library)
+            for shard in composition_shards(input_sequence, min_length, shard_size))
+
+    with profiler.stage('write') as stage, \
+         ProcessPoolExecutor(max_workers=workers) as executor, \
+         open(outfile, 'w', encoding='utf-8') as o:
+        pending = deque(executor.submit(_format_shard, job) for job in itertools.islice(jobs, 2 * workers))
+        while pending:
+            text, count = pending.popleft().result()
+            pending.extend(executor.submit(_format_shard, job) for job in itertools.islice(jobs, 1))
+            o.write(text)
+            progress.update(count)
+        stage.items += progress.count
+
+    progress.close()
+    profiler.add_counters('progress', progress.counters())
+
+
+def convert_to_multiletter_codes(monomer_one_letter, library: Library = DEFAULT_LIBRARY):
+    '''
+    Converts a 1-letter monomer code to its corresponding 3-letter code.
+
+    This function looks up the provided 1-letter code in a predefined dictionary
+    of three-letter codes and returns the corresponding 3-letter code.
+
+    Parameters
+    ----------
     monomer_one_letter : str
         A single character of the 1-letter code
 
+    library : Library
+        Monomers and their 3-letter codes
+
+    Returns
+    -------
+    str
+        The 3-letter code associated with the input 1-letter code
+
+    '''
+    return library.multiletter_codes[monomer_one_letter]
+
+
+def build_mz_index(input_sequence: str,
+                   min_length: int = 0,
+                   profiler: StageProfiler = NULL_PROFILER,
+                   calculator: DeletionCalculator | None = None) -> MzIndex:
+    '''
+    Builds the reverse m/z index over every deletion and adduct of a sequence.
+
+    Parameters
+    ----------
+    input_sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    min_length : int
+        Shortest deletion to index
+
+    profiler : StageProfiler
+        Records the enumeration, mass and index stages
+
+    calculator : DeletionCalculator | None
+        Monomer and adduct tables to index with. Defaults to the built-in tables.
+
     Returns
     -------
-    str
-        The 3-letter code associated with the input 1-letter code
+    MzIndex
+        Sorted m/z index of the sequence
+    '''
+    print('Building m/z index\n')
+    if calculator is None:
+        calculator = DeletionCalculator()
+
+    deletions = profiler.wrap('enumeration', calculator.deletions(input_sequence, min_length))
+    deletion_masses = profiler.wrap('mass', ((d, calculator.micro_mass(d)) for d in deletions))
+
+    with profiler.stage('index') as stage:
+        index = MzIndex(input_sequence, deletion_masses, calculator.adducts)
+        stage.items += len(index)
+    return index
+
+
+def open_mz_index(input_sequence: str,
+                  index_file: Path,
+                  min_length: int = 0,
+                  profiler: StageProfiler = NULL_PROFILER,
+                  calculator: DeletionCalculator | None = None) -> MappedMzIndex:
+    '''
+    Opens the persisted m/z index of a sequence, building and saving it
+    first when index_file is missing or holds the index of another sequence,
+    minimum deletion length or set of monomer and adduct tables.
+
+    Parameters
+    ----------
+    input_sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    index_file : Path
+        Path to the persisted index
+
+    min_length : int
+        Shortest deletion to index
+
+    profiler : StageProfiler
+        Records the enumeration, mass and index stages
+
+    calculator : DeletionCalculator | None
+        Monomer and adduct tables to index with. Defaults to the built-in tables.
+
+    Returns
+    -------
+    MappedMzIndex
+        Memory-mapped m/z index of the sequence
+    '''
+    if calculator is None:
+        calculator = DeletionCalculator()
+
+    if index_file.is_file():
+        try:
+            index = MappedMzIndex(index_file, calculator.adducts, table_hash(calculator.library))
+        except ValueError as e:
+            print(f'Rebuilding m/z index: {e}\n')
+        else:
+            if index.input_sequence == input_sequence and index.min_length == min_length:
+                print(f'Loaded m/z index from {index_file}\n')
+                return index
+            index.close()
+
+    index = build_mz_index(input_sequence, min_length, profiler, calculator)
+    with profiler.stage('index') as stage:
+        write_index(index, index_file, table_hash(calculator.library), min_length)
+    del index
+
+    return MappedMzIndex(index_file, calculator.adducts, table_hash(calculator.library))
+
+
+def print_peak_matches(peak: float,
+                       matches: list[PeakMatch],
+                       decimal_points: int,
+                       library: Library = DEFAULT_LIBRARY) -> None:
+    '''
+    Prints the deletions and adducts that explain an observed peak.
+
+    Parameters
+    ----------
+    peak : float
+        Observed m/z
+
+    matches : list[PeakMatch]
+        Matches of a single peak as returned by MzIndex.query
+
+    decimal_points : int
+        The number of decimal points to which the masses will be rounded.
+
+    library : Library
+        Monomers the missing 3-letter codes are taken from
+    '''
+    print(f'PEAK {peak}')
+
+    if not matches:
+        print('No deletions found\n')
+        return
+
+    print('DELETION\tMISSING\tCHARGE\tTERMINUS\tNAME\t\tM/Z\tERROR (Da)\tERROR (ppm)')
+    for match in matches:
+        print(f'{" ".join(match.deletion)}\t{format_missing(match.missing, library)}\t{match.charge}\t{match.terminus}\t'
+              f'{match.adduct:<16}\t{round_m_over_z(match.m_over_z, match.charge, decimal_points)}\t'
+              f'{round(match.error, decimal_points)}\t{round(match.error_ppm, 1)}')
+    print()
+
+
+def format_missing(missing: dict, library: Library = DEFAULT_LIBRARY) -> str:
+    '''
+    Formats missing monomers as counts and 3-letter codes i.e. '2 Ala 1 d2Tyr'
+    '''
+    return ' '.join(f'{occurences} {convert_to_multiletter_codes(monomer, library)}'
+                    for monomer, occurences in missing.items())
+
+
+def write_annotations(index: MzIndex,
+                      peaks: list[tuple[float, float]],
+                      tolerance: float,
+                      unit: str,
+                      decimal_points: int,
+                      outfile: Path,
+                      library: Library = DEFAULT_LIBRARY) -> None:
+    '''
+    Writes a tab separated table with one row per (peak, deletion, adduct)
+    match. Peaks without a match are written once with empty annotation columns.
+
+    Parameters
+    ----------
+    index : MzIndex
+        m/z index of the sequence
+
+    peaks : list[tuple[float, float]]
+        (m/z, intensity) pairs of the observed peaks
+
+    tolerance : float
+        Allowed difference between the observed and theoretical m/z
+
+    unit : str
+        'ppm' or 'Da'
+
+    decimal_points : int
+        The number of decimal points to which the masses will be rounded.
+
+    outfile : Path
+        The path to the output file.
+
+    library : Library
+        Monomers the missing 3-letter codes are taken from
+    '''
+    print('Annotating peaks\n')
+
+    with open(outfile, 'w', encoding='utf-8', newline='') as o:
+        writer = csv.writer(o, delimiter='\t')
+        writer.writerow(['peak_mz', 'intensity', 'deletion', 'missing', 'charge',
+                         'terminus', 'adduct', 'theoretical_mz', 'error_da', 'error_ppm'])
+
+        for peak, intensity, matches in index.annotate(peaks, tolerance, unit):
+            if not matches:
+                writer.writerow([peak, intensity] + [''] * 8)
+
+            writer.writerows([peak,
+                              intensity,
+                              match.deletion,
+                              format_missing(match.missing, library),
+                              match.charge,
+                              match.terminus,
+                              match.adduct,
+                              round_m_over_z(match.m_over_z, match.charge, decimal_points),
+                              round(match.error, decimal_points),
+                              round(match.error_ppm, 1)] for match in matches)
+
+
+def read_state(state_file: Path) -> dict | None:
+    '''
+    Reads the state saved by write_state.
+
+    Returns
+    -------
+    dict | None
+        The state, or None if state_file does not exist
+    '''
+    if not state_file.is_file():
+        return None
+
+    with open(state_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_state(state_file: Path,
+                input_sequence: str,
+                decimal_points: int,
+                output_format: str = 'txt',
+                min_length: int = 0,
+                window: MzWindow | None = None,
+                library: Library = DEFAULT_LIBRARY) -> None:
+    '''
+    Saves the sequence and settings of a run. The deletions and their
+    masses follow from the monomer counts of the sequence, so together
+    with the table hash they describe every deletion the run wrote.
+    '''
+    state = {'sequence': input_sequence,
+             'min_length': min_length,
+             'decimal_points': decimal_points,
+             'output_format': output_format,
+             'window': None if window is None else str(window),
+             'table_hash': table_hash(library),
+             'deletions': count_compositions(input_sequence, min_length)}
+
+    with open(state_file, 'w', encoding='utf-8') as o:
+        json.dump(state, o, indent=2)
+
+
+def is_compatible_state(state: dict | None,
+                        decimal_points: int,
+                        output_format: str = 'txt',
+                        window: MzWindow | None = None,
+                        library: Library = DEFAULT_LIBRARY) -> bool:
+    '''
+    True if a saved state was written with the same settings and tables,
+    so that its deletions can be compared with those of this run
+    '''
+    return (state is not None
+            and state.get('decimal_points') == decimal_points
+            and state.get('output_format') == output_format
+            and state.get('window') == (None if window is None else str(window))
+            and state.get('table_hash') == table_hash(library))
+
+
+def write_changes(input_sequence: str,
+                  previous: str,
+                  decimal_points: int,
+                  min_length: int = 0,
+                  previous_min_length: int = 0,
+                  use_numpy: bool = False,
+                  calculator: DeletionCalculator | None = None,
+                  output_format: str = 'txt',
+                  window: MzWindow | None = None,
+                  profiler: StageProfiler = NULL_PROFILER) -> None:
+    '''
+    Writes only what changed since a previous version of a sequence.
+
+    The deletions that are new are written with their adducts to
+    <sequence>_added in the output format, and the deletions that no longer
+    exist are listed one per line in <sequence>_removed.txt. The work done
+    is proportional to the number of changed deletions rather than to
+    every deletion of the sequence.
+
+    Parameters
+    ----------
+    input_sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    previous : str
+        Sequence of the previous run
+
+    decimal_points : int
+        The number of decimal points to which the masses will be rounded.
+
+    min_length : int
+        Shortest deletion of the sequence
+
+    previous_min_length : int
+        Shortest deletion of the previous run
+
+    use_numpy : bool
+        Compute masses and m/z values with the vectorized NumPy backend
+
+    calculator : DeletionCalculator | None
+        Monomer and adduct tables to use
+
+    output_format : str
+        One of OUTPUT_FORMATS
+
+    window : MzWindow | None
+        Only write adduct lines inside this m/z window
+
+    profiler : StageProfiler
+        Records the enumeration, mass and write stages
+    '''
+    if calculator is None:
+        calculator = DeletionCalculator(decimal_points=decimal_points,
+                                        use_numpy=use_numpy,
+                                        cache_size=0)
+
+    added = count_added_compositions(input_sequence, previous, min_length, previous_min_length)
+    print(f'{added:,} deletions added since {previous}\n')
+
+    write_adducts(input_sequence,
+                  profiler.wrap('enumeration', generate_added_compositions(input_sequence,
+                                                                           previous,
+                                                                           min_length,
+                                                                           previous_min_length)),
+                  decimal_points=decimal_points,
+                  outfile=output_path(f'{input_sequence}_added', output_format),
+                  total=added if window is None else 0,
+                  use_numpy=use_numpy,
+                  calculator=calculator,
+                  output_format=output_format,
+                  window=window,
+                  profiler=profiler)
+
+    removed = generate_added_compositions(previous, input_sequence, previous_min_length, min_length)
+    if window is not None:
+        # Deletions without an adduct inside the window were never written
+        removed = (deletion for deletion, _, _ in apply_window(calculator.masses(removed),
+                                                               window,
+                                                               calculator.adduct_table))
+
+    with profiler.stage('write') as stage, \
+         open(output_path(f'{input_sequence}_removed', 'txt'), 'w', encoding='utf-8') as o:
+        for deletion in removed:
+            o.write(f'{deletion}\n')
+            stage.items += 1
+
+
+def read_batch(batch_file: Path, library: Library = DEFAULT_LIBRARY) -> list[str]:
+    '''
+    Reads and verifies the sequences of a batch file.
+
+    Blank lines and lines starting with # are ignored. Every sequence is
+    checked before any work starts so an invalid entry fails the batch early.
+
+    Parameters
+    ----------
+    batch_file : Path
+        File with one sequence of 1-letter or 3-letter codes per line
+
+    library : Library
+        Monomers the sequences may contain
+
+    Returns
+    -------
+    list[str]
+        Sequences of 1-letter codes
+    '''
+    sequences = []
+    with open(batch_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            sequence = parse_input(line, library)
+            verify_sequence(sequence, library)
+            sequences.append(sequence)
+    return sequences
+
+
+def write_sequence(input_sequence: str,
+                   outfile: Path,
+                   decimal_points: int,
+                   use_numpy: bool = False,
+                   workers: int = 1,
+                   calculator: DeletionCalculator | None = None,
+                   result_cache=None,
+                   output_format: str = 'txt',
+                   min_length: int = 0,
+                   window: MzWindow | None = None,
+                   profiler: StageProfiler = NULL_PROFILER) -> None:
+    '''
+    Writes the deletion file of a sequence, serving it from the
+    persistent result cache when possible.
+
+    Parameters
+    ----------
+    input_sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    outfile : Path
+        The path to the output file.
+
+    decimal_points : int
+        The number of decimal points to which the masses will be rounded.
+
+    use_numpy : bool
+        Compute masses and m/z values with the vectorized NumPy backend
+
+    workers : int
+        Number of worker processes. With more than one worker the file
+        is written with write_adducts_parallel and only the library of
+        calculator is used.
+
+    calculator : DeletionCalculator | None
+        Enumerates the deletions and computes their masses, see write_adducts
+
+    result_cache : DirectoryCache | SQLiteCache | None
+        Persistent cache of deletion files from cache.open_cache
+
+    output_format : str
+        One of OUTPUT_FORMATS. Only txt files are written in parallel.
 
+    min_length : int
+        Shortest deletion to write
+
+    window : MzWindow | None
+        Only write adduct lines inside this m/z window
+
+    profiler : StageProfiler
+        Records the enumeration, mass and write stages
+    '''
+    if calculator is None:
+        calculator = DeletionCalculator(decimal_points=decimal_points,
+                                        use_numpy=use_numpy,
+                                        cache_size=0)
+
+    if result_cache is not None:
+        key = cache_key(input_sequence, decimal_points, output_format, min_length, window, calculator.library)
+        with profiler.stage('write'):
+            hit = result_cache.get_file(key, outfile)
+        if hit:
+            print('Loaded deletions from cache\n')
+            return
+
+    if workers > 1 and output_format == 'txt':
+        write_adducts_parallel(input_sequence,
+                               decimal_points=decimal_points,
+                               outfile=outfile,
+                               workers=workers,
+                               use_numpy=use_numpy,
+                               min_length=min_length,
+                               window=window,
+                               profiler=profiler,
+                               library=calculator.library)
+    else:
+        total = calculator.count(input_sequence, min_length) if window is None else 0
+
+        # Deletions are streamed straight into the output file
+        deletions = calculator.deletions(input_sequence, min_length, window)
+
+        write_adducts(input_sequence,
+                      profiler.wrap('enumeration', deletions),
+                      outfile=outfile,
+                      decimal_points=decimal_points,
+                      total=total,
+                      use_numpy=use_numpy,
+                      calculator=calculator,
+                      output_format=output_format,
+                      window=window,
+                      profiler=profiler)
+
+    if result_cache is not None:
+        result_cache.put_file(key, outfile)
+
+
+def run_batch(sequences: list[str],
+              decimal_points: int,
+              use_numpy: bool = False,
+              workers: int = 1,
+              result_cache=None,
+              output_format: str = 'txt',
+              max_deletions: int | None = None,
+              min_length: int = 0,
+              window: MzWindow | None = None,
+              profiler: StageProfiler = NULL_PROFILER,
+              calculator: DeletionCalculator | None = None) -> None:
+    '''
+    Writes the deletion file of every sequence, sharing one
+    mass and m/z cache between all of them.
+
+    Parameters
+    ----------
+    sequences : list[str]
+        Sequences of 1-letter codes
+
+    decimal_points : int
+        The number of decimal points to which the masses will be rounded.
+
+    use_numpy : bool
+        Compute masses and m/z values with the vectorized NumPy backend
+
+    workers : int
+        Number of worker processes. With more than one worker each sequence
+        is written with write_adducts_parallel and the cache is not used.
+
+    result_cache : DirectoryCache | SQLiteCache | None
+        Persistent cache of deletion files from cache.open_cache
+
+    output_format : str
+        One of OUTPUT_FORMATS
+
+    max_deletions : int | None
+        Largest number of missing monomers, or None for no limit
+
+    min_length : int
+        Shortest deletion to write
+
+    window : MzWindow | None
+        Only write adduct lines inside this m/z window
+
+    profiler : StageProfiler
+        Records the stages of every sequence
+
+    calculator : DeletionCalculator | None
+        Calculator whose cache is shared between the sequences.
+        Defaults to a new cached calculator.
+    '''
+    if calculator is None:
+        calculator = DeletionCalculator(decimal_points=decimal_points, use_numpy=use_numpy)
+
+    for i, sequence in enumerate(sequences):
+        print(f'Sequence {i + 1} of {len(sequences)}: {sequence}\n')
+
+        write_sequence(sequence,
+                       outfile=output_path(sequence, output_format),
+                       decimal_points=decimal_points,
+                       use_numpy=use_numpy,
+                       workers=workers,
+                       calculator=calculator,
+                       result_cache=result_cache,
+                       output_format=output_format,
+                       min_length=minimum_length(sequence, max_deletions, min_length),
+                       window=window,
+                       profiler=profiler)
+
+
+def sample_compositions(sequence: str,
+                        samples: int,
+                        seed: int = 0,
+                        min_length: int = 0) -> list[str]:
+    '''
+    Draws deletions uniformly at random without enumerating them.
+
+    A length is drawn in proportion to the number of deletions of that
+    length, then the count of each monomer is drawn in proportion to the
+    number of ways the remaining monomers can complete the deletion. When
+    samples is at least the number of unique deletions, every deletion is
+    returned instead.
+
+    Parameters
+    ----------
+    sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    samples : int
+        Number of deletions to draw
+
+    seed : int
+        Seed of the random number generator
+
+    min_length : int
+        Shortest deletion to draw
+
+    Returns
+    -------
+    list[str]
+        Sampled deletions
+    '''
+    if samples >= count_compositions(sequence, min_length):
+        return list(generate_compositions(sequence, min_length))
+
+    monomers, counts, _ = _monomer_counts(sequence)
+    rng = random.Random(seed)
+
+    # ways[i][s] is the number of ways monomers i onwards sum to s
+    ways = [_size_counts(counts[i:]) for i in range(len(counts) + 1)]
+    sizes = range(min_length, len(sequence) + 1)
+
+    drawn = []
+    for _ in range(samples):
+        size = rng.choices(sizes, weights=[ways[0][s] for s in sizes])[0]
+
+        deletion = ''
+        for i, (monomer, count) in enumerate(zip(monomers, counts)):
+            options = [n for n in range(min(count, size) + 1) if size - n < len(ways[i + 1])]
+            n = rng.choices(options, weights=[ways[i + 1][size - n] for n in options])[0]
+            deletion += monomer * n
+            size -= n
+
+        drawn.append(deletion)
+
+    return drawn
+
+
+def estimate_output(input_sequence: str,
+                    decimal_points: int,
+                    output_format: str = 'txt',
+                    use_numpy: bool = False,
+                    samples: int = 256,
+                    min_length: int = 0,
+                    calculator: DeletionCalculator | None = None,
+                    window: MzWindow | None = None) -> dict:
+    '''
+    Estimates the size of a run without enumerating its deletions.
+
+    The number of deletions is exact. The output size and runtime are
+    projected from writing a uniform sample of deletions to a temporary file,
+    as are the deletions and adduct lines inside an m/z window.
+
+    Parameters
+    ----------
+    input_sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    decimal_points : int
+        The number of decimal points to which the masses will be rounded.
+
+    output_format : str
+        One of OUTPUT_FORMATS
+
+    use_numpy : bool
+        Compute masses and m/z values with the vectorized NumPy backend
+
+    samples : int
+        Number of deletions written to calibrate the projection
+
+    min_length : int
+        Shortest deletion to include
+
+    calculator : DeletionCalculator | None
+        Computes the masses and m/z values of the sample with its
+        adducts. Defaults to an uncached calculator.
+
+    window : MzWindow | None
+        Only count deletions and adduct lines inside this m/z window
+
+    Returns
+    -------
+    dict
+        deletions, adduct_lines, output_bytes and runtime_seconds
+    '''
+    if calculator is None:
+        calculator = DeletionCalculator(decimal_points=decimal_points, use_numpy=use_numpy, cache_size=0)
+
+    deletions = count_compositions(input_sequence, min_length)
+    sample = sample_compositions(input_sequence, samples, min_length=min_length)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        outfile = Path(tmp) / f'sample.{output_format}'
+
+        start = time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            write_adducts(input_sequence,
+                          sample,
+                          decimal_points=decimal_points,
+                          outfile=outfile,
+                          use_numpy=use_numpy,
+                          calculator=calculator,
+                          output_format=output_format,
+                          window=window)
+        elapsed = time() - start
+
+        sample_bytes = outfile.stat().st_size
+
+    scale = deletions / len(sample) if sample else 0
+    adduct_lines = deletions * len(calculator.adducts)
+    if window is not None:
+        kept = list(apply_window(calculator.masses(sample), window, calculator.adduct_table))
+        deletions = round(len(kept) * scale)
+        adduct_lines = round(sum(m_over_z is not None
+                                 for _, _, adduct_mzs in kept
+                                 for m_over_z in adduct_mzs) * scale)
+
+    return {'deletions': deletions,
+            'adduct_lines': adduct_lines,
+            'output_bytes': int(sample_bytes * scale),
+            'runtime_seconds': elapsed * scale}
+
+
+def print_estimate(input_sequence: str, estimate: dict) -> None:
+    '''
+    Prints an estimate from estimate_output.
+    '''
+    print(f'{input_sequence}')
+    print(f'Deletions: {estimate["deletions"]:,}')
+    print(f'Adduct lines: {estimate["adduct_lines"]:,}')
+    print(f'Estimated output size: {round(estimate["output_bytes"] / 1024 ** 2, 2)} MB')
+    print(f'Projected runtime: {round(estimate["runtime_seconds"], 2)} seconds\n')
+
+
+def check_budget(input_sequence: str,
+                 budget: int,
+                 force: bool = False,
+                 min_length: int = 0,
+                 ordered: bool = False) -> None:
+    '''
+    Refuses sequences with more unique deletions than the budget.
+
+    Parameters
+    ----------
+    input_sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    budget : int
+        Maximum number of unique deletions
+
+    force : bool
+        Only warn instead of raising when the budget is exceeded
+
+    min_length : int
+        Shortest deletion to include
+
+    ordered : bool
+        Count the distinct ordered deletions rather than the compositions
+
+    Raises
+    ------
+    SequenceError
+        The sequence exceeds the budget and force is False
+    '''
+    if ordered:
+        deletions = SubsequenceAutomaton(input_sequence).count(min_length)
+    else:
+        deletions = count_compositions(input_sequence, min_length)
+    if deletions <= budget:
+        return
+
+    kind = 'ordered deletions' if ordered else 'deletions'
+    message = f'{input_sequence} has {deletions:,} {kind}, above the budget of {budget:,}'
+    if not force:
+        raise SequenceError(f'{message}. Use --force to run it anyway')
+    print(f'Warning: {message}\n')
+
+
+def mz_window(args: argparse.Namespace) -> MzWindow | None:
+    '''
+    Returns the m/z window given by --mz-min, --mz-max and --charges, if any
+    '''
+    if args.mz_min is None and args.mz_max is None and args.charges is None:
+        return None
+
+    return MzWindow(mz_min=float('-inf') if args.mz_min is None else args.mz_min,
+                    mz_max=float('inf') if args.mz_max is None else args.mz_max,
+                    charges=None if args.charges is None else tuple(args.charges))
+
+
+def serve(args: argparse.Namespace, use_numpy: bool, library: Library = DEFAULT_LIBRARY) -> None:
+    '''
+    Runs the HTTP/JSON service of --serve until it is interrupted
+    '''
+    # Imported here as the server itself imports this module
+    from server import DeletionServer
+
+    server = DeletionServer(library,
+                            decimal_points=int(args.decimal_points),
+                            use_numpy=use_numpy,
+                            workers=args.workers,
+                            budget=args.budget)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print('Stopped serving')
+
+
+def read_sequences(args: argparse.Namespace,
+                   calculator: DeletionCalculator,
+                   profiler: StageProfiler = NULL_PROFILER) -> list[str]:
     '''
-    return next(key for key, value in THREE_LETTER_CODES.items() if value == monomer_one_letter)
+    Reads the sequences of --batch, or parses and verifies the --input sequence
+    '''
+    with profiler.stage('parse_input') as stage:
+        if args.batch_file is not None:
+            sequences = read_batch(args.batch_file, calculator.library)
+        else:
+            # Parse input list to accomodate multiletter codes
+            input_sequence = parse_input(args.input_sequence, calculator.library)
+
+            # Check to ensure sequence is legal
+            calculator.verify(input_sequence)
+
+            sequences = [input_sequence]
+
+        stage.items += sum(len(sequence) for sequence in sequences)
+
+    return sequences
+
+
+def run_query(args: argparse.Namespace,
+              input_sequence: str,
+              min_length: int,
+              calculator: DeletionCalculator,
+              profiler: StageProfiler = NULL_PROFILER) -> None:
+    '''
+    Matches the peaks of --query or --peaks against the m/z index of a sequence
+    '''
+    if args.index_file is None:
+        index = build_mz_index(input_sequence, min_length, profiler, calculator)
+    else:
+        index = open_mz_index(input_sequence, args.index_file, min_length, profiler, calculator)
+
+    if args.query is not None:
+        for peak in args.query:
+            matches = index.query(peak, args.tolerance, args.tolerance_unit)
+            print_peak_matches(peak, matches, calculator.decimal_points, calculator.library)
+    else:
+        write_annotations(index,
+                          read_peak_list(args.peak_file),
+                          args.tolerance,
+                          args.tolerance_unit,
+                          calculator.decimal_points,
+                          outfile=Path().cwd() / f'{input_sequence}_annotated.tsv',
+                          library=calculator.library)
+
+
+def run_legacy(args: argparse.Namespace,
+               input_sequence: str,
+               min_length: int,
+               calculator: DeletionCalculator,
+               window: MzWindow | None = None,
+               profiler: StageProfiler = NULL_PROFILER) -> None:
+    '''
+    Writes the deletions of a sequence with the original combination and
+    permutation filtering pipeline of --legacy
+    '''
+    with profiler.stage('enumeration') as stage:
+        possibilities = generate_deletion_possibilities(input_sequence)
+        stage.items += len(possibilities)
+
+    with profiler.stage('dedup') as stage:
+        deletions = [''.join(deletion)
+                     for deletion in filter_identical_sequences(possibilities, verbose=False)
+                     if len(deletion) >= min_length]
+        stage.items += len(deletions)
+
+    write_adducts(input_sequence,
+                  deletions,
+                  outfile=output_path(input_sequence, args.output_format),
+                  decimal_points=calculator.decimal_points,
+                  use_numpy=calculator.use_numpy,
+                  calculator=calculator,
+                  output_format=args.output_format,
+                  window=window,
+                  profiler=profiler)
+
+
+def run_ordered(args: argparse.Namespace,
+                input_sequence: str,
+                min_length: int,
+                calculator: DeletionCalculator,
+                window: MzWindow | None = None,
+                profiler: StageProfiler = NULL_PROFILER) -> None:
+    '''
+    Writes the ordered deletions of a sequence for --ordered, with the
+    fragment ladders of the adducts named by --fragments
+    '''
+    fragments = None
+    if args.fragments is not None:
+        fragment_adducts = [adduct for adduct in calculator.adducts if adduct.name in args.fragments]
+        if not fragment_adducts:
+            raise ValueError(f'No adduct named {", ".join(args.fragments)}')
+        fragments = compile_fragments(fragment_adducts, calculator.library.terminal_groups)
+
+    write_ordered(input_sequence,
+                  calculator.decimal_points,
+                  outfile=output_path(f'{input_sequence}_ordered', args.output_format),
+                  min_length=min_length,
+                  calculator=calculator,
+                  window=window,
+                  fragments=fragments,
+                  use_numpy=calculator.use_numpy,
+                  profiler=profiler)
+
+
+def run(args: argparse.Namespace,
+        sequences: list[str],
+        min_lengths: dict[str, int],
+        calculator: DeletionCalculator,
+        window: MzWindow | None = None,
+        result_cache=None,
+        profiler: StageProfiler = NULL_PROFILER) -> None:
+    '''
+    Runs the mode selected on the command line for the parsed sequences
+    '''
+    decimal_points, use_numpy = calculator.decimal_points, calculator.use_numpy
+
+    if args.estimate:
+        for sequence in sequences:
+            print_estimate(sequence, estimate_output(sequence,
+                                                     decimal_points,
+                                                     args.output_format,
+                                                     use_numpy,
+                                                     min_length=min_lengths[sequence],
+                                                     calculator=calculator,
+                                                     window=window))
+        return
+
+    for sequence in sequences:
+        check_budget(sequence, args.budget, args.force, min_lengths[sequence], args.ordered)
+
+    if args.batch_file is not None:
+        run_batch(sequences,
+                  decimal_points,
+                  use_numpy,
+                  args.workers,
+                  result_cache,
+                  args.output_format,
+                  args.max_deletions,
+                  args.min_length,
+                  window,
+                  profiler,
+                  calculator)
+        return
+
+    input_sequence = sequences[0]
+    min_length = min_lengths[input_sequence]
+
+    if args.query is not None or args.peak_file is not None:
+        run_query(args, input_sequence, min_length, calculator, profiler)
+
+    elif args.legacy:
+        run_legacy(args, input_sequence, min_length, calculator, window, profiler)
+
+    elif args.state_file is not None and is_compatible_state(state := read_state(args.state_file),
+                                                             decimal_points,
+                                                             args.output_format,
+                                                             window,
+                                                             calculator.library):
+        write_changes(input_sequence,
+                      state['sequence'],
+                      decimal_points=decimal_points,
+                      min_length=min_length,
+                      previous_min_length=state['min_length'],
+                      use_numpy=use_numpy,
+                      calculator=calculator,
+                      output_format=args.output_format,
+                      window=window,
+                      profiler=profiler)
+
+    elif args.ordered:
+        run_ordered(args, input_sequence, min_length, calculator, window, profiler)
+
+    else:
+        write_sequence(input_sequence,
+                       outfile=output_path(input_sequence, args.output_format),
+                       decimal_points=decimal_points,
+                       use_numpy=use_numpy,
+                       workers=args.workers,
+                       calculator=calculator,
+                       result_cache=result_cache,
+                       output_format=args.output_format,
+                       min_length=min_length,
+                       window=window,
+                       profiler=profiler)
+
+    if args.state_file is not None:
+        write_state(args.state_file,
+                    input_sequence,
+                    decimal_points,
+                    args.output_format,
+                    min_length,
+                    window,
+                    calculator.library)
 
 
 def main():
@@ -393,29 +2827,54 @@ def main():
 
     args = get_args()
 
-    # How precise do you want to get?
-    decimal_points = int(args.decimal_points)
+    if args.backend == 'numpy' and not vectorized.HAS_NUMPY:
+        raise ImportError('The numpy backend requires NumPy to be installed')
 
-    input_sequence = args.input_sequence
+    use_numpy = vectorized.HAS_NUMPY and args.backend != 'python'
 
-    # Parse input list to accomodate multiletter codes
-    input_sequence = parse_input(args.input_sequence)
+    library = load_library(args.monomer_file, args.adduct_file)
 
-    # Check to ensure sequence is legal
-    verify_sequence(input_sequence)
+    if args.serve:
+        serve(args, use_numpy, library)
+        return
 
-    possibilities = generate_deletion_possibilities(input_sequence)
+    profiler = StageProfiler(enabled=args.profile is not None)
+    profiler.start()
 
-    deletions = filter_identical_sequences(possibilities, verbose=False)
+    # Only batches reuse masses between sequences, a single sequence is streamed uncached
+    calculator = DeletionCalculator(library,
+                                    decimal_points=int(args.decimal_points),
+                                    use_numpy=use_numpy,
+                                    cache_size=0 if args.batch_file is None else args.mass_cache_size)
 
-    write_adducts(input_sequence,
-                  deletions,
-                  outfile=Path().cwd() / f'{input_sequence}.txt',
-                  decimal_points=decimal_points)
+    result_cache = None
+    if args.cache_dir is not None:
+        result_cache = open_cache(args.cache_dir, args.cache_backend, args.cache_size)
+
+    # When the profile report is printed, stdout only carries the JSON
+    # and the status lines go to stderr
+    status = sys.stderr if args.profile == '-' else sys.stdout
+
+    with contextlib.redirect_stdout(status):
+        sequences = read_sequences(args, calculator, profiler)
+
+        # Shortest deletion of each sequence
+        min_lengths = {sequence: minimum_length(sequence, args.max_deletions, args.min_length)
+                       for sequence in sequences}
+
+        run(args, sequences, min_lengths, calculator, mz_window(args), result_cache, profiler)
+
+    if args.profile is not None:
+        profiler.stop()
+        write_report(profiler.report(sequences=sequences,
+                                     backend='numpy' if use_numpy else 'python',
+                                     workers=args.workers,
+                                     output_format=args.output_format),
+                     args.profile)
 
     t2 = time()
 
-    print(f'Completed sequence deletion calculator in {round(t2 - t1, 2)} seconds')
+    print(f'Completed sequence deletion calculator in {round(t2 - t1, 2)} seconds', file=status)
 
 
 if __name__ == "__main__":
@@ -10,6 +10,8 @@ Contains adduct definitions
 
 from dataclasses import dataclass
 
+from fixedpoint import to_micro
+
 # Data class to contain mass spec adduct information
 @dataclass
 class Adduct:
@@ -19,6 +21,93 @@ class Adduct:
     charge: str
     mass: float
 
+# Data class to contain adducts compiled for fast formatting
+@dataclass
+class AdductTable:
+    '''Dataclass for holding numeric adduct columns built once from a list of adducts'''
+    charges: list[int]
+    masses: list[float]
+    micro_masses: list[int]
+    prefixes: list[str]
+
+
+def compile_adducts(adducts: list[Adduct]) -> AdductTable:
+    '''
+    Converts adducts into parallel lists of integer charges, masses, masses
+    in micro-daltons and the 'CHARGE\tTERMINUS\tNAME\t' prefix of their
+    lines in the text report.
+    '''
+    charges = [int(adduct.charge) for adduct in adducts]
+    return AdductTable(charges=charges,
+                       masses=[adduct.mass for adduct in adducts],
+                       micro_masses=[to_micro(adduct.mass) for adduct in adducts],
+                       prefixes=[f'{charge}\t{adduct.terminus}\t{adduct.name:<16}\t'
+                                 for charge, adduct in zip(charges, adducts)])
+
+# Monoisotopic masses of the terminal groups named in Adduct.terminus.
+# Every monomer residue ends in -O-C(=O)-, so the C-terminal alcohol
+# replaces that CO2 with OH and the trifluoroacetate adds CF3 to it.
+TERMINAL_GROUPS = {'N-Fmoc': 223.07590,  # C15H11O2
+                   'N-Ac': 43.01839,     # C2H3O
+                   'OH': -26.98709,      # OH - CO2
+                   'OCF3': 68.99521}     # CF3
+
+
+def split_terminus(adduct: Adduct) -> tuple[str, str]:
+    '''
+    Returns the names of the N- and C-terminal groups of an adduct,
+    read from its 'N-TERMINUS, C-TERMINUS' terminus.
+    '''
+    n_terminus, _, c_terminus = adduct.terminus.partition(', ')
+    return n_terminus, c_terminus
+
+
+def terminal_groups(adduct: Adduct, groups: dict[str, float] = TERMINAL_GROUPS) -> tuple[float, float]:
+    '''
+    Returns the masses of the N- and C-terminal groups of an adduct,
+    looked up in groups by the names in its terminus.
+    '''
+    n_terminus, c_terminus = split_terminus(adduct)
+    for group in (n_terminus, c_terminus):
+        if group not in groups:
+            raise ValueError(f'Unknown terminal group {group!r} of adduct {adduct.name} ({adduct.terminus})')
+    return groups[n_terminus], groups[c_terminus]
+
+# Data class to contain the m/z window scanned by the instrument
+@dataclass
+class MzWindow:
+    '''Dataclass for holding an m/z range and the adduct charges of interest'''
+    mz_min: float = float('-inf')
+    mz_max: float = float('inf')
+    charges: tuple[int, ...] | None = None
+
+    def allows(self, charge: int, m_over_z: float) -> bool:
+        '''
+        True if an adduct line of this charge and m/z is inside the window
+        '''
+        if self.charges is not None and charge not in self.charges:
+            return False
+        return self.mz_min <= m_over_z <= self.mz_max
+
+    def mass_range(self, adducts: list[Adduct], decimal_points: int | None = None) -> tuple[float, float]:
+        '''
+        Range of deletion masses for which at least one allowed adduct can
+        fall inside the window. Every adduct m/z, (mass + adduct.mass) / |charge|,
+        increases with the deletion mass, so deletions outside this range
+        can be discarded before they are built. The window is compared with
+        m/z values rounded to decimal_points, so the range is then widened
+        by one unit of the last decimal place on each side.
+        '''
+        margin = 0 if decimal_points is None else 10 ** -decimal_points
+        bounds = [((self.mz_min - margin) * abs(int(adduct.charge)) - adduct.mass,
+                   (self.mz_max + margin) * abs(int(adduct.charge)) - adduct.mass)
+                  for adduct in adducts
+                  if self.charges is None or int(adduct.charge) in self.charges]
+
+        if not bounds:
+            return float('inf'), float('-inf')
+        return min(lo for lo, _ in bounds), max(hi for _, hi in bounds)
+
 # Define adducts of interest by specify a name, teminus
 # charge, and mass.
 # KEEP ADDUCT NAMES TO LESS THAN OR EQUAL TO 30 CHARACTERS.
@@ -215,3 +304,6 @@ ADDUCTS = [Adduct(charge="+1",
                   name="+TFA-H+",
                   mass=224.99919),
            ]
+
+# Adduct charges, masses and line prefixes, compiled once
+ADDUCT_TABLE = compile_adducts(ADDUCTS)
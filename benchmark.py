@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+# This software is licensed under the MIT License.
+# See the LICENSE file for more information.
+
+'''
+Offline benchmark of the deletion pipeline on synthetic sequences
+'''
+
+import io
+import sys
+import json
+import random
+import argparse
+import tempfile
+import contextlib
+
+from time import perf_counter
+from pathlib import Path
+
+import vectorized
+
+from monomers import ONE_LETTER_CODE_MASS_PAIRS
+from profiling import StageProfiler
+from SequenceDeletionCalculator import (count_compositions,
+                                        filter_identical_sequences,
+                                        generate_deletion_possibilities,
+                                        write_adducts,
+                                        write_sequence)
+
+DESCRIPTION = 'Benchmarks the deletion pipeline and compares it against a baseline'
+
+# Monomers available to the synthetic sequences
+MONOMERS = list(ONE_LETTER_CODE_MASS_PAIRS)
+
+# Number of distinct monomers drawn by each repetition pattern
+PATTERNS = {'distinct': len(MONOMERS), 'mixed': 5, 'repeated': 2}
+
+DEFAULT_LENGTHS = [8, 12, 16, 20, 25, 30]
+
+
+def synthetic_sequence(length: int, pattern: str, seed: int = 0) -> str:
+    '''
+    Builds a reproducible sequence of 1-letter codes.
+
+    distinct cycles through every monomer so that no monomer repeats until
+    all have been used, while mixed and repeated draw at random from the
+    first 5 and 2 monomers respectively.
+
+    Parameters
+    ----------
+    length : int
+        Number of monomers
+
+    pattern : str
+        One of PATTERNS
+
+    seed : int
+        Seed of the random draws
+
+    Returns
+    -------
+    str
+        Sequence of 1-letter codes
+    '''
+    if pattern == 'distinct':
+        return ''.join(MONOMERS[i % len(MONOMERS)] for i in range(length))
+
+    rng = random.Random(f'{seed}|{length}|{pattern}')
+    return ''.join(rng.choice(MONOMERS[:PATTERNS[pattern]]) for _ in range(length))
+
+
+def deletion_limit(sequence: str, max_deletions: int) -> int:
+    '''
+    Returns the smallest minimum deletion length that keeps the number of
+    deletions of a sequence within max_deletions, so that long sequences
+    are benchmarked on the deletions missing the fewest monomers.
+    '''
+    for min_length in range(len(sequence) + 1):
+        if count_compositions(sequence, min_length) <= max_deletions:
+            return min_length
+    return len(sequence)
+
+
+def run_case(sequence: str,
+             decimal_points: int = 3,
+             use_numpy: bool = False,
+             min_length: int = 0,
+             legacy: bool = False,
+             repeat: int = 3) -> dict:
+    '''
+    Benchmarks one sequence.
+
+    The end-to-end time is the best of repeat unprofiled runs. The stage
+    breakdown and peak memory come from one further run under the
+    StageProfiler, whose memory tracing slows the run down.
+
+    Parameters
+    ----------
+    sequence : str
+        Sequence of 1-letter codes
+
+    decimal_points : int
+        The number of decimal points to which the masses are rounded.
+
+    use_numpy : bool
+        Compute masses and m/z values with the vectorized NumPy backend
+
+    min_length : int
+        Shortest deletion to write
+
+    legacy : bool
+        Run the original combination and permutation filtering pipeline
+
+    repeat : int
+        Number of end-to-end runs
+
+    Returns
+    -------
+    dict
+        Deletions, end-to-end time and throughput, peak memory and stages
+    '''
+    deletions = count_compositions(sequence, min_length)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        outfile = Path(tmp) / f'{sequence}.txt'
+
+        def run(profiler: StageProfiler) -> None:
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                if legacy:
+                    with profiler.stage('enumeration') as stage:
+                        possibilities = generate_deletion_possibilities(sequence)
+                        stage.items += len(possibilities)
+
+                    with profiler.stage('dedup') as stage:
+                        unique = [''.join(d) for d in filter_identical_sequences(possibilities)
+                                  if len(d) >= min_length]
+                        stage.items += len(unique)
+
+                    write_adducts(sequence,
+                                  unique,
+                                  decimal_points=decimal_points,
+                                  outfile=outfile,
+                                  use_numpy=use_numpy,
+                                  profiler=profiler)
+                else:
+                    write_sequence(sequence,
+                                   outfile=outfile,
+                                   decimal_points=decimal_points,
+                                   use_numpy=use_numpy,
+                                   min_length=min_length,
+                                   profiler=profiler)
+
+        timings = []
+        for _ in range(repeat):
+            start = perf_counter()
+            run(StageProfiler(enabled=False))
+            timings.append(perf_counter() - start)
+
+        profiler = StageProfiler()
+        profiler.start()
+        run(profiler)
+        profiler.stop()
+        report = profiler.report()
+
+        output_bytes = outfile.stat().st_size
+
+    best = min(timings)
+    return {'sequence': sequence,
+            'min_length': min_length,
+            'legacy': legacy,
+            'deletions': deletions,
+            'output_bytes': output_bytes,
+            'end_to_end_seconds': best,
+            'deletions_per_second': deletions / best if best > 0 else 0.0,
+            'peak_memory_bytes': report['peak_memory_bytes'],
+            'stages': report['stages']}
+
+
+def run_benchmark(lengths: list[int],
+                  patterns: list[str],
+                  max_deletions: int = 50000,
+                  legacy_max_length: int = 14,
+                  use_numpy: bool = False,
+                  repeat: int = 3,
+                  seed: int = 0) -> dict:
+    '''
+    Benchmarks every combination of length and repetition pattern.
+
+    Cases with more than max_deletions deletions only include the deletions
+    missing the fewest monomers, see deletion_limit. The legacy pipeline
+    walks every subsequence, so it is only run up to legacy_max_length.
+
+    Returns
+    -------
+    dict
+        Benchmark results keyed by case name
+    '''
+    cases = {}
+    for pattern in patterns:
+        for length in lengths:
+            sequence = synthetic_sequence(length, pattern, seed)
+            min_length = deletion_limit(sequence, max_deletions)
+
+            name = f'{pattern}-{length}'
+            print(f'{name}: {sequence}', file=sys.stderr)
+            cases[name] = run_case(sequence,
+                                   use_numpy=use_numpy,
+                                   min_length=min_length,
+                                   repeat=repeat)
+
+            if length <= legacy_max_length:
+                print(f'{name}-legacy: {sequence}', file=sys.stderr)
+                cases[f'{name}-legacy'] = run_case(sequence,
+                                                   use_numpy=use_numpy,
+                                                   min_length=min_length,
+                                                   legacy=True,
+                                                   repeat=repeat)
+
+    return {'backend': 'numpy' if use_numpy else 'python',
+            'python': sys.version.split()[0],
+            'cases': cases}
+
+
+def compare(results: dict, baseline: dict, threshold: float = 0.2) -> list[str]:
+    '''
+    Compares benchmark results against a baseline.
+
+    A case regresses when its throughput drops, or its peak memory grows,
+    by more than threshold relative to the baseline. Cases missing from
+    either side are ignored.
+
+    Parameters
+    ----------
+    results : dict
+        Output of run_benchmark
+
+    baseline : dict
+        Output of an earlier run_benchmark
+
+    threshold : float
+        Allowed relative change, i.e. 0.2 for 20%
+
+    Returns
+    -------
+    list[str]
+        Description of each regression
+    '''
+    regressions = []
+    for name, case in results['cases'].items():
+        reference = baseline['cases'].get(name)
+        if reference is None:
+            continue
+
+        if case['deletions_per_second'] < reference['deletions_per_second'] * (1 - threshold):
+            regressions.append(f'{name}: {case["deletions_per_second"]:,.0f} deletions/s, '
+                               f'baseline {reference["deletions_per_second"]:,.0f}')
+
+        if case['peak_memory_bytes'] > reference['peak_memory_bytes'] * (1 + threshold):
+            regressions.append(f'{name}: {case["peak_memory_bytes"]:,} bytes peak memory, '
+                               f'baseline {reference["peak_memory_bytes"]:,}')
+
+    return regressions
+
+
+def print_results(results: dict) -> None:
+    '''
+    Prints one line per benchmark case
+    '''
+    print(f'{"CASE":<20}{"DELETIONS":>12}{"SECONDS":>10}{"DEL/S":>12}{"PEAK MB":>10}  SLOWEST STAGE')
+    for name, case in results['cases'].items():
+        slowest = max(case['stages'].items(), key=lambda item: item[1]['wall_seconds'], default=('', None))[0]
+        print(f'{name:<20}{case["deletions"]:>12,}{case["end_to_end_seconds"]:>10.3f}'
+              f'{case["deletions_per_second"]:>12,.0f}{case["peak_memory_bytes"] / 1024 ** 2:>10.2f}  {slowest}')
+
+
+def get_args():
+    '''
+    Parses CLI arguments
+    '''
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+
+    parser.add_argument('--lengths',
+                        metavar='\b',
+                        help='Sequence lengths to benchmark',
+                        nargs='+',
+                        type=int,
+                        default=DEFAULT_LENGTHS,
+                        dest='lengths')
+
+    parser.add_argument('--patterns',
+                        metavar='\b',
+                        help=f'Repetition patterns to benchmark, any of {", ".join(PATTERNS)}',
+                        nargs='+',
+                        choices=list(PATTERNS),
+                        default=list(PATTERNS),
+                        dest='patterns')
+
+    parser.add_argument('--max-deletions',
+                        metavar='\b',
+                        help='Largest number of deletions written per case',
+                        type=int,
+                        default=50000,
+                        dest='max_deletions')
+
+    parser.add_argument('--legacy-max-length',
+                        metavar='\b',
+                        help='Longest sequence run through the legacy pipeline',
+                        type=int,
+                        default=14,
+                        dest='legacy_max_length')
+
+    parser.add_argument('--backend',
+                        help='Mass and m/z backend',
+                        choices=['auto', 'python', 'numpy'],
+                        default='auto',
+                        dest='backend')
+
+    parser.add_argument('--repeat',
+                        metavar='\b',
+                        help='Number of end-to-end runs per case, the best is kept',
+                        type=int,
+                        default=3,
+                        dest='repeat')
+
+    parser.add_argument('-o',
+                        '--output',
+                        metavar='\b',
+                        help='Write the results as JSON to this file',
+                        type=Path,
+                        default=None,
+                        dest='output')
+
+    parser.add_argument('--baseline',
+                        metavar='\b',
+                        help='Baseline JSON to compare against',
+                        type=Path,
+                        default=None,
+                        dest='baseline')
+
+    parser.add_argument('--threshold',
+                        metavar='\b',
+                        help='Allowed relative throughput drop or memory growth (default 0.2)',
+                        type=float,
+                        default=0.2,
+                        dest='threshold')
+
+    return parser.parse_args()
+
+
+def main():
+    '''
+    Main function
+    '''
+    args = get_args()
+
+    if args.backend == 'numpy' and not vectorized.HAS_NUMPY:
+        raise ImportError('The numpy backend requires NumPy to be installed')
+
+    results = run_benchmark(args.lengths,
+                            args.patterns,
+                            max_deletions=args.max_deletions,
+                            legacy_max_length=args.legacy_max_length,
+                            use_numpy=vectorized.HAS_NUMPY and args.backend != 'python',
+                            repeat=args.repeat)
+
+    print_results(results)
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as o:
+            json.dump(results, o, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+
+        if regressions:
+            sys.exit(1)
+
+        print(f'No regressions against {args.baseline}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+# This software is licensed under the MIT License.
+# See the LICENSE file for more information.
+
+'''
+Persistent on-disk cache of deletion files
+'''
+
+import os
+import shutil
+import sqlite3
+import hashlib
+
+from time import time
+from pathlib import Path
+
+from fixedpoint import SCALE
+from library import DEFAULT_LIBRARY, Library
+
+
+def table_hash(library: Library = DEFAULT_LIBRARY) -> str:
+    '''
+    Content hash of the monomer and adduct definitions of a library. Any
+    edit to monomers.py or adducts.py, or loading other libraries with
+    --monomers or --adducts, changes the hash and so every cache key.
+
+    Returns
+    -------
+    str
+        Hex digest of the definitions
+    '''
+    return library.hash
+
+
+def cache_key(input_sequence: str,
+              decimal_points: int,
+              output_format: str = 'txt',
+              min_length: int = 0,
+              window=None,
+              library: Library = DEFAULT_LIBRARY) -> str:
+    '''
+    Builds the cache key of a deletion file.
+
+    The deletions only depend on the composition of the sequence, but the
+    Missing lines list monomers in the order they first appear in the
+    sequence, so that order is part of the key as well.
+    Masses are rounded from micro-daltons, so the scale of the fixed-point
+    masses is part of the key too.
+
+    Parameters
+    ----------
+    input_sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    decimal_points : int
+        The number of decimal points to which the masses are rounded.
+
+    output_format : str
+        Format of the deletion file
+
+    min_length : int
+        Shortest deletion in the file
+
+    window : MzWindow | None
+        m/z window applied to the file
+
+    library : Library
+        Monomer and adduct definitions the file was written with
+
+    Returns
+    -------
+    str
+        Hex digest identifying the deletion file
+    '''
+    composition = ''.join(sorted(input_sequence))
+    first_seen = ''.join(dict.fromkeys(input_sequence))
+    key = f'{composition}|{first_seen}|{decimal_points}|{output_format}|{min_length}|{window}|{table_hash(library)}|{SCALE}'
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class DirectoryCache:
+    '''
+    Stores each cached file in a directory, using the file modification
+    time to evict the least recently used entries.
+
+    Parameters
+    ----------
+    path : Path
+        Cache directory, created if needed
+
+    max_bytes : int
+        Maximum total size of the cached files
+    '''
+
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def get_file(self, key: str, outfile: Path) -> bool:
+        '''
+        Copies a cached file to outfile.
+
+        Returns
+        -------
+        bool
+            True if the key was in the cache
+        '''
+        entry = self.path / key
+        if not entry.is_file():
+            return False
+
+        shutil.copyfile(entry, outfile)
+        os.utime(entry)
+        return True
+
+    def put_file(self, key: str, infile: Path) -> None:
+        '''
+        Adds a copy of infile to the cache and evicts
+        the least recently used entries above the size cap.
+        '''
+        if os.path.getsize(infile) > self.max_bytes:
+            return
+
+        # Copy under a temporary name so readers never see a partial entry
+        partial = self.path / f'{key}.partial'
+        shutil.copyfile(infile, partial)
+        os.replace(partial, self.path / key)
+
+        self._evict()
+
+    def _evict(self) -> None:
+        '''
+        Removes the least recently used entries until the cache fits
+        '''
+        entries = sorted((entry.stat().st_mtime, entry.stat().st_size, entry)
+                         for entry in self.path.iterdir()
+                         if entry.is_file() and entry.suffix != '.partial')
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            entry.unlink()
+            total -= size
+
+
+class SQLiteCache:
+    '''
+    Stores cached files as rows of an SQLite database,
+    evicting the least recently used rows.
+
+    Parameters
+    ----------
+    path : Path
+        Cache directory, created if needed. The database is cache.sqlite3
+        inside it.
+
+    max_bytes : int
+        Maximum total size of the cached files
+    '''
+
+    def __init__(self, path: Path, max_bytes: int):
+        Path(path).mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.connection = sqlite3.connect(Path(path) / 'cache.sqlite3')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS entries ('
+                                'key TEXT PRIMARY KEY, '
+                                'data BLOB NOT NULL, '
+                                'size INTEGER NOT NULL, '
+                                'last_used REAL NOT NULL)')
+        self.connection.commit()
+
+    def get_file(self, key: str, outfile: Path) -> bool:
+        '''
+        Writes a cached file to outfile.
+
+        Returns
+        -------
+        bool
+            True if the key was in the cache
+        '''
+        row = self.connection.execute('SELECT data FROM entries WHERE key = ?',
+                                      (key,)).fetchone()
+        if row is None:
+            return False
+
+        with open(outfile, 'wb') as o:
+            o.write(row[0])
+
+        with self.connection:
+            self.connection.execute('UPDATE entries SET last_used = ? WHERE key = ?',
+                                    (time(), key))
+        return True
+
+    def put_file(self, key: str, infile: Path) -> None:
+        '''
+        Adds the contents of infile to the cache and evicts
+        the least recently used rows above the size cap.
+        '''
+        size = os.path.getsize(infile)
+        if size > self.max_bytes:
+            return
+
+        with open(infile, 'rb') as f:
+            data = f.read()
+
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                                    (key, data, size, time()))
+            self._evict()
+
+    def _evict(self) -> None:
+        '''
+        Removes the least recently used rows until the cache fits
+        '''
+        total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        rows = self.connection.execute('SELECT key, size FROM entries ORDER BY last_used')
+
+        for key, size in rows.fetchall():
+            if total <= self.max_bytes:
+                break
+            self.connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total -= size
+
+
+def open_cache(path: Path, backend: str = 'files', max_megabytes: float = 1024):
+    '''
+    Opens a result cache.
+
+    Parameters
+    ----------
+    path : Path
+        Cache directory
+
+    backend : str
+        'files' or 'sqlite'
+
+    max_megabytes : float
+        Size cap of the cache in megabytes
+
+    Returns
+    -------
+    DirectoryCache | SQLiteCache
+        The opened cache
+    '''
+    max_bytes = int(max_megabytes * 1024 * 1024)
+    if backend == 'sqlite':
+        return SQLiteCache(path, max_bytes)
+    return DirectoryCache(path, max_bytes)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+# This software is licensed under the MIT License.
+# See the LICENSE file for more information.
+
+'''
+Fixed-point masses held as integer micro-daltons
+'''
+
+from math import ceil, floor, isinf
+
+# Micro-daltons per dalton
+SCALE = 10 ** 6
+
+
+def to_micro(mass: float) -> int:
+    '''
+    Converts a mass in daltons to the nearest integer micro-dalton
+    '''
+    return round(mass * SCALE)
+
+
+def micro_range(mass_range: tuple[float, float]) -> tuple[float, float]:
+    '''
+    Widens a range of masses in daltons to whole micro-daltons. Infinite
+    bounds, including those of the empty range (inf, -inf), are kept.
+    '''
+    lo, hi = mass_range
+    return (lo if isinf(lo) else floor(lo * SCALE),
+            hi if isinf(hi) else ceil(hi * SCALE))
+
+
+def rounding(decimal_points: int, divisor: int = 1) -> tuple[int, int, int]:
+    '''
+    Integer constants for rounding micro-daltons divided by divisor to
+    decimal_points, half away from zero, without going through a float.
+
+    Returns
+    -------
+    tuple[int, int, int]
+        (factor, denominator, power) such that the rounded value of a
+        non-negative micro is (micro * factor + denominator // 2) // denominator / power
+    '''
+    factor = 2 * 10 ** max(0, decimal_points - 6)
+    denominator = 2 * abs(divisor) * 10 ** max(0, 6 - decimal_points)
+    return factor, denominator, 10 ** decimal_points
+
+
+def from_micro(micro: int, decimal_points: int = 6, divisor: int = 1) -> float:
+    '''
+    Converts micro-daltons, divided by divisor, to a float rounded
+    to decimal_points. The rounding is exact, so a value half way
+    between two decimals is always rounded away from zero.
+
+    Example
+    -------
+    from_micro(789365500, 3) returns 789.366, where round(789.3655, 3)
+    returns 789.365 as the nearest float is just below 789.3655.
+    '''
+    factor, denominator, power = rounding(decimal_points, divisor)
+    rounded = (abs(micro) * factor + denominator // 2) // denominator / power
+    return rounded if micro >= 0 else -rounded
+
+
+def round_m_over_z(m_over_z: float, charge: int, decimal_points: int) -> float:
+    '''
+    Rounds an m/z value computed as micro-daltons divided by the charge,
+    such as those of MzIndex, the same way as from_micro. The micro-daltons
+    are recovered exactly before rounding, so a peak match shows the same
+    m/z as the deletion file.
+    '''
+    return from_micro(round(m_over_z * abs(charge) * SCALE), decimal_points, charge)
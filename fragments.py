@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+# This software is licensed under the MIT License.
+# See the LICENSE file for more information.
+
+'''
+N- and C-terminal fragment ion ladders of ordered deletions
+'''
+
+from dataclasses import dataclass
+
+import vectorized
+
+from adducts import TERMINAL_GROUPS, Adduct, split_terminus, terminal_groups
+from fixedpoint import rounding, to_micro
+
+np = vectorized.np
+
+
+# Data class to contain the fragment ions of a list of adducts
+@dataclass
+class FragmentTable:
+    '''Dataclass for holding numeric fragment ion columns built once from a list of adducts'''
+    n_offsets: list[int]
+    n_charges: list[int]
+    n_prefixes: list[str]
+    c_offsets: list[int]
+    c_charges: list[int]
+    c_prefixes: list[str]
+
+
+def compile_fragments(adducts: list[Adduct],
+                      groups: dict[str, float] = TERMINAL_GROUPS) -> FragmentTable:
+    '''
+    Converts adducts into the offsets of their fragment ions.
+
+    An N-terminal fragment keeps the N-terminal group and the ion of the
+    adduct but loses the C-terminal group, and a C-terminal fragment the
+    other way around, so each offset is the adduct mass minus the terminal
+    group at the far end, in micro-daltons. Adducts sharing
+    the near terminal group, ion and charge give the same fragments, which
+    are only kept for the first of them.
+
+    Parameters
+    ----------
+    adducts : list[Adduct]
+        Adducts whose fragment ions are computed
+
+    groups : dict[str, float]
+        Masses of the terminal groups named in Adduct.terminus,
+        see Library.terminal_groups
+
+    Returns
+    -------
+    FragmentTable
+        Offsets added to the prefix and suffix masses, charges and the
+        'CHARGE\tTERMINUS\tNAME\t' prefix of each distinct fragment ion,
+        where TERMINUS is the terminal group the fragment keeps
+    '''
+    n_ions, c_ions = {}, {}
+    for adduct in adducts:
+        n_terminus, c_terminus = split_terminus(adduct)
+        n_group, c_group = terminal_groups(adduct, groups)
+        charge = int(adduct.charge)
+
+        n_ions.setdefault((n_terminus, adduct.name, charge), to_micro(adduct.mass - c_group))
+        c_ions.setdefault((c_terminus, adduct.name, charge), to_micro(adduct.mass - n_group))
+
+    return FragmentTable(n_offsets=list(n_ions.values()),
+                         n_charges=[charge for _, _, charge in n_ions],
+                         n_prefixes=[f'{charge}\t{terminus}\t{name:<16}\t' for terminus, name, charge in n_ions],
+                         c_offsets=list(c_ions.values()),
+                         c_charges=[charge for _, _, charge in c_ions],
+                         c_prefixes=[f'{charge}\t{terminus}\t{name:<16}\t' for terminus, name, charge in c_ions])
+
+
+def fragment_ladders(prefix_masses: list[list[int]],
+                     table: FragmentTable,
+                     decimal_points: int,
+                     use_numpy: bool = False) -> list[tuple[list[list[float]], list[list[float]]]]:
+    '''
+    Computes the fragment ladders of ordered deletions of the same length.
+
+    Fragment i of the N-terminal ladder holds the first i monomers and
+    fragment i of the C-terminal ladder the last i monomers, for i from 1
+    to one less than the deletion length. Both come from the cumulative
+    prefix masses: a suffix mass is the total mass minus the prefix before
+    it. The masses are integer micro-daltons and the m/z values are rounded
+    with integer arithmetic, so both paths give the same ladders. With
+    NumPy, the ladders of every deletion are built in one broadcast
+    against the fragment ions.
+
+    Parameters
+    ----------
+    prefix_masses : list[list[int]]
+        Cumulative masses in micro-daltons of the first 1, 2, ... monomers
+        of each deletion, as generated by SubsequenceAutomaton.ordered_masses
+
+    table : FragmentTable
+        Adducts of the fragment ions
+
+    decimal_points : int
+        The number of decimal points to which the m/z values will be rounded.
+
+    use_numpy : bool
+        Compute the ladders with NumPy
+
+    Returns
+    -------
+    list[tuple[list[list[float]], list[list[float]]]]
+        (N-terminal ladder, C-terminal ladder) of each deletion, each
+        holding the m/z of every fragment ion of table for fragments 1, 2, ...
+    '''
+    # Deletions of fewer than 2 monomers have no fragments
+    if not prefix_masses or len(prefix_masses[0]) < 2:
+        return [([], []) for _ in prefix_masses]
+
+    # Offsets and integer rounding constants of each ion, see fixedpoint.rounding
+    n_adducts = [(offset, factor, denominator // 2, denominator, power)
+                 for offset, charge in zip(table.n_offsets, table.n_charges)
+                 for factor, denominator, power in [rounding(decimal_points, charge)]]
+    c_adducts = [(offset, factor, denominator // 2, denominator, power)
+                 for offset, charge in zip(table.c_offsets, table.c_charges)
+                 for factor, denominator, power in [rounding(decimal_points, charge)]]
+
+    if use_numpy:
+        sums = np.array(prefix_masses, dtype=np.int64)
+        prefixes = sums[:, :-1]
+        suffixes = (sums[:, -1:] - prefixes)[:, ::-1]
+
+        tables = []
+        for masses, ions in ((prefixes, n_adducts), (suffixes, c_adducts)):
+            offsets, factors, halves, denominators, powers = np.array(ions, dtype=np.int64).reshape(-1, 5).T
+            tables.append((np.abs(masses[:, :, None] + offsets) * factors + halves) // denominators / powers)
+
+        n_table, c_table = tables
+        return list(zip(n_table.tolist(), c_table.tolist()))
+
+    ladders = []
+    for sums in prefix_masses:
+        total = sums[-1]
+        prefixes = sums[:-1]
+        suffixes = [total - mass for mass in reversed(prefixes)]
+        ladders.append(([[(abs(mass + offset) * factor + half) // denominator / power
+                          for offset, factor, half, denominator, power in n_adducts]
+                         for mass in prefixes],
+                        [[(abs(mass + offset) * factor + half) // denominator / power
+                          for offset, factor, half, denominator, power in c_adducts]
+                         for mass in suffixes]))
+    return ladders
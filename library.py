@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+# This software is licensed under the MIT License.
+# See the LICENSE file for more information.
+
+'''
+Loads monomer and adduct libraries from JSON or CSV files
+'''
+
+import csv
+import json
+import hashlib
+
+from pathlib import Path
+from dataclasses import asdict, dataclass
+
+import adducts as adduct_definitions
+import monomers as monomer_definitions
+
+from adducts import TERMINAL_GROUPS, Adduct, AdductTable, compile_adducts, split_terminus
+from fixedpoint import to_micro
+from monomers import multiletter_codes
+from utils import LibraryError
+
+# Index of unknown codes in Library.indexes
+UNKNOWN_MONOMER = 255
+
+
+# Data class to contain a library compiled for fast lookups
+@dataclass
+class Library:
+    '''Dataclass for holding monomers and adducts compiled into index-based arrays'''
+    codes: list[str]
+    masses: list[float]
+    micro_masses: list[int]
+    indexes: bytes
+    names: dict[str, str]
+    multiletter_codes: dict[str, str]
+    adducts: list[Adduct]
+    adduct_table: AdductTable
+    terminal_groups: dict[str, float]
+    hash: str
+
+    @property
+    def monomer_masses(self) -> dict[str, float]:
+        '''1-letter codes mapped to their masses, in monomer index order'''
+        return dict(zip(self.codes, self.masses))
+
+    def encode(self, sequence: str) -> bytes:
+        '''
+        Converts 1-letter codes to their monomer indexes, one byte per
+        monomer, with UNKNOWN_MONOMER for codes not in the library
+        '''
+        return sequence.encode('ascii', 'replace').translate(self.indexes)
+
+
+def library_hash(monomer_masses: dict[str, float],
+                 three_letter_codes: dict[str, str],
+                 adducts: list[Adduct]) -> str:
+    '''
+    Content hash of monomer and adduct definitions. Any edit to the
+    definitions changes the hash and so every cache key built from it.
+
+    Returns
+    -------
+    str
+        Hex digest of the definitions
+    '''
+    tables = repr((sorted(monomer_masses.items()),
+                   sorted(three_letter_codes.items()),
+                   [asdict(adduct) for adduct in adducts]))
+    return hashlib.sha256(tables.encode('utf-8')).hexdigest()
+
+
+def compile_library(monomer_masses: dict[str, float],
+                    three_letter_codes: dict[str, str],
+                    adducts: list[Adduct],
+                    terminal_groups: dict[str, float] = TERMINAL_GROUPS) -> Library:
+    '''
+    Compiles monomer and adduct definitions into a Library.
+
+    Parameters
+    ----------
+    monomer_masses : dict[str, float]
+        1-letter codes and their masses
+
+    three_letter_codes : dict[str, str]
+        3-letter codes and the 1-letter codes they stand for
+
+    adducts : list[Adduct]
+        Adducts to apply to each deletion
+
+    terminal_groups : dict[str, float]
+        Masses of the terminal groups named in Adduct.terminus, used for
+        fragment ions. They do not change any deletion file or m/z index,
+        so they are not part of the hash.
+
+    Returns
+    -------
+    Library
+        Compiled library stamped with the hash of its definitions
+    '''
+    codes = list(monomer_masses)
+
+    indexes = bytearray([UNKNOWN_MONOMER]) * 256
+    for index, code in enumerate(codes):
+        indexes[ord(code)] = index
+
+    return Library(codes=codes,
+                   masses=list(monomer_masses.values()),
+                   micro_masses=[to_micro(mass) for mass in monomer_masses.values()],
+                   indexes=bytes(indexes),
+                   names=dict(three_letter_codes),
+                   multiletter_codes=multiletter_codes(three_letter_codes, codes),
+                   adducts=list(adducts),
+                   adduct_table=compile_adducts(adducts),
+                   terminal_groups=dict(terminal_groups),
+                   hash=library_hash(monomer_masses, three_letter_codes, adducts))
+
+
+def _read_rows(path: Path) -> list[dict]:
+    '''
+    Reads a JSON list of objects, or a CSV file with a header row
+    '''
+    path = Path(path)
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.suffix.lower() == '.json':
+            try:
+                rows = json.load(f)
+            except json.JSONDecodeError as e:
+                raise LibraryError(f'{path} is not valid JSON: {e}') from None
+        else:
+            rows = list(csv.DictReader(f))
+
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise LibraryError(f'{path} must hold a list of objects')
+    return rows
+
+
+def _field(path: Path, number: int, row: dict, name: str, convert=str, default=None):
+    '''
+    Converts one field of a library row, naming the file and row on failure
+    '''
+    value = row.get(name)
+    if value is None or value == '':
+        if default is not None:
+            return default
+        raise LibraryError(f'{path} row {number} has no {name}')
+
+    try:
+        return convert(value)
+    except (TypeError, ValueError):
+        raise LibraryError(f'{path} row {number} has an invalid {name}: {value!r}') from None
+
+
+def read_monomers(path: Path) -> tuple[dict[str, float], dict[str, str]]:
+    '''
+    Reads a monomer library.
+
+    Each row has a 1-letter "code", a "mass" and optionally a 3-letter
+    "name", as a JSON list of objects or as CSV columns with a header.
+
+    Parameters
+    ----------
+    path : Path
+        .json or .csv library file
+
+    Returns
+    -------
+    tuple[dict[str, float], dict[str, str]]
+        1-letter codes mapped to their masses and
+        3-letter codes mapped to their 1-letter codes
+    '''
+    monomer_masses, three_letter_codes = {}, {}
+
+    for number, row in enumerate(_read_rows(path), start=1):
+        code = _field(path, number, row, 'code').strip()
+        if len(code) != 1 or not code.isascii() or not code.isalpha():
+            raise LibraryError(f'{path} row {number}: 1-letter codes must be a single ASCII letter, not {code!r}')
+        if code in monomer_masses:
+            raise LibraryError(f'{path} row {number}: duplicate 1-letter code {code}')
+
+        monomer_masses[code] = _field(path, number, row, 'mass', float)
+
+        name = _field(path, number, row, 'name', default='').strip()
+        if name:
+            three_letter_codes[name] = code
+
+    if not monomer_masses:
+        raise LibraryError(f'{path} defines no monomers')
+    return monomer_masses, three_letter_codes
+
+
+def read_adducts(path: Path) -> tuple[list[Adduct], dict[str, float]]:
+    '''
+    Reads an adduct library.
+
+    Each row has a "name", a "terminus", an integer "charge" and a "mass",
+    as a JSON list of objects or as CSV columns with a header. Rows may
+    also give the masses of the N- and C-terminal groups named in their
+    terminus as "n_terminal_mass" and "c_terminal_mass", which are only
+    needed for fragment ions of groups not in adducts.TERMINAL_GROUPS.
+
+    Parameters
+    ----------
+    path : Path
+        .json or .csv library file
+
+    Returns
+    -------
+    tuple[list[Adduct], dict[str, float]]
+        Adducts in file order and the terminal groups defined by the file
+    '''
+    adducts, groups = [], {}
+
+    for number, row in enumerate(_read_rows(path), start=1):
+        charge = _field(path, number, row, 'charge', int)
+        if charge == 0:
+            raise LibraryError(f'{path} row {number}: charge cannot be 0')
+
+        adduct = Adduct(name=_field(path, number, row, 'name'),
+                        terminus=_field(path, number, row, 'terminus'),
+                        charge=f'{charge:+d}',
+                        mass=_field(path, number, row, 'mass', float))
+        adducts.append(adduct)
+
+        for group, column in zip(split_terminus(adduct), ('n_terminal_mass', 'c_terminal_mass')):
+            if row.get(column) is None or row.get(column) == '':
+                continue
+            mass = _field(path, number, row, column, float)
+            if groups.setdefault(group, mass) != mass:
+                raise LibraryError(f'{path} row {number}: conflicting {column} of {group}')
+
+    if not adducts:
+        raise LibraryError(f'{path} defines no adducts')
+    return adducts, groups
+
+
+def load_library(monomer_file: Path | None = None, adduct_file: Path | None = None) -> Library:
+    '''
+    Loads monomer and adduct libraries, falling back to the definitions
+    in monomers.py and adducts.py for the files that are not given.
+
+    Returns
+    -------
+    Library
+        Compiled library
+    '''
+    if monomer_file is None:
+        monomer_masses = dict(monomer_definitions.ONE_LETTER_CODE_MASS_PAIRS)
+        three_letter_codes = dict(monomer_definitions.THREE_LETTER_CODES)
+    else:
+        monomer_masses, three_letter_codes = read_monomers(monomer_file)
+
+    if adduct_file is None:
+        adducts, groups = list(adduct_definitions.ADDUCTS), {}
+    else:
+        adducts, groups = read_adducts(adduct_file)
+
+    return compile_library(monomer_masses, three_letter_codes, adducts, {**TERMINAL_GROUPS, **groups})
+
+
+# Library of the definitions in monomers.py and adducts.py
+DEFAULT_LIBRARY = load_library()
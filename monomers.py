@@ -56,3 +56,13 @@ THREE_LETTER_CODES = {
     'Tyr': 'Y',
     'd2Tyr': 'y'
 }
+
+
+def multiletter_codes(three_letter_codes: dict[str, str],
+                      one_letter_codes: list[str] = ()) -> dict[str, str]:
+    '''
+    Maps 1-letter codes to the first 3-letter code that uses them.
+    Codes of one_letter_codes without a 3-letter code map to themselves.
+    '''
+    return {**{one_letter: one_letter for one_letter in one_letter_codes},
+            **{one_letter: code for code, one_letter in reversed(three_letter_codes.items())}}
@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+# This software is licensed under the MIT License.
+# See the LICENSE file for more information.
+
+'''
+Reverse m/z lookup of deletions and adducts that explain an observed peak
+'''
+
+import os
+import sys
+import mmap
+import struct
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from adducts import ADDUCTS, Adduct
+from fixedpoint import SCALE, to_micro
+
+# Layout of the header of a persisted index: magic, format version, number
+# of adducts, monomer and adduct table hash, minimum deletion length and the
+# number of entries, deletions, bytes of deletion codes and bytes of sequence
+INDEX_MAGIC = b'SDCMZIDX'
+INDEX_VERSION = 2
+INDEX_HEADER = struct.Struct('<8sII32sQQQQQ')
+
+
+@dataclass
+class PeakMatch:
+    '''Dataclass for holding a deletion and adduct that explain a peak'''
+    peak: float
+    deletion: str
+    missing: dict
+    terminus: str
+    adduct: str
+    charge: int
+    m_over_z: float
+    error: float
+    error_ppm: float
+
+
+class MzIndex:
+    '''
+    Sorted m/z values of every (deletion, adduct) pair of a sequence,
+    searched by bisection.
+
+    The m/z values, deletions and adducts of the entries are packed
+    float64, uint32 and uint16 arrays, the same layout as the sections
+    of an index persisted with write_index.
+
+    Parameters
+    ----------
+    input_sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    deletion_masses : Iterable[tuple[str, int]]
+        (deletion, mass in micro-daltons) pairs of the deletions to index
+
+    adducts : list[Adduct]
+        Adducts to apply to each deletion
+    '''
+
+    def __init__(self,
+                 input_sequence: str,
+                 deletion_masses: Iterable[tuple[str, int]],
+                 adducts: list[Adduct] = ADDUCTS):
+        self.input_sequence = input_sequence
+        self.adducts = adducts
+        self.deletions = []
+
+        # Each m/z is a single division of the exact sum in micro-daltons
+        adduct_masses = [(to_micro(adduct.mass), abs(int(adduct.charge)) * SCALE) for adduct in adducts]
+        unsorted = array('d')
+        for deletion, base_mass in deletion_masses:
+            self.deletions.append(deletion)
+            unsorted.extend([abs(base_mass + mass) / divisor for mass, divisor in adduct_masses])
+
+        # Entry i of unsorted is deletion i // len(adducts)
+        # carrying adduct i % len(adducts)
+        order = sorted(range(len(unsorted)), key=unsorted.__getitem__)
+        self.mzs = array('d', (unsorted[i] for i in order))
+        self.deletion_ids = array('I', (i // len(adducts) for i in order))
+        self.adduct_ids = array('H', (i % len(adducts) for i in order))
+
+    def __len__(self) -> int:
+        return len(self.mzs)
+
+    def query(self,
+              peak: float,
+              tolerance: float = 10,
+              unit: str = 'ppm') -> list[PeakMatch]:
+        '''
+        Finds every (deletion, adduct) pair within tolerance of a peak.
+
+        Parameters
+        ----------
+        peak : float
+            Observed m/z
+
+        tolerance : float
+            Allowed difference between the observed and theoretical m/z
+
+        unit : str
+            'ppm' or 'Da'
+
+        Returns
+        -------
+        list[PeakMatch]
+            Matches ordered from smallest to largest absolute error
+        '''
+        window = _window(peak, tolerance, unit)
+
+        lower = bisect_left(self.mzs, peak - window)
+        upper = bisect_right(self.mzs, peak + window)
+
+        matches = [self._match(peak, position) for position in range(lower, upper)]
+        return sorted(matches, key=lambda match: abs(match.error))
+
+    def annotate(self,
+                 peaks: Iterable[tuple[float, float]],
+                 tolerance: float = 10,
+                 unit: str = 'ppm') -> Iterator[tuple[float, float, list[PeakMatch]]]:
+        '''
+        Annotates a whole peak list in one pass by sorting the peaks and
+        merge-joining them against the sorted m/z index.
+
+        Parameters
+        ----------
+        peaks : Iterable[tuple[float, float]]
+            (m/z, intensity) pairs of the observed peaks
+
+        tolerance : float
+            Allowed difference between the observed and theoretical m/z
+
+        unit : str
+            'ppm' or 'Da'
+
+        Returns
+        -------
+        Iterator[tuple[float, float, list[PeakMatch]]]
+            (m/z, intensity, matches) of each peak in ascending m/z order
+        '''
+        lower = 0
+        for peak, intensity in sorted(peaks):
+            window = _window(peak, tolerance, unit)
+
+            # The lower edge of the window only moves forward as the peaks
+            # increase, so each search starts where the previous one ended
+            lower = bisect_left(self.mzs, peak - window, lower)
+            upper = bisect_right(self.mzs, peak + window, lower)
+
+            matches = [self._match(peak, position) for position in range(lower, upper)]
+            yield peak, intensity, sorted(matches, key=lambda match: abs(match.error))
+
+    def deletion(self, deletion_id: int) -> str:
+        '''
+        Returns the 1-letter codes of a deletion
+        '''
+        return self.deletions[deletion_id]
+
+    def _match(self, peak: float, position: int) -> PeakMatch:
+        '''
+        Builds the PeakMatch for an entry of the sorted index
+        '''
+        deletion = self.deletion(self.deletion_ids[position])
+        adduct = self.adducts[self.adduct_ids[position]]
+        m_over_z = self.mzs[position]
+        error = peak - m_over_z
+
+        return PeakMatch(peak=peak,
+                         deletion=deletion,
+                         missing=dict(Counter(self.input_sequence) - Counter(deletion)),
+                         terminus=adduct.terminus,
+                         adduct=adduct.name,
+                         charge=int(adduct.charge),
+                         m_over_z=m_over_z,
+                         error=error,
+                         error_ppm=error / m_over_z * 1e6)
+
+
+class MappedMzIndex(MzIndex):
+    '''
+    m/z index persisted with write_index, memory-mapped rather than read.
+
+    Only the pages touched by the binary searches are read from disk,
+    so opening the index takes the same time whatever its size. The
+    index is closed with close() or by using it as a context manager.
+
+    Parameters
+    ----------
+    path : Path
+        Index file written by write_index
+
+    adducts : list[Adduct]
+        Adducts the index was built with
+
+    table_hash : str | None
+        Hash of the monomer and adduct tables. An index built with
+        other tables raises a ValueError.
+    '''
+
+    def __init__(self,
+                 path: Path,
+                 adducts: list[Adduct] = ADDUCTS,
+                 table_hash: str | None = None):
+        if sys.byteorder != 'little':
+            raise ValueError('Persisted m/z indexes are only supported on little-endian machines')
+
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        try:
+            self._open(path, adducts, table_hash)
+        except ValueError:
+            self.close()
+            raise
+
+    def _open(self, path: Path, adducts: list[Adduct], table_hash: str | None) -> None:
+        if len(self._mmap) < INDEX_HEADER.size:
+            raise ValueError(f'{path} is not an m/z index')
+
+        (magic, version, adduct_count, stored_hash, self.min_length,
+         entries, deletions, deletion_bytes, sequence_bytes) = INDEX_HEADER.unpack_from(self._mmap)
+
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f'{path} is not an m/z index')
+        if adduct_count != len(adducts) or (table_hash is not None and stored_hash.hex() != table_hash):
+            raise ValueError(f'{path} was built with different monomer or adduct tables')
+
+        sections = _index_sections(entries, deletions, deletion_bytes, sequence_bytes)
+        if len(self._mmap) != sections['end']:
+            raise ValueError(f'{path} is truncated')
+
+        def section(name: str) -> memoryview:
+            start, stop = sections[name]
+            return self._view[start:stop]
+
+        self.adducts = adducts
+        self.table_hash = stored_hash.hex()
+        self.mzs = section('mzs').cast('d')
+        self.deletion_ids = section('deletion_ids').cast('I')
+        self.adduct_ids = section('adduct_ids').cast('H')
+        self.offsets = section('offsets').cast('Q')
+        self.codes = section('codes')
+        self.input_sequence = bytes(section('sequence')).decode('ascii')
+
+    def close(self) -> None:
+        '''
+        Releases the views into the file and unmaps it
+        '''
+        for name in ('mzs', 'deletion_ids', 'adduct_ids', 'offsets', 'codes', '_view'):
+            view = self.__dict__.pop(name, None)
+            if view is not None:
+                view.release()
+        self._mmap.close()
+
+    def __enter__(self) -> 'MappedMzIndex':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def deletion(self, deletion_id: int) -> str:
+        '''
+        Returns the 1-letter codes of a deletion
+        '''
+        return bytes(self.codes[self.offsets[deletion_id]:self.offsets[deletion_id + 1]]).decode('ascii')
+
+
+def _index_sections(entries: int,
+                    deletions: int,
+                    deletion_bytes: int,
+                    sequence_bytes: int) -> dict:
+    '''
+    Byte ranges of the sections of a persisted index. Every section
+    starts on an 8 byte boundary so that it can be cast in place.
+    '''
+    sizes = [('mzs', 8 * entries),
+             ('deletion_ids', 4 * entries),
+             ('adduct_ids', 2 * entries),
+             ('offsets', 8 * (deletions + 1)),
+             ('codes', deletion_bytes),
+             ('sequence', sequence_bytes)]
+
+    sections = {}
+    position = INDEX_HEADER.size
+    for name, size in sizes:
+        sections[name] = (position, position + size)
+        position += -(position + size) % 8 + size
+    sections['end'] = position
+    return sections
+
+
+def write_index(index: MzIndex, path: Path, table_hash: str, min_length: int = 0) -> None:
+    '''
+    Persists an m/z index in the fixed layout read by MappedMzIndex.
+
+    After the header come the sorted float64 m/z values, the uint32
+    deletion and uint16 adduct of each entry, the uint64 offsets of each
+    deletion into the 1-letter codes of every deletion, and the sequence.
+    The file is written under a temporary name and then moved in place,
+    so readers never see a partial index.
+
+    Parameters
+    ----------
+    index : MzIndex
+        Index to persist
+
+    path : Path
+        Index file
+
+    table_hash : str
+        Hex digest of the monomer and adduct tables the index was built with
+
+    min_length : int
+        Shortest deletion in the index
+    '''
+    if sys.byteorder != 'little':
+        raise ValueError('Persisted m/z indexes are only supported on little-endian machines')
+
+    adduct_count = len(index.adducts)
+    codes = ''.join(index.deletions).encode('ascii')
+    sequence = index.input_sequence.encode('ascii')
+
+    offsets = array('Q', [0])
+    for deletion in index.deletions:
+        offsets.append(offsets[-1] + len(deletion))
+
+    arrays = {'mzs': index.mzs,
+              'deletion_ids': index.deletion_ids,
+              'adduct_ids': index.adduct_ids,
+              'offsets': offsets,
+              'codes': codes,
+              'sequence': sequence}
+    sections = _index_sections(len(index), len(index.deletions), len(codes), len(sequence))
+
+    partial = Path(f'{path}.partial')
+    with open(partial, 'wb') as o:
+        o.write(INDEX_HEADER.pack(INDEX_MAGIC,
+                                  INDEX_VERSION,
+                                  adduct_count,
+                                  bytes.fromhex(table_hash),
+                                  min_length,
+                                  len(index),
+                                  len(index.deletions),
+                                  len(codes),
+                                  len(sequence)))
+
+        for name, data in arrays.items():
+            start, stop = sections[name]
+            o.seek(start)
+            o.write(data)
+            o.write(bytes(-stop % 8))
+    os.replace(partial, path)
+
+
+def _window(peak: float, tolerance: float, unit: str) -> float:
+    '''
+    Converts a tolerance into a half-width in m/z around a peak
+    '''
+    if unit == 'ppm':
+        return peak * tolerance / 1e6
+    if unit == 'Da':
+        return tolerance
+    raise ValueError(f'Unknown tolerance unit {unit}')
+
+
+def read_peak_list(peak_file: Path) -> list[tuple[float, float]]:
+    '''
+    Reads a peak list of m/z and intensity columns.
+
+    Columns may be separated by commas, tabs or spaces. Rows whose m/z or
+    intensity is not a number, such as headers, are skipped. The intensity
+    is 0 for rows that only contain an m/z value.
+
+    Parameters
+    ----------
+    peak_file : Path
+        Path to the peak list
+
+    Returns
+    -------
+    list[tuple[float, float]]
+        (m/z, intensity) pairs in file order
+    '''
+    peaks = []
+    with open(peak_file, 'r', encoding='utf-8') as f:
+        for row in f:
+            columns = row.replace(',', ' ').split()
+            try:
+                m_over_z = float(columns[0])
+                intensity = float(columns[1]) if len(columns) > 1 else 0.0
+            except (IndexError, ValueError):
+                continue
+            peaks.append((m_over_z, intensity))
+    return peaks
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+# This software is licensed under the MIT License.
+# See the LICENSE file for more information.
+
+'''
+Machine-readable output formats for deletions and their adducts
+'''
+
+import csv
+import sqlite3
+import itertools
+
+from pathlib import Path
+from collections import Counter
+from typing import Callable, Iterable
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from adducts import ADDUCTS, Adduct
+from fixedpoint import from_micro
+
+# Output formats, which are also the extensions of their files
+OUTPUT_FORMATS = ['txt', 'tsv', 'csv', 'npz', 'sqlite']
+
+# Deletions handled per buffered write
+BATCH_SIZE = 4096
+
+# Size of the write buffer of text based formats
+BUFFER_SIZE = 1 << 20
+
+TABLE_HEADER = ['deletion', 'mass', 'missing', 'charge', 'terminus', 'adduct', 'mz']
+
+
+def _missing(input_sequence: str, deletion: str, format_missing: Callable[[dict], str]) -> str:
+    '''
+    Formats the monomers of input_sequence missing from deletion
+    '''
+    return format_missing(dict(Counter(input_sequence) - Counter(deletion)))
+
+
+def write_table(input_sequence: str,
+                deletion_masses: Iterable[tuple[str, int, list[float]]],
+                decimal_points: int,
+                outfile: Path,
+                format_missing: Callable[[dict], str],
+                delimiter: str = '\t',
+                adducts: list[Adduct] = ADDUCTS) -> int:
+    '''
+    Writes one row per (deletion, adduct) as delimited text.
+
+    Parameters
+    ----------
+    input_sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    deletion_masses : Iterable[tuple[str, int, list[float]]]
+        (deletion, mass in micro-daltons, m/z of each adduct) tuples
+
+    decimal_points : int
+        The number of decimal points to which the masses will be rounded.
+
+    outfile : Path
+        The path to the output file.
+
+    format_missing : Callable[[dict], str]
+        Formats a dictionary of missing monomers and their counts
+
+    delimiter : str
+        Column separator
+
+    adducts : list[Adduct]
+        Adducts the m/z values belong to
+
+    Returns
+    -------
+    int
+        Number of deletions written
+    '''
+    adduct_columns = [(int(adduct.charge), adduct.terminus, adduct.name) for adduct in adducts]
+    written = 0
+
+    with open(outfile, 'w', encoding='utf-8', newline='', buffering=BUFFER_SIZE) as o:
+        writer = csv.writer(o, delimiter=delimiter)
+        writer.writerow(TABLE_HEADER)
+
+        deletion_masses = iter(deletion_masses)
+        while batch := list(itertools.islice(deletion_masses, BATCH_SIZE)):
+            rows = []
+            for deletion, base_mass, adduct_mzs in batch:
+                mass = from_micro(base_mass, decimal_points)
+                missing = _missing(input_sequence, deletion, format_missing)
+                rows.extend([deletion, mass, missing, charge, terminus, name, m_over_z]
+                            for (charge, terminus, name), m_over_z in zip(adduct_columns, adduct_mzs)
+                            if m_over_z is not None)
+            writer.writerows(rows)
+            written += len(batch)
+
+    return written
+
+
+def write_npz(input_sequence: str,
+              deletion_masses: Iterable[tuple[str, int, list[float]]],
+              decimal_points: int,
+              outfile: Path,
+              format_missing: Callable[[dict], str],
+              adducts: list[Adduct] = ADDUCTS) -> int:
+    '''
+    Writes the deletions as NumPy arrays in a single .npz archive.
+
+    The archive holds deletion, mass and missing arrays of length N, an
+    N x adducts mz array (NaN where an m/z window excluded the adduct),
+    and adduct_name, adduct_terminus and adduct_charge
+    arrays describing its columns. Unlike the other formats every deletion
+    is held in memory until the archive is written.
+
+    Parameters
+    ----------
+    input_sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    deletion_masses : Iterable[tuple[str, int, list[float]]]
+        (deletion, mass in micro-daltons, m/z of each adduct) tuples
+
+    decimal_points : int
+        The number of decimal points to which the masses will be rounded.
+
+    outfile : Path
+        The path to the output file.
+
+    format_missing : Callable[[dict], str]
+        Formats a dictionary of missing monomers and their counts
+
+    adducts : list[Adduct]
+        Adducts the m/z values belong to
+
+    Returns
+    -------
+    int
+        Number of deletions written
+    '''
+    if np is None:
+        raise ImportError('The npz output format requires NumPy to be installed')
+
+    deletions, masses, missing, mz_rows = [], [], [], []
+    for deletion, base_mass, adduct_mzs in deletion_masses:
+        deletions.append(deletion)
+        masses.append(from_micro(base_mass, decimal_points))
+        missing.append(_missing(input_sequence, deletion, format_missing))
+        mz_rows.append([float('nan') if m_over_z is None else m_over_z for m_over_z in adduct_mzs])
+
+    np.savez(outfile,
+             deletion=np.array(deletions, dtype=str),
+             mass=np.array(masses, dtype=np.float64),
+             missing=np.array(missing, dtype=str),
+             mz=np.array(mz_rows, dtype=np.float64).reshape(len(deletions), len(adducts)),
+             adduct_name=np.array([adduct.name for adduct in adducts], dtype=str),
+             adduct_terminus=np.array([adduct.terminus for adduct in adducts], dtype=str),
+             adduct_charge=np.array([int(adduct.charge) for adduct in adducts], dtype=np.int64))
+
+    return len(deletions)
+
+
+def write_sqlite(input_sequence: str,
+                 deletion_masses: Iterable[tuple[str, int, list[float]]],
+                 decimal_points: int,
+                 outfile: Path,
+                 format_missing: Callable[[dict], str],
+                 adducts: list[Adduct] = ADDUCTS) -> int:
+    '''
+    Writes the deletions to an SQLite database with deletions, adducts
+    and mz tables. mz holds one row per (deletion, adduct) pair.
+
+    Parameters
+    ----------
+    input_sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+
+    deletion_masses : Iterable[tuple[str, int, list[float]]]
+        (deletion, mass in micro-daltons, m/z of each adduct) tuples
+
+    decimal_points : int
+        The number of decimal points to which the masses will be rounded.
+
+    outfile : Path
+        The path to the output file. An existing database is replaced.
+
+    format_missing : Callable[[dict], str]
+        Formats a dictionary of missing monomers and their counts
+
+    adducts : list[Adduct]
+        Adducts the m/z values belong to
+
+    Returns
+    -------
+    int
+        Number of deletions written
+    '''
+    Path(outfile).unlink(missing_ok=True)
+    connection = sqlite3.connect(outfile)
+    written = 0
+
+    try:
+        with connection:
+            connection.execute('CREATE TABLE deletions ('
+                               'id INTEGER PRIMARY KEY, deletion TEXT, mass REAL, missing TEXT)')
+            connection.execute('CREATE TABLE adducts ('
+                               'id INTEGER PRIMARY KEY, charge INTEGER, terminus TEXT, '
+                               'name TEXT, mass REAL)')
+            connection.execute('CREATE TABLE mz (deletion_id INTEGER, adduct_id INTEGER, mz REAL)')
+
+            connection.executemany('INSERT INTO adducts VALUES (?, ?, ?, ?, ?)',
+                                   [(i, int(adduct.charge), adduct.terminus, adduct.name, adduct.mass)
+                                    for i, adduct in enumerate(adducts)])
+
+            deletion_masses = iter(deletion_masses)
+            while batch := list(itertools.islice(deletion_masses, BATCH_SIZE)):
+                ids = range(written, written + len(batch))
+                connection.executemany('INSERT INTO deletions VALUES (?, ?, ?, ?)',
+                                       [(i, deletion, from_micro(base_mass, decimal_points),
+                                         _missing(input_sequence, deletion, format_missing))
+                                        for i, (deletion, base_mass, _) in zip(ids, batch)])
+                connection.executemany('INSERT INTO mz VALUES (?, ?, ?)',
+                                       [(i, j, m_over_z)
+                                        for i, (_, _, adduct_mzs) in zip(ids, batch)
+                                        for j, m_over_z in enumerate(adduct_mzs)
+                                        if m_over_z is not None])
+                written += len(batch)
+    finally:
+        connection.close()
+
+    return written
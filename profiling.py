@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+# This software is licensed under the MIT License.
+# See the LICENSE file for more information.
+
+'''
+Per-stage wall time, CPU time, throughput and memory measurements
+'''
+
+import sys
+import json
+import tracemalloc
+
+from time import perf_counter, process_time
+from pathlib import Path
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+@dataclass
+class Stage:
+    '''Dataclass for holding the measurements of one pipeline stage'''
+    name: str
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    items: int = 0
+    peak_memory_bytes: int = 0
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {'wall_seconds': self.wall_seconds,
+                'cpu_seconds': self.cpu_seconds,
+                'items': self.items,
+                'items_per_second': self.items_per_second,
+                'peak_memory_bytes': self.peak_memory_bytes}
+
+
+class StageProfiler:
+    '''
+    Measures the stages of the deletion pipeline.
+
+    The stages are chained generators, so they run interleaved rather than
+    one after the other. The profiler keeps a stack of the active stages
+    and charges the time between two stage switches to the stage on top of
+    the stack only, so the time a stage spends waiting on the stage that
+    feeds it is not counted twice. Likewise the tracemalloc peak between
+    two switches is charged to the stage on top of the stack.
+
+    A disabled profiler passes everything through untouched,
+    so it can be handed to the pipeline unconditionally.
+
+    Parameters
+    ----------
+    enabled : bool
+        Record measurements
+    '''
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.stages = {}
+        self.counters = {}
+        self.peak_memory_bytes = 0
+        self._active = []
+        self._wall = 0.0
+        self._cpu = 0.0
+        self._started = (0.0, 0.0)
+
+    def start(self) -> None:
+        '''
+        Starts tracing memory allocations and the overall clocks
+        '''
+        if not self.enabled:
+            return
+
+        tracemalloc.start()
+        self._started = perf_counter(), process_time()
+        self._wall, self._cpu = self._started
+
+    def stop(self) -> None:
+        '''
+        Stops tracing memory allocations
+        '''
+        if self.enabled and tracemalloc.is_tracing():
+            self._switch()
+            tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Stage]:
+        '''
+        Measures the body of a with statement as the named stage. The
+        yielded Stage can be used to record the number of items handled.
+        '''
+        if not self.enabled:
+            yield Stage(name)
+            return
+
+        stage = self._enter(name)
+        try:
+            yield stage
+        finally:
+            self._exit()
+
+    def wrap(self, name: str, items: Iterable) -> Iterable:
+        '''
+        Measures the time spent producing each item of an iterable as
+        the named stage and counts the items.
+
+        Returns
+        -------
+        Iterable
+            The items, unchanged
+        '''
+        if not self.enabled:
+            return items
+        return self._iterate(name, iter(items))
+
+    def _iterate(self, name: str, items: Iterator) -> Iterator:
+        while True:
+            stage = self._enter(name)
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            finally:
+                self._exit()
+
+            stage.items += 1
+            yield item
+
+    def add_counters(self, name: str, counters: dict) -> None:
+        '''
+        Adds counters, such as those of a ProgressReporter, to the
+        named entry of the report. Repeated calls are summed.
+        '''
+        if not self.enabled:
+            return
+
+        totals = self.counters.setdefault(name, {})
+        for key, value in counters.items():
+            totals[key] = totals.get(key, 0) + value
+
+    def _enter(self, name: str) -> Stage:
+        self._switch()
+        stage = self.stages.setdefault(name, Stage(name))
+        self._active.append(stage)
+        return stage
+
+    def _exit(self) -> None:
+        self._switch()
+        self._active.pop()
+
+    def _switch(self) -> None:
+        '''
+        Charges the time and memory peak since the last switch to the active stage
+        '''
+        wall, cpu = perf_counter(), process_time()
+
+        peak = 0
+        if tracemalloc.is_tracing():
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+        self.peak_memory_bytes = max(self.peak_memory_bytes, peak)
+
+        if self._active:
+            stage = self._active[-1]
+            stage.wall_seconds += wall - self._wall
+            stage.cpu_seconds += cpu - self._cpu
+            stage.peak_memory_bytes = max(stage.peak_memory_bytes, peak)
+
+        self._wall, self._cpu = wall, cpu
+
+    def report(self, **metadata) -> dict:
+        '''
+        Builds the profile report.
+
+        Parameters
+        ----------
+        **metadata
+            Extra entries describing the run, such as the sequence
+
+        Returns
+        -------
+        dict
+            JSON serializable report with totals and one entry per stage
+        '''
+        report = dict(metadata)
+        report['wall_seconds'] = perf_counter() - self._started[0]
+        report['cpu_seconds'] = process_time() - self._started[1]
+        report['peak_memory_bytes'] = self.peak_memory_bytes
+        report['max_rss_bytes'] = max_rss_bytes()
+        report['stages'] = {name: stage.as_dict() for name, stage in self.stages.items()}
+        report['counters'] = self.counters
+        return report
+
+
+def max_rss_bytes() -> int | None:
+    '''
+    Returns
+    -------
+    int | None
+        Peak resident set size of the process, or None where
+        the resource module is unavailable
+    '''
+    if resource is None:
+        return None
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def write_report(report: dict, outfile: Path | str) -> None:
+    '''
+    Writes a profile report as JSON, to stdout when outfile is '-'
+    '''
+    text = json.dumps(report, indent=2)
+    if str(outfile) == '-':
+        print(text)
+        return
+
+    with open(outfile, 'w', encoding='utf-8') as o:
+        o.write(text + '\n')
+
+
+# Shared disabled profiler used as the default of the pipeline functions
+NULL_PROFILER = StageProfiler(enabled=False)
@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+# This software is licensed under the MIT License.
+# See the LICENSE file for more information.
+
+'''
+Local HTTP/JSON service answering deletion and m/z queries from warm caches
+'''
+
+import json
+import asyncio
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+
+from adducts import MzWindow
+from fixedpoint import from_micro, round_m_over_z
+from library import DEFAULT_LIBRARY, Library
+from mzindex import MzIndex
+from utils import LRUCache, SequenceError
+from SequenceDeletionCalculator import (DeletionCalculator,
+                                        apply_window,
+                                        count_compositions,
+                                        format_missing,
+                                        minimum_length,
+                                        parse_input)
+
+# Largest request body accepted, in bytes
+MAX_BODY = 1 << 20
+
+
+class RequestError(Exception):
+    '''Request that cannot be answered, carrying its HTTP status'''
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _integer(payload: dict, key: str, default: int | None = None) -> int | None:
+    '''
+    Returns the integer payload[key], or default when it is missing or null
+    '''
+    value = payload.get(key)
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise RequestError(HTTPStatus.BAD_REQUEST, f'Expected "{key}" to be an integer')
+    return value
+
+
+def _number(payload: dict, key: str, default: float) -> float:
+    '''
+    Returns the number payload[key] as a float, or default when it is missing or null
+    '''
+    value = payload.get(key)
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise RequestError(HTTPStatus.BAD_REQUEST, f'Expected "{key}" to be a number')
+    return float(value)
+
+
+def _compute_table(sequence: str,
+                   min_length: int,
+                   decimal_points: int,
+                   use_numpy: bool,
+                   library: Library) -> list[tuple[str, int, list[float]]]:
+    '''
+    Computes the (deletion, mass, m/z of each adduct) table of a sequence
+    in a worker process
+    '''
+    calculator = DeletionCalculator(library, decimal_points=decimal_points, use_numpy=use_numpy, cache_size=0)
+    return list(calculator.deletion_masses(sequence, min_length))
+
+
+def _compute_index(sequence: str, min_length: int, library: Library) -> MzIndex:
+    '''
+    Builds the m/z index of a sequence in a worker process
+    '''
+    return DeletionCalculator(library, index_cache_size=1).index(sequence, min_length)
+
+
+class DeletionServer:
+    '''
+    Answers JSON requests over HTTP.
+
+    Enumerating deletions and building m/z indexes runs in a process pool,
+    and the results are kept in LRU caches keyed by the sequence and the
+    shortest deletion. Concurrent requests for an entry that is still being
+    computed wait on the same computation instead of starting another one.
+
+    Endpoints, all taking a JSON object with a "sequence" of 1-letter or
+    3-letter codes and optional "max_deletions" and "min_length":
+
+    POST /count
+        Number of unique deletions
+
+    POST /deletions
+        Every deletion with its mass, missing monomers and adduct m/z
+        values. Accepts "mz_min", "mz_max" and "charges" to only return
+        adducts inside an m/z window.
+
+    POST /query
+        Deletions and adducts explaining each of the "peaks" within
+        "tolerance" (10 by default) in "unit" ("ppm" or "Da")
+
+    GET /health
+        Cache sizes
+
+    Parameters
+    ----------
+    library : Library
+        Monomers and adducts, sent to the worker processes with every job
+
+    decimal_points : int
+        The number of decimal points to which the masses are rounded.
+
+    use_numpy : bool
+        Compute masses and m/z values with the vectorized NumPy backend
+
+    workers : int
+        Number of worker processes
+
+    budget : int
+        Largest number of deletions of a /deletions or /query request
+
+    cache_size : int
+        Number of deletion tables and of m/z indexes kept in memory
+    '''
+
+    def __init__(self,
+                 library: Library = DEFAULT_LIBRARY,
+                 decimal_points: int = 3,
+                 use_numpy: bool = False,
+                 workers: int = 1,
+                 budget: int = 1000000,
+                 cache_size: int = 32):
+        self.library = library
+        self.decimal_points = decimal_points
+        self.use_numpy = use_numpy
+        self.workers = workers
+        self.budget = budget
+        self.calculator = DeletionCalculator(library, decimal_points=decimal_points, use_numpy=use_numpy, cache_size=0)
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+
+        self.tables = LRUCache(cache_size)
+        self.indexes = LRUCache(cache_size)
+
+        # Encoded /deletions responses without an m/z window,
+        # which are large enough for their encoding to dominate
+        self.responses = LRUCache(cache_size)
+        self._pending = {}
+
+    async def _cached(self, cache: LRUCache, key: tuple, function, *args):
+        '''
+        Returns cache[key], computing it with function(*args)
+        in the process pool on a miss
+        '''
+        if key in cache:
+            return cache[key]
+
+        if key not in self._pending:
+            loop = asyncio.get_running_loop()
+            self._pending[key] = loop.run_in_executor(self.executor, function, *args)
+
+        future = self._pending[key]
+        try:
+            value = await asyncio.shield(future)
+        finally:
+            self._pending.pop(key, None)
+
+        cache[key] = value
+        return value
+
+    def _sequence(self, payload: dict) -> tuple[str, int]:
+        '''
+        Parses the sequence and shortest deletion of a request
+        '''
+        if not isinstance(payload.get('sequence'), str):
+            raise RequestError(HTTPStatus.BAD_REQUEST, 'Expected a "sequence" string')
+
+        sequence = parse_input(payload['sequence'], self.library)
+        self.calculator.verify(sequence)
+
+        min_length = minimum_length(sequence,
+                                    _integer(payload, 'max_deletions'),
+                                    _integer(payload, 'min_length', 0))
+        return sequence, min_length
+
+    def _check_budget(self, sequence: str, min_length: int) -> int:
+        deletions = count_compositions(sequence, min_length)
+        if deletions > self.budget:
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                               f'{sequence} has {deletions:,} deletions, above the budget of {self.budget:,}')
+        return deletions
+
+    async def count(self, payload: dict) -> dict:
+        sequence, min_length = self._sequence(payload)
+        return {'sequence': sequence,
+                'min_length': min_length,
+                'deletions': count_compositions(sequence, min_length)}
+
+    async def deletions(self, payload: dict) -> dict | bytes:
+        sequence, min_length = self._sequence(payload)
+        windowed = any(payload.get(key) is not None for key in ('mz_min', 'mz_max', 'charges'))
+
+        if not windowed and (sequence, min_length) in self.responses:
+            return self.responses[(sequence, min_length)]
+
+        self._check_budget(sequence, min_length)
+
+        table = await self._cached(self.tables,
+                                   (sequence, min_length),
+                                   _compute_table,
+                                   sequence,
+                                   min_length,
+                                   self.decimal_points,
+                                   self.use_numpy,
+                                   self.library)
+
+        if windowed:
+            charges = payload.get('charges')
+            if charges is not None and (not isinstance(charges, list)
+                                        or not all(isinstance(charge, int) and not isinstance(charge, bool)
+                                                   for charge in charges)):
+                raise RequestError(HTTPStatus.BAD_REQUEST, 'Expected a "charges" list of integers')
+
+            window = MzWindow(mz_min=_number(payload, 'mz_min', float('-inf')),
+                              mz_max=_number(payload, 'mz_max', float('inf')),
+                              charges=None if charges is None else tuple(charges))
+            table = apply_window(table, window, self.calculator.adduct_table)
+
+        rows = []
+        for deletion, base_mass, adduct_mzs in table:
+            missing = self.calculator.missing(sequence, deletion)
+            rows.append({'deletion': deletion,
+                         'mass': from_micro(base_mass, self.decimal_points),
+                         'missing': missing,
+                         'missing_codes': format_missing(missing, self.library).strip(),
+                         'adducts': [{'charge': int(adduct.charge),
+                                      'terminus': adduct.terminus,
+                                      'name': adduct.name,
+                                      'mz': m_over_z}
+                                     for adduct, m_over_z in zip(self.calculator.adducts, adduct_mzs)
+                                     if m_over_z is not None]})
+
+        response = {'sequence': sequence, 'min_length': min_length, 'deletions': rows}
+        if windowed:
+            return response
+
+        self.responses[(sequence, min_length)] = json.dumps(response).encode('utf-8')
+        return self.responses[(sequence, min_length)]
+
+    async def query(self, payload: dict) -> dict:
+        sequence, min_length = self._sequence(payload)
+
+        peaks = payload.get('peaks')
+        if not isinstance(peaks, list) or not all(isinstance(peak, (int, float)) for peak in peaks):
+            raise RequestError(HTTPStatus.BAD_REQUEST, 'Expected a "peaks" list of m/z values')
+
+        unit = payload.get('unit', 'ppm')
+        if unit not in ('ppm', 'Da'):
+            raise RequestError(HTTPStatus.BAD_REQUEST, 'unit must be "ppm" or "Da"')
+
+        tolerance = _number(payload, 'tolerance', 10.0)
+
+        self._check_budget(sequence, min_length)
+        index = await self._cached(self.indexes,
+                                   (sequence, min_length),
+                                   _compute_index,
+                                   sequence,
+                                   min_length,
+                                   self.library)
+
+        return {'sequence': sequence,
+                'min_length': min_length,
+                'peaks': [{'peak': peak,
+                           'matches': [{'deletion': match.deletion,
+                                        'missing': match.missing,
+                                        'terminus': match.terminus,
+                                        'adduct': match.adduct,
+                                        'charge': match.charge,
+                                        'mz': round_m_over_z(match.m_over_z, match.charge, self.decimal_points),
+                                        'error': round(match.error, self.decimal_points),
+                                        'error_ppm': round(match.error_ppm, 2)}
+                                       for match in index.query(peak, tolerance, unit)]}
+                          for peak in peaks]}
+
+    async def health(self, payload: dict) -> dict:
+        return {'status': 'ok',
+                'tables': len(self.tables),
+                'indexes': len(self.indexes),
+                'responses': len(self.responses)}
+
+    async def route(self, method: str, path: str, body: bytes) -> tuple[HTTPStatus, dict | bytes]:
+        '''
+        Dispatches a request to its endpoint.
+
+        Failures of the worker processes are answered with a 500 error, and
+        a process pool broken by a dying worker is replaced so that the
+        following requests are served.
+
+        Returns
+        -------
+        tuple[HTTPStatus, dict | bytes]
+            Status and JSON body of the response, already encoded
+            when it was served from the response cache
+        '''
+        endpoints = {('POST', '/count'): self.count,
+                     ('POST', '/deletions'): self.deletions,
+                     ('POST', '/query'): self.query,
+                     ('GET', '/health'): self.health}
+
+        endpoint = endpoints.get((method, path.split('?')[0]))
+        if endpoint is None:
+            return HTTPStatus.NOT_FOUND, {'error': f'No endpoint {method} {path}'}
+
+        try:
+            payload = json.loads(body) if body else {}
+            if not isinstance(payload, dict):
+                raise RequestError(HTTPStatus.BAD_REQUEST, 'Expected a JSON object')
+            return HTTPStatus.OK, await endpoint(payload)
+        except RequestError as e:
+            return e.status, {'error': str(e)}
+        except (SequenceError, ValueError, TypeError) as e:
+            return HTTPStatus.BAD_REQUEST, {'error': str(e)}
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f'{type(e).__name__}: {e}'}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        '''
+        Reads one HTTP request from a connection and writes its response
+        '''
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get('content-length', 0))
+            if len(request_line) < 2:
+                status, response = HTTPStatus.BAD_REQUEST, {'error': 'Malformed request line'}
+            elif length > MAX_BODY:
+                status, response = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': 'Request body too large'}
+            else:
+                body = await reader.readexactly(length)
+                status, response = await self.route(request_line[0], request_line[1], body)
+
+            data = response if isinstance(response, bytes) else json.dumps(response).encode('utf-8')
+            writer.write(f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                         f'Content-Type: application/json\r\n'
+                         f'Content-Length: {len(data)}\r\n'
+                         f'Connection: close\r\n\r\n'.encode('latin-1') + data)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8000) -> None:
+        '''
+        Serves requests until cancelled
+        '''
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f'Serving on http://{host}:{port}')
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+
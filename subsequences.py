@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+# This software is licensed under the MIT License.
+# See the LICENSE file for more information.
+
+'''
+Distinct ordered deletions of a sequence
+'''
+
+from collections import Counter
+from typing import Iterator
+
+
+class SubsequenceAutomaton:
+    '''
+    Subsequence automaton of a sequence, used to count and generate its
+    distinct ordered deletions.
+
+    State i of the automaton is the suffix of the sequence starting at
+    position i, and reading a monomer moves to the position right after its
+    next occurrence. Every distinct subsequence spells exactly one path
+    from state 0, the one taking the leftmost occurrence of each monomer,
+    so walking the paths yields each ordered deletion once without
+    remembering the deletions already seen.
+
+    Parameters
+    ----------
+    sequence : str
+        String of urethane monomer 1-letter codes i.e. 'ACCABD'
+        where each letter corresponds to a monomer
+    '''
+
+    def __init__(self, sequence: str):
+        self.sequence = sequence
+
+        # transitions[i] maps each monomer to the position after its
+        # next occurrence at or after i, in sequence order
+        self.transitions = [{} for _ in range(len(sequence) + 1)]
+
+        # suffix_counts[i] holds the monomer counts of sequence[i:]
+        self.suffix_counts = [Counter() for _ in range(len(sequence) + 1)]
+
+        for i in range(len(sequence) - 1, -1, -1):
+            following = self.transitions[i + 1]
+            self.transitions[i] = {sequence[i]: i + 1,
+                                   **{m: j for m, j in following.items() if m != sequence[i]}}
+            self.suffix_counts[i] = self.suffix_counts[i + 1] + Counter(sequence[i])
+
+    def count(self, min_length: int = 0) -> int:
+        '''
+        Counts the distinct ordered deletions of at least min_length
+        monomers, including the full sequence, without generating them.
+        '''
+        # paths[i][size] is the number of distinct subsequences of
+        # size monomers readable from state i
+        paths = [[1] + [0] * len(self.sequence) for _ in range(len(self.sequence) + 1)]
+
+        for i in range(len(self.sequence) - 1, -1, -1):
+            for j in self.transitions[i].values():
+                for size in range(1, len(self.sequence) - i + 1):
+                    paths[i][size] += paths[j][size - 1]
+
+        return sum(paths[0][max(0, min_length):])
+
+    def ordered(self, composition: str) -> Iterator[str]:
+        '''
+        Generates the distinct ordered deletions with the monomers of a
+        composition, each exactly once.
+
+        A monomer is only read if the monomers still needed remain
+        available after it, so every branch of the walk ends in a deletion
+        and the cost is proportional to the number of deletions generated.
+
+        Example
+        -------
+        For the sequence 'AyByA' and the composition 'ABy', the function
+        will yield: 'AyB', 'ABy', 'yBA', 'ByA'
+
+        Parameters
+        ----------
+        composition : str
+            Monomers of the deletions in any order
+
+        Returns
+        -------
+        Iterator[str]
+            Ordered deletions of the sequence with that composition
+        '''
+        for ordered, _ in self._walk(composition):
+            yield ordered
+
+    def ordered_masses(self,
+                       composition: str,
+                       monomer_masses: dict[str, int]) -> Iterator[tuple[str, list[int]]]:
+        '''
+        Generates the same deletions as ordered, each with the cumulative
+        mass of its prefixes. The sum of a prefix is computed once when the
+        walk reads it and shared by every deletion starting with it.
+
+        Parameters
+        ----------
+        composition : str
+            Monomers of the deletions in any order
+
+        monomer_masses : dict[str, int]
+            1-letter codes and their masses in micro-daltons, see
+            DeletionCalculator.micro_monomers
+
+        Returns
+        -------
+        Iterator[tuple[str, list[int]]]
+            (ordered deletion, mass of its first 1, 2, ... monomers) pairs
+        '''
+        return self._walk(composition, monomer_masses)
+
+    def _walk(self,
+              composition: str,
+              monomer_masses: dict[str, int] | None = None) -> Iterator[tuple[str, list[int]]]:
+        needed = Counter(composition)
+        if needed - self.suffix_counts[0]:
+            return
+
+        # Monomers and prefix sums of the current path of the walk
+        path, sums = [], [0]
+
+        def walk(i: int, size: int) -> Iterator[tuple[str, list[int]]]:
+            if size == 0:
+                yield ''.join(path), sums[1:]
+                return
+
+            # Candidates are visited in order of their next occurrence
+            for monomer, j in sorted(self.transitions[i].items(), key=lambda item: item[1]):
+                if not needed[monomer]:
+                    continue
+
+                needed[monomer] -= 1
+                if all(self.suffix_counts[j][m] >= n for m, n in needed.items()):
+                    path.append(monomer)
+                    if monomer_masses is not None:
+                        sums.append(sums[-1] + monomer_masses[monomer])
+
+                    yield from walk(j, size - 1)
+
+                    path.pop()
+                    if monomer_masses is not None:
+                        sums.pop()
+                needed[monomer] += 1
+
+        yield from walk(0, len(composition))
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+# This software is licensed under the MIT License.
+# See the LICENSE file for more information.
+
+'''
+Checks of the persistent cache of deletion files
+
+Run with python -m pytest test_cache.py
+'''
+
+import time
+
+import pytest
+
+from adducts import ADDUCTS, MzWindow
+from cache import cache_key, open_cache
+from library import compile_library
+from SequenceDeletionCalculator import DeletionCalculator, write_sequence
+
+
+@pytest.mark.parametrize('backend', ['files', 'sqlite'])
+def test_cache_hits_and_evicts_the_least_recently_used(tmp_path, backend):
+    cache = open_cache(tmp_path / 'cache', backend, max_megabytes=2.5 / 1024)
+    for name in 'abc':
+        (tmp_path / name).write_bytes(name.encode('ascii') * 1024)
+
+    # Entries are ordered by modification time, which the
+    # file system may only update every few milliseconds
+    cache.put_file('a', tmp_path / 'a')
+    time.sleep(0.05)
+    cache.put_file('b', tmp_path / 'b')
+    time.sleep(0.05)
+    assert cache.get_file('a', tmp_path / 'out')
+    assert (tmp_path / 'out').read_bytes() == b'a' * 1024
+    time.sleep(0.05)
+
+    # 'b' is now the least recently used entry and makes room for 'c'
+    cache.put_file('c', tmp_path / 'c')
+    assert not cache.get_file('b', tmp_path / 'out')
+    assert cache.get_file('a', tmp_path / 'out')
+    assert cache.get_file('c', tmp_path / 'out')
+    assert not cache.get_file('d', tmp_path / 'out')
+
+
+def test_cache_key_changes_with_every_input_of_the_file():
+    key = cache_key('AyyB', 3)
+
+    # Same composition and order of first appearance
+    assert cache_key('AyBy', 3) == key
+
+    library = compile_library({'A': 71.03711, 'y': 165.07898, 'B': 100.0}, {}, ADDUCTS)
+    assert len({key,
+                cache_key('yAyB', 3),
+                cache_key('AyyB', 4),
+                cache_key('AyyB', 3, 'csv'),
+                cache_key('AyyB', 3, min_length=1),
+                cache_key('AyyB', 3, window=MzWindow(400, 800)),
+                cache_key('AyyB', 3, library=library)}) == 7
+
+
+def test_write_sequence_serves_hits_from_the_cache(tmp_path, capsys):
+    cache = open_cache(tmp_path / 'cache')
+    calculator = DeletionCalculator()
+
+    write_sequence('AyyB', tmp_path / 'first.txt', 3, calculator=calculator, result_cache=cache)
+    write_sequence('AyyB', tmp_path / 'second.txt', 3, calculator=calculator, result_cache=cache)
+    write_sequence('AyyB', tmp_path / 'third.txt', 2, calculator=calculator, result_cache=cache)
+
+    assert capsys.readouterr().out.count('Loaded deletions from cache') == 1
+    assert (tmp_path / 'second.txt').read_bytes() == (tmp_path / 'first.txt').read_bytes()
+    assert (tmp_path / 'third.txt').read_bytes() != (tmp_path / 'first.txt').read_bytes()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+# This software is licensed under the MIT License.
+# See the LICENSE file for more information.
+
+'''
+Checks of the fixed-point rounding against exact decimal arithmetic
+
+Run with python -m pytest test_fixedpoint.py
+'''
+
+import random
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from fixedpoint import SCALE, from_micro, micro_range, round_m_over_z, to_micro
+
+
+def exact(micro: int, decimal_points: int, divisor: int = 1) -> float:
+    '''
+    Rounds micro / divisor half away from zero with Decimal
+    '''
+    value = Decimal(micro) / SCALE / abs(divisor)
+    rounded = float(value.quantize(Decimal(1).scaleb(-decimal_points), rounding=ROUND_HALF_UP))
+    return rounded if micro >= 0 else -abs(rounded)
+
+
+def test_from_micro_rounds_half_away_from_zero():
+    assert from_micro(789365500, 3) == 789.366
+    assert from_micro(-789365500, 3) == -789.366
+    assert from_micro(789365499, 3) == 789.365
+    assert from_micro(1500000, 0) == 2.0
+    assert from_micro(123, 8) == 0.000123
+
+    rng = random.Random(1)
+    for _ in range(2000):
+        micro = rng.randint(-10 ** 10, 10 ** 10)
+        decimal_points = rng.randint(0, 8)
+        divisor = rng.choice([1, 2, 3, 4, -1, -2, -3])
+
+        assert from_micro(micro, decimal_points, divisor) == exact(micro, decimal_points, divisor)
+
+
+def test_round_m_over_z_recovers_the_micro_daltons():
+    rng = random.Random(2)
+    for _ in range(2000):
+        micro = rng.randint(0, 5 * 10 ** 9)
+        charge = rng.choice([1, 2, 3, -1, -2])
+
+        assert round_m_over_z(micro / (abs(charge) * SCALE), charge, 3) == from_micro(micro, 3, charge)
+
+
+def test_to_micro_and_micro_range():
+    assert to_micro(197.09555) == 197095550
+    assert to_micro(-26.98709) == -26987090
+    assert micro_range((1.0000005, 2.0000005)) == (1000000, 2000001)
+    assert micro_range((float('inf'), float('-inf'))) == (float('inf'), float('-inf'))
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+# This software is licensed under the MIT License.
+# See the LICENSE file for more information.
+
+'''
+Checks of the fragment ion ladders of ordered deletions
+
+Run with python -m pytest test_fragments.py
+'''
+
+import pytest
+
+from adducts import ADDUCTS, Adduct, terminal_groups
+from fixedpoint import from_micro
+from fragments import compile_fragments, fragment_ladders
+from subsequences import SubsequenceAutomaton
+from vectorized import HAS_NUMPY
+from SequenceDeletionCalculator import DeletionCalculator
+
+
+def ladders(sequence: str, adducts: list[Adduct], use_numpy: bool = False):
+    '''
+    Ordered deletions of the whole sequence and their fragment ladders
+    '''
+    calculator = DeletionCalculator()
+    automaton = SubsequenceAutomaton(sequence)
+    orders = list(automaton.ordered_masses(sequence, calculator.micro_monomers))
+    return orders, fragment_ladders([sums for _, sums in orders], compile_fragments(adducts), 3, use_numpy)
+
+
+def test_whole_fragments_lose_the_far_terminal_group():
+    # Padding the prefix masses with the total mass or a zero mass turns
+    # the last N- or C-terminal fragment into the whole deletion
+    calculator = DeletionCalculator()
+    orders = list(SubsequenceAutomaton('AyBL').ordered_masses('AyBL', calculator.micro_monomers))
+    for adduct in ADDUCTS:
+        table = compile_fragments([adduct])
+        n_group, c_group = terminal_groups(adduct)
+        charge = abs(int(adduct.charge))
+
+        n_ladders = fragment_ladders([sums + sums[-1:] for _, sums in orders], table, 3)
+        c_ladders = fragment_ladders([[0] + sums for _, sums in orders], table, 3)
+        for (_, sums), (n_ladder, _), (_, c_ladder) in zip(orders, n_ladders, c_ladders):
+            mass = from_micro(sums[-1]) + adduct.mass
+            assert n_ladder[-1][0] == pytest.approx(abs(mass - c_group) / charge, abs=1e-3)
+            assert c_ladder[-1][0] == pytest.approx(abs(mass - n_group) / charge, abs=1e-3)
+
+
+def test_shared_termini_are_written_once():
+    table = compile_fragments([adduct for adduct in ADDUCTS if adduct.name == '+H+'])
+
+    assert len(table.n_prefixes) == len(set(table.n_prefixes)) == 2
+    assert len(table.c_prefixes) == len(set(table.c_prefixes)) == 2
+
+
+def test_custom_ions_and_groups():
+    adducts = [Adduct(name='+Q', terminus='N-Ac, OH', charge='+1', mass=30.0),
+               Adduct(name='+Q', terminus='N-Zz, OH', charge='+2', mass=80.0)]
+
+    with pytest.raises(ValueError):
+        compile_fragments(adducts)
+
+    table = compile_fragments(adducts, {'N-Ac': 43.01839, 'N-Zz': 50.5, 'OH': -26.98709})
+    assert table.n_charges == [1, 2]
+    assert table.c_charges == [1, 2]
+
+
+@pytest.mark.skipif(not HAS_NUMPY, reason='NumPy is not installed')
+def test_numpy_ladders_match_python():
+    _, python = ladders('AyyABL', ADDUCTS[:12])
+    _, numpy = ladders('AyyABL', ADDUCTS[:12], use_numpy=True)
+
+    assert numpy == python
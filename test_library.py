@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+# This software is licensed under the MIT License.
+# See the LICENSE file for more information.
+
+'''
+Checks of loading monomer and adduct libraries from JSON and CSV files
+
+Run with python -m pytest test_library.py
+'''
+
+import csv
+import json
+
+import pytest
+
+from adducts import ADDUCTS, TERMINAL_GROUPS
+from library import DEFAULT_LIBRARY, load_library
+from monomers import ONE_LETTER_CODE_MASS_PAIRS
+from utils import LibraryError
+from SequenceDeletionCalculator import DeletionCalculator, compute_masses, parse_input
+
+MONOMERS = [{'code': 'A', 'mass': 71.03711, 'name': 'Ala'},
+            {'code': 'Z', 'mass': 250.5, 'name': 'Zzz'},
+            {'code': 'G', 'mass': 57.02146}]
+
+ADDUCT_ROWS = [{'name': '+H+', 'terminus': 'N-Ac, OH', 'charge': 1, 'mass': 17.0386},
+               {'name': '+Q', 'terminus': 'N-Zz, OH', 'charge': -2, 'mass': 80.0,
+                'n_terminal_mass': 50.5, 'c_terminal_mass': -26.98709}]
+
+
+def write_json(path, rows):
+    path.write_text(json.dumps(rows), encoding='utf-8')
+    return path
+
+
+def write_csv(path, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as o:
+        writer = csv.DictWriter(o, fieldnames=list(dict.fromkeys(key for row in rows for key in row)))
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+def test_default_library_matches_the_definitions():
+    library = load_library()
+
+    assert library.monomer_masses == dict(ONE_LETTER_CODE_MASS_PAIRS)
+    assert library.adducts == ADDUCTS
+    assert library.terminal_groups == TERMINAL_GROUPS
+    assert library.hash == DEFAULT_LIBRARY.hash
+
+
+def test_json_and_csv_libraries_are_the_same(tmp_path):
+    from_json = load_library(write_json(tmp_path / 'monomers.json', MONOMERS),
+                             write_json(tmp_path / 'adducts.json', ADDUCT_ROWS))
+    from_csv = load_library(write_csv(tmp_path / 'monomers.csv', MONOMERS),
+                            write_csv(tmp_path / 'adducts.csv', ADDUCT_ROWS))
+
+    assert from_json == from_csv
+    assert from_json.monomer_masses == {'A': 71.03711, 'Z': 250.5, 'G': 57.02146}
+    assert from_json.names == {'Ala': 'A', 'Zzz': 'Z'}
+    assert [adduct.charge for adduct in from_json.adducts] == ['+1', '-2']
+    assert from_json.terminal_groups['N-Zz'] == 50.5
+    assert from_json.terminal_groups['N-Fmoc'] == TERMINAL_GROUPS['N-Fmoc']
+    assert from_json.hash != DEFAULT_LIBRARY.hash
+
+
+def test_calculator_uses_the_loaded_library(tmp_path):
+    library = load_library(write_json(tmp_path / 'monomers.json', MONOMERS),
+                           write_json(tmp_path / 'adducts.json', ADDUCT_ROWS))
+    calculator = DeletionCalculator(library)
+    sequence = parse_input('Ala Zzz Zzz G', library)
+
+    assert sequence == 'AZZG'
+    assert calculator.count(sequence) == 12
+    assert list(calculator.deletion_masses(sequence)) == list(compute_masses(calculator.deletions(sequence), 3, library))
+    assert calculator.mass('AZ') == pytest.approx(71.03711 + 250.5)
+
+
+@pytest.mark.parametrize('rows, message', [
+    ([{'code': 'A', 'mass': 71.0}, {'code': 'A', 'mass': 72.0}], 'duplicate 1-letter code'),
+    ([{'code': 'AB', 'mass': 71.0}], 'single ASCII letter'),
+    ([{'code': 'A', 'mass': 'heavy'}], 'invalid mass'),
+    ([{'code': 'A'}], 'has no mass'),
+    ([], 'defines no monomers'),
+])
+def test_invalid_monomer_libraries(tmp_path, rows, message):
+    with pytest.raises(LibraryError, match=message):
+        load_library(write_json(tmp_path / 'monomers.json', rows))
+
+
+@pytest.mark.parametrize('rows, message', [
+    ([{'name': '+H+', 'terminus': 'N-Ac, OH', 'charge': 0, 'mass': 17.0}], 'charge cannot be 0'),
+    ([{'name': '+H+', 'terminus': 'N-Ac, OH', 'charge': 'one', 'mass': 17.0}], 'invalid charge'),
+    ([{'name': '+H+', 'terminus': 'N-Zz, OH', 'charge': 1, 'mass': 17.0, 'n_terminal_mass': 50.0},
+      {'name': '+Na+', 'terminus': 'N-Zz, OH', 'charge': 1, 'mass': 39.0, 'n_terminal_mass': 51.0}],
+     'conflicting n_terminal_mass'),
+])
+def test_invalid_adduct_libraries(tmp_path, rows, message):
+    with pytest.raises(LibraryError, match=message):
+        load_library(adduct_file=write_json(tmp_path / 'adducts.json', rows))
+
+
+def test_invalid_json(tmp_path):
+    (tmp_path / 'monomers.json').write_text('[{"code": "A",', encoding='utf-8')
+
+    with pytest.raises(LibraryError, match='not valid JSON'):
+        load_library(tmp_path / 'monomers.json')
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+# This software is licensed under the MIT License.
+# See the LICENSE file for more information.
+
+'''
+Checks of the deletion masses and adduct m/z values
+
+Run with python -m pytest test_masses.py
+'''
+
+import pytest
+
+import vectorized
+
+from utils import LRUCache
+from SequenceDeletionCalculator import (DeletionCalculator,
+                                        compute_masses,
+                                        compute_masses_cached,
+                                        generate_compositions)
+
+
+def test_cache_smaller_than_a_batch():
+    deletions = list(generate_compositions('AyyAB'))
+    expected = list(compute_masses(deletions, 3))
+
+    cache = LRUCache(4)
+    for _ in range(3):
+        assert list(compute_masses_cached(deletions, 3, cache, batch_size=8)) == expected
+        assert len(cache) == 4
+
+    calculator = DeletionCalculator(cache_size=4)
+    for sequence in ['AyyA', 'AyyAB', 'AyyA']:
+        assert list(calculator.deletion_masses(sequence)) == list(compute_masses(generate_compositions(sequence), 3))
+
+
+@pytest.mark.skipif(not vectorized.HAS_NUMPY, reason='NumPy is not installed')
+def test_numpy_backend_matches_python():
+    for sequence in ['', 'A', 'AyyAyyAyyAyy', 'AaBbVvLlYy', 'LLLLLLLLvvvv']:
+        deletions = list(generate_compositions(sequence))
+        for decimal_points in [0, 3, 5]:
+            expected = list(compute_masses(deletions, decimal_points))
+
+            assert list(vectorized.compute_masses(deletions, decimal_points, batch_size=7)) == expected
+            assert list(DeletionCalculator(decimal_points=decimal_points, use_numpy=True)
+                        .deletion_masses(sequence)) == expected
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+# This software is licensed under the MIT License.
+# See the LICENSE file for more information.
+
+'''
+Checks of the reverse m/z index against the m/z values of the deletions
+
+Run with python -m pytest test_mzindex.py
+'''
+
+import pytest
+
+from cache import table_hash
+from mzindex import MappedMzIndex, read_peak_list, write_index
+from SequenceDeletionCalculator import DeletionCalculator, open_mz_index
+
+SEQUENCE = 'AyyBAL'
+
+
+def test_query_finds_every_adduct_in_tolerance():
+    calculator = DeletionCalculator()
+    index = calculator.index(SEQUENCE)
+    rows = list(calculator.mz_rows(SEQUENCE))
+    assert list(index.mzs) == sorted(index.mzs)
+    assert len(index) == len(rows)
+
+    # The index holds unrounded m/z values, so rows within the rounding
+    # step of the edge of the window may fall on either side of it
+    step = 10 ** -calculator.decimal_points
+    for peak in [row.m_over_z for row in rows[::5]] + [400.0, 1000.0]:
+        window = peak * 50 / 1e6
+        matches = index.query(peak, tolerance=50)
+        found = {(match.deletion, match.adduct, match.terminus, match.charge) for match in matches}
+
+        assert {(row.deletion, row.adduct, row.terminus, row.charge) for row in rows
+                if abs(peak - row.m_over_z) <= window - step} <= found
+        assert found <= {(row.deletion, row.adduct, row.terminus, row.charge) for row in rows
+                         if abs(peak - row.m_over_z) <= window + step}
+        assert len(found) == len(matches)
+        assert [abs(match.error) for match in matches] == sorted(abs(match.error) for match in matches)
+        assert all(abs(match.error_ppm) <= 50 for match in matches)
+
+def test_annotate_matches_every_query():
+    calculator = DeletionCalculator()
+    index = calculator.index(SEQUENCE)
+    peaks = [(row.m_over_z + 0.0004, float(i)) for i, row in enumerate(calculator.mz_rows(SEQUENCE))][::7]
+    peaks.append((1.0, 5.0))
+
+    annotated = list(index.annotate(peaks, tolerance=1e-3, unit='Da'))
+
+    assert [(peak, intensity) for peak, intensity, _ in annotated] == sorted(peaks)
+    for peak, _, matches in annotated:
+        assert matches == index.query(peak, tolerance=1e-3, unit='Da')
+    assert annotated[0][2] == []
+    assert all(matches for _, _, matches in annotated[1:])
+
+
+def test_mapped_index_matches_the_index_it_was_written_from(tmp_path):
+    calculator = DeletionCalculator()
+    index = calculator.index(SEQUENCE, 2)
+    index_file = tmp_path / 'index.bin'
+    write_index(index, index_file, table_hash(), 2)
+
+    with MappedMzIndex(index_file, calculator.adducts, table_hash()) as mapped:
+        assert (mapped.input_sequence, mapped.min_length, len(mapped)) == (SEQUENCE, 2, len(index))
+        assert list(mapped.mzs) == list(index.mzs)
+        for peak in list(index.mzs)[::11]:
+            assert mapped.query(peak, 20) == index.query(peak, 20)
+
+    with pytest.raises(ValueError):
+        MappedMzIndex(index_file, calculator.adducts, '0' * 64)
+
+    index_file.write_bytes(index_file.read_bytes()[:-8])
+    with pytest.raises(ValueError):
+        MappedMzIndex(index_file, calculator.adducts, table_hash())
+
+
+def test_open_rebuilds_the_index_of_another_sequence(tmp_path, capsys):
+    index_file = tmp_path / 'index.bin'
+    open_mz_index('AyyB', index_file).close()
+    open_mz_index(SEQUENCE, index_file).close()
+
+    with open_mz_index(SEQUENCE, index_file) as mapped:
+        assert mapped.input_sequence == SEQUENCE
+        assert len(mapped) == len(DeletionCalculator().index(SEQUENCE))
+    assert capsys.readouterr().out.count('Loaded m/z index') == 1
+
+
+def test_peak_list_skips_rows_that_are_not_numbers(tmp_path):
+    peak_file = tmp_path / 'peaks.csv'
+    peak_file.write_text('mz,intensity\n'
+                         '500.25,1200\n'
+                         '600.5\t\n'
+                         '700.75,n/a\n'
+                         '\n'
+                         '800 3.5e2\n', encoding='utf-8')
+
+    assert read_peak_list(peak_file) == [(500.25, 1200.0), (600.5, 0.0), (800.0, 350.0)]
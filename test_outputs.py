@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+# This software is licensed under the MIT License.
+# See the LICENSE file for more information.
+
+'''
+Checks that every output format holds the same deletions and adducts
+
+Run with python -m pytest test_outputs.py
+'''
+
+import csv
+import sqlite3
+
+import pytest
+
+import vectorized
+
+from adducts import MzWindow
+from SequenceDeletionCalculator import DeletionCalculator, write_adducts
+
+SEQUENCE = 'AyyBL'
+
+WINDOW = MzWindow(mz_min=300, mz_max=900, charges=(1, -1))
+
+
+def expected_rows(calculator: DeletionCalculator, window: MzWindow | None) -> list[tuple]:
+    '''
+    (deletion, mass, charge, terminus, adduct, m/z) of every row to write
+    '''
+    return [(row.deletion, row.mass, row.charge, row.terminus, row.adduct, row.m_over_z)
+            for row in calculator.mz_rows(SEQUENCE, window=window)]
+
+
+def write(tmp_path, calculator: DeletionCalculator, output_format: str, window: MzWindow | None):
+    outfile = tmp_path / f'{SEQUENCE}.{output_format}'
+    write_adducts(SEQUENCE,
+                  list(calculator.deletions(SEQUENCE, window=window)),
+                  calculator.decimal_points,
+                  outfile=outfile,
+                  calculator=calculator,
+                  output_format=output_format,
+                  window=window)
+    return outfile
+
+
+@pytest.mark.parametrize('window', [None, WINDOW])
+@pytest.mark.parametrize('output_format', ['tsv', 'csv'])
+def test_delimited_tables(tmp_path, output_format, window):
+    calculator = DeletionCalculator()
+    outfile = write(tmp_path, calculator, output_format, window)
+
+    with open(outfile, 'r', encoding='utf-8', newline='') as f:
+        rows = list(csv.DictReader(f, delimiter='\t' if output_format == 'tsv' else ','))
+
+    assert [(row['deletion'], float(row['mass']), int(row['charge']),
+             row['terminus'], row['adduct'], float(row['mz']))
+            for row in rows] == expected_rows(calculator, window)
+    assert all(bool(row['missing']) == (len(row['deletion']) < len(SEQUENCE)) for row in rows)
+
+
+@pytest.mark.parametrize('window', [None, WINDOW])
+def test_sqlite(tmp_path, window):
+    calculator = DeletionCalculator()
+    outfile = write(tmp_path, calculator, 'sqlite', window)
+
+    connection = sqlite3.connect(outfile)
+    try:
+        rows = connection.execute('SELECT d.deletion, d.mass, a.charge, a.terminus, a.name, m.mz '
+                                  'FROM mz m JOIN deletions d ON d.id = m.deletion_id '
+                                  'JOIN adducts a ON a.id = m.adduct_id '
+                                  'ORDER BY m.deletion_id, m.adduct_id').fetchall()
+    finally:
+        connection.close()
+
+    assert rows == expected_rows(calculator, window)
+
+
+@pytest.mark.skipif(not vectorized.HAS_NUMPY, reason='NumPy is not installed')
+@pytest.mark.parametrize('window', [None, WINDOW])
+def test_npz(tmp_path, window):
+    np = vectorized.np
+    calculator = DeletionCalculator()
+    outfile = write(tmp_path, calculator, 'npz', window)
+
+    with np.load(outfile) as archive:
+        rows = [(str(deletion), float(mass), int(charge), str(terminus), str(name), float(m_over_z))
+                for deletion, mass, mzs in zip(archive['deletion'], archive['mass'], archive['mz'])
+                for charge, terminus, name, m_over_z in zip(archive['adduct_charge'],
+                                                            archive['adduct_terminus'],
+                                                            archive['adduct_name'],
+                                                            mzs)
+                if not np.isnan(m_over_z)]
+
+    assert rows == expected_rows(calculator, window)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+# This software is licensed under the MIT License.
+# See the LICENSE file for more information.
+
+'''
+Randomized property checks of the deletion enumerators against brute force
+and the original combination and permutation filtering pipeline.
+
+Run with python -m pytest test_properties.py
+'''
+
+import random
+import itertools
+
+from adducts import MzWindow
+from subsequences import SubsequenceAutomaton
+from SequenceDeletionCalculator import (DeletionCalculator,
+                                        apply_window,
+                                        canonical_composition,
+                                        composition_shards,
+                                        count_added_compositions,
+                                        count_compositions,
+                                        filter_identical_sequences,
+                                        generate_added_compositions,
+                                        generate_compositions,
+                                        generate_deletion_possibilities,
+                                        generate_shard)
+
+# Number of random sequences checked by each test
+TRIALS = 200
+
+# Alphabets of increasing size, so that sequences range from
+# many repeated monomers to mostly distinct ones
+ALPHABETS = ['Ay', 'AyB', 'AyBLv', 'AaBbVvLlYy']
+
+
+def random_sequence(rng: random.Random, max_length: int) -> str:
+    '''
+    Returns a random sequence of up to max_length monomers
+    '''
+    alphabet = rng.choice(ALPHABETS)
+    return ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, max_length)))
+
+
+def subsequences(sequence: str, min_length: int = 0) -> set[str]:
+    '''
+    Every distinct ordered deletion of at least min_length monomers, by brute force
+    '''
+    return {''.join(combination)
+            for size in range(min_length, len(sequence) + 1)
+            for combination in itertools.combinations(sequence, size)}
+
+
+def test_compositions_match_legacy_pipeline():
+    rng = random.Random(1)
+    for _ in range(TRIALS):
+        sequence = random_sequence(rng, 9)
+        min_length = rng.randint(0, len(sequence) + 1)
+
+        deletions = list(generate_compositions(sequence, min_length))
+        legacy = {canonical_composition(deletion)
+                  for deletion in filter_identical_sequences(generate_deletion_possibilities(sequence))
+                  if len(deletion) >= min_length}
+
+        assert len(deletions) == len(set(deletions)) == count_compositions(sequence, min_length)
+        assert set(deletions) == legacy
+        assert all(deletion == canonical_composition(deletion) for deletion in deletions)
+        assert [len(deletion) for deletion in deletions] == sorted(len(deletion) for deletion in deletions)
+
+
+def test_shards_concatenate_to_compositions():
+    rng = random.Random(2)
+    calculator = DeletionCalculator()
+    for _ in range(TRIALS):
+        sequence = random_sequence(rng, 14)
+        min_length = rng.randint(0, len(sequence))
+        max_shard_size = rng.randint(1, 64)
+
+        mass_range = None
+        if rng.random() < 0.5:
+            low = rng.uniform(0, calculator.mass(sequence))
+            mass_range = (low, low + rng.uniform(0, 2000))
+
+        shards = composition_shards(sequence, min_length, max_shard_size)
+        sharded = [deletion for shard in shards for deletion in generate_shard(sequence, shard, mass_range)]
+
+        assert sharded == list(generate_compositions(sequence, min_length, mass_range))
+        assert len(shards) == len(set(shards))
+
+
+def test_automaton_matches_brute_force():
+    rng = random.Random(3)
+    calculator = DeletionCalculator()
+    for _ in range(TRIALS):
+        sequence = random_sequence(rng, 9)
+        min_length = rng.randint(0, len(sequence) + 1)
+        automaton = SubsequenceAutomaton(sequence)
+        ordered_deletions = subsequences(sequence, min_length)
+
+        assert automaton.count(min_length) == len(ordered_deletions)
+
+        generated = []
+        for composition in generate_compositions(sequence, min_length):
+            orders = list(automaton.ordered(composition))
+            assert all(canonical_composition(ordered) == composition for ordered in orders)
+            generated.extend(orders)
+
+            for ordered, sums in automaton.ordered_masses(composition, calculator.micro_monomers):
+                assert sums == [calculator.micro_mass(ordered[:i]) for i in range(1, len(ordered) + 1)]
+
+        assert len(generated) == len(set(generated))
+        assert set(generated) == ordered_deletions
+
+
+def test_added_compositions_are_the_set_difference():
+    rng = random.Random(4)
+    for _ in range(TRIALS):
+        previous = random_sequence(rng, 10)
+
+        # Insert, delete and substitute a few monomers of the previous sequence
+        sequence = list(previous)
+        for _ in range(rng.randint(0, 3)):
+            position = rng.randint(0, len(sequence))
+            edit = rng.choice(['insert', 'delete', 'substitute'])
+            if edit == 'insert' or not sequence:
+                sequence.insert(position, rng.choice('AyBLv'))
+            elif edit == 'delete':
+                del sequence[min(position, len(sequence) - 1)]
+            else:
+                sequence[min(position, len(sequence) - 1)] = rng.choice('AyBLv')
+        sequence = ''.join(sequence)
+
+        min_length = rng.randint(0, len(sequence))
+        previous_min_length = rng.randint(0, len(previous))
+
+        deletions = list(generate_compositions(sequence, min_length))
+        previous_deletions = set(generate_compositions(previous, previous_min_length))
+        added = list(generate_added_compositions(sequence, previous, min_length, previous_min_length))
+
+        assert added == [deletion for deletion in deletions if deletion not in previous_deletions]
+        assert len(added) == count_added_compositions(sequence, previous, min_length, previous_min_length)
+
+
+def test_window_pruning_keeps_every_deletion_in_the_window():
+    rng = random.Random(5)
+    for _ in range(TRIALS):
+        sequence = random_sequence(rng, 8)
+        calculator = DeletionCalculator(decimal_points=rng.choice([0, 1, 3, 6]), cache_size=0)
+        deletion_masses = list(calculator.masses(generate_compositions(sequence)))
+
+        # Window edges on rounded m/z values, where pruning is the tightest
+        m_over_z = rng.choice([mz for _, _, adduct_mzs in deletion_masses for mz in adduct_mzs])
+        charges = sorted(set(calculator.adduct_table.charges))
+        window = MzWindow(mz_min=m_over_z - rng.choice([0, rng.uniform(0, 500)]),
+                          mz_max=m_over_z + rng.choice([0, rng.uniform(0, 500)]),
+                          charges=None if rng.random() < 0.5 else tuple(rng.sample(charges, 2)))
+
+        expected = list(apply_window(deletion_masses, window, calculator.adduct_table))
+
+        assert {deletion for deletion, _, _ in expected} <= set(calculator.deletions(sequence, window=window))
+        assert list(calculator.deletion_masses(sequence, window=window)) == expected
@@ -8,51 +8,151 @@
 Contains miscellaneous utilities
 '''
 
+import sys
+
+from time import monotonic
+from typing import TextIO
+from collections import OrderedDict
+
+
 class SequenceError(Exception):
     '''Generic sequence error'''
 
 
-def print_progress_bar(iteration: int,
-                       total: int,
-                       decimals=1,
-                       bar_len=25,
-                       fill='🚀',
-                       print_ending: str = '\r'):
+class LibraryError(Exception):
+    '''Invalid monomer or adduct library'''
+
+
+class ProgressReporter:
     '''
-    Prints a progress bar of a loop if called within that loop.
+    Progress bar for hot loops.
+
+    Redraws are rate limited by time rather than by iteration, so updating
+    the reporter once per item costs little more than incrementing a counter.
+    The bar is written to stderr and is turned off when stderr is not a
+    terminal, for example when the output of a batch job is redirected to a
+    log file. The counters are kept either way so they can be reported by
+    the profiler.
 
     Parameters
     ----------
-    iteration : int
-        Current interation value
-
     total : int
-        Total number of iterations
+        Total number of items, or 0 when unknown in which
+        case only the number of items is shown
 
-    decimals : int
-        Number of decimal points to display
+    stream : TextIO | None
+        Stream to draw on. Defaults to sys.stderr
+
+    interval : float
+        Minimum number of seconds between two redraws
+
+    enabled : bool | None
+        Draw the bar. Defaults to whether the stream is a terminal
 
     bar_len : int
         Length of the progress bar in the terminal
 
-    fill_char : str
+    fill : str
         Character used to fill the progress bar
+    '''
+
+    def __init__(self,
+                 total: int,
+                 stream: TextIO | None = None,
+                 interval: float = 0.1,
+                 enabled: bool | None = None,
+                 bar_len: int = 25,
+                 fill: str = '🚀'):
+        self.total = total
+        self.stream = sys.stderr if stream is None else stream
+        self.interval = interval
+        self.enabled = _is_terminal(self.stream) if enabled is None else enabled
+        self.bar_len = bar_len
+        self.fill = fill
+
+        self.count = 0
+        self.redraws = 0
+        self.started = monotonic()
+        self._next_draw = self.started
+
+    def update(self, n: int = 1) -> None:
+        '''
+        Adds n finished items and redraws the bar if it is due
+        '''
+        self.count += n
+        if self.enabled:
+            now = monotonic()
+            if now >= self._next_draw:
+                self._draw(now)
+
+    def close(self) -> None:
+        '''
+        Draws the final state of the bar and ends its line
+        '''
+        if self.enabled:
+            self._draw(monotonic())
+            self.stream.write('\n')
+            self.stream.flush()
 
-    print_ending : str
-        Character to terminate the progress bar
+    def counters(self) -> dict:
+        '''
+        Returns
+        -------
+        dict
+            Items done, total items, redraws and elapsed seconds
+        '''
+        return {'items': self.count,
+                'total': self.total,
+                'redraws': self.redraws,
+                'elapsed_seconds': monotonic() - self.started}
 
-    Returns
-    -------
-    None
+    def _draw(self, now: float) -> None:
+        if self.total:
+            percent = 100 * self.count / self.total
+            filled_len = min(self.bar_len, self.bar_len * self.count // self.total)
+            prog_bar = self.fill * filled_len + '-' * (self.bar_len - filled_len)
+            self.stream.write(f'\r|{prog_bar}| {percent:.1f}%')
+        else:
+            self.stream.write(f'\r{self.count} done')
+
+        self.stream.flush()
+        self.redraws += 1
+        self._next_draw = now + self.interval
+
+
+def _is_terminal(stream: TextIO) -> bool:
+    '''
+    True if stream is attached to a terminal
+    '''
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        return False
+
+
+class LRUCache(OrderedDict):
     '''
-    if total == 0:
-        pass
-    else:
-        percent = ("{0:." + str(decimals) + "f}").format(100 * (iteration / float(total)))
-        filled_len = int(bar_len * iteration // total)
-        prog_bar = fill * filled_len + '-' * (bar_len - filled_len)
-        print(f'\r\r|{prog_bar}| {percent}%', end=print_ending)
-
-        # Print New Line on Complete
-        if iteration == total:
-            print("\n")
+    Dictionary holding at most maxsize entries. Reading or writing an
+    entry marks it as the most recently used, and the least recently
+    used entry is dropped when a new entry does not fit.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of entries
+    '''
+
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+
+# This software is licensed under the MIT License.
+# See the LICENSE file for more information.
+
+'''
+Optional NumPy backend for computing deletion masses and adduct m/z values
+'''
+
+from itertools import islice
+from typing import Iterable, Iterator
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from adducts import ADDUCTS
+from fixedpoint import rounding, to_micro
+from library import DEFAULT_LIBRARY, Library
+
+HAS_NUMPY = np is not None
+
+
+def monomer_mass_vector(library: Library = DEFAULT_LIBRARY):
+    '''
+    Parameters
+    ----------
+    library : Library
+        Monomers and their masses
+
+    Returns
+    -------
+    np.ndarray
+        Monomer masses in micro-daltons in monomer index order
+    '''
+    return np.array(library.micro_masses, dtype=np.int64)
+
+
+def adduct_arrays(adducts=ADDUCTS):
+    '''
+    Parameters
+    ----------
+    adducts : list[Adduct]
+        Adducts to convert
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        Adduct masses in micro-daltons and their integer charges
+    '''
+    masses = np.array([to_micro(adduct.mass) for adduct in adducts], dtype=np.int64)
+    charges = np.array([int(adduct.charge) for adduct in adducts], dtype=np.int64)
+    return masses, charges
+
+
+def composition_matrix(deletions: list[str], library: Library = DEFAULT_LIBRARY):
+    '''
+    Counts the monomers of every deletion at once.
+
+    Parameters
+    ----------
+    deletions : list[str]
+        Deletions in their 1-letter code format
+
+    library : Library
+        Monomers in column order
+
+    Returns
+    -------
+    np.ndarray
+        (N x monomers) matrix of monomer counts
+    '''
+    columns = len(library.codes)
+
+    lengths = np.fromiter((len(d) for d in deletions), dtype=np.int64, count=len(deletions))
+    indexes = np.frombuffer(library.encode(''.join(deletions)), dtype=np.uint8)
+    rows = np.repeat(np.arange(len(deletions)), lengths)
+
+    counts = np.bincount(rows * columns + indexes, minlength=len(deletions) * columns)
+    return counts.reshape(len(deletions), columns)
+
+
+def rounded_mz_table(base_masses, decimal_points: int, adducts=ADDUCTS):
+    '''
+    Broadcasts deletion masses against every adduct and rounds the m/z
+    values half away from zero with the integer arithmetic of
+    fixedpoint.from_micro, so the result matches the pure-Python backend.
+
+    Parameters
+    ----------
+    base_masses : np.ndarray
+        Masses of N deletions in micro-daltons
+
+    decimal_points : int
+        The number of decimal points to which the m/z values will be rounded.
+
+    adducts : list[Adduct]
+        Adducts to apply
+
+    Returns
+    -------
+    np.ndarray
+        (N x adducts) table of rounded m/z values
+    '''
+    masses, charges = adduct_arrays(adducts)
+    factors, denominators, powers = np.array([rounding(decimal_points, charge) for charge in charges.tolist()],
+                                             dtype=np.int64).reshape(-1, 3).T
+
+    rounded = (np.abs(base_masses[:, None] + masses[None, :]) * factors + denominators // 2) // denominators
+    return rounded / powers
+
+
+def compute_masses(deletions: Iterable[str],
+                   decimal_points: int,
+                   batch_size: int = 4096,
+                   library: Library = DEFAULT_LIBRARY) -> Iterator[tuple[str, int, list[float]]]:
+    '''
+    Vectorized equivalent of SequenceDeletionCalculator.compute_masses.
+
+    Deletions are consumed in batches of batch_size so memory stays bounded
+    while each batch is handled with one matrix-vector product and one
+    broadcast against the adduct table.
+
+    Parameters
+    ----------
+    deletions : Iterable[str]
+        Deletions in their 1-letter code format
+
+    decimal_points : int
+        The number of decimal points to which the m/z values will be rounded.
+
+    batch_size : int
+        Number of deletions processed per batch
+
+    library : Library
+        Monomers and the adducts to apply
+
+    Returns
+    -------
+    Iterator[tuple[str, int, list[float]]]
+        (deletion, mass in micro-daltons, m/z of each adduct) tuples
+    '''
+    mass_vector = monomer_mass_vector(library)
+    deletions = iter(deletions)
+
+    while batch := list(islice(deletions, batch_size)):
+        base_masses = composition_matrix(batch, library) @ mass_vector
+        table = rounded_mz_table(base_masses, decimal_points, library.adducts)
+
+        yield from zip(batch, base_masses.tolist(), table.tolist())